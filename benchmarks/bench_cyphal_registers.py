@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Cyphal RegisterInterface throughput against a simulated node on the python-can virtual bus.
+"""
+import os
+import asyncio
+import tempfile
+from typing import List
+
+import pycyphal.application
+# pylint: disable=import-error
+import uavcan.node
+
+from raccoonlab_tools.cyphal.utils import RegisterInterface
+from raccoonlab_tools.rl_sim_cyphal_node import SimulatedCyphalNode
+from measure import BenchmarkResult, measure_async
+
+IFACE = "virtual:bench_cyphal_registers"
+SIM_NODE_ID = 42
+TOOL_NODE_ID = 100
+BOOT_TIME_SEC = 1.0
+
+def make_tool_node(iface : str, node_id : int) -> pycyphal.application._node.Node:
+    registry = pycyphal.application.make_registry(None, {
+        "UAVCAN__CAN__IFACE": iface,
+        "UAVCAN__CAN__MTU": "8",
+        "UAVCAN__NODE__ID": str(node_id),
+    })
+    node = pycyphal.application.make_node(uavcan.node.GetInfo_1_0.Response(name="co.raccoonlab.bench"), registry)
+    node.start()
+    return node
+
+async def _bench_registers() -> List[BenchmarkResult]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sim = SimulatedCyphalNode(IFACE, SIM_NODE_ID, os.path.join(tmp_dir, "registers.db"))
+        sim_task = asyncio.create_task(sim.run())
+        node = make_tool_node(IFACE, TOOL_NODE_ID)
+        await asyncio.sleep(BOOT_TIME_SEC)
+
+        interface = RegisterInterface(node)
+        number_of_registers = len(await interface.register_list(SIM_NODE_ID))
+        assert number_of_registers > 0, "The simulated node doesn't respond"
+
+        async def register_list():
+            await interface.register_list(SIM_NODE_ID)
+
+        async def register_access():
+            assert await interface.register_acess(SIM_NODE_ID, "uavcan.node.description") is not None
+
+        results = [
+            await measure_async("cyphal.RegisterInterface.register_list (per register)", register_list,
+                                items=number_of_registers),
+            await measure_async("cyphal.RegisterInterface.register_acess", register_access, number=20),
+        ]
+
+        sim_task.cancel()
+        sim.node.close()
+        node.close()
+        return results
+
+def bench_registers() -> List[BenchmarkResult]:
+    return asyncio.run(_bench_registers())
+
+BENCHMARKS = [
+    bench_registers,
+]
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Per-message cost of the rl-monitor subscribers: Subscriber._callback.
+RateEstimator doesn't need the DSDL, it is measured by bench_rate_estimator.py.
+"""
+import asyncio
+from typing import List
+
+from pycyphal.transport import Priority, Timestamp, TransferFrom
+# pylint: disable=import-error
+import uavcan.primitive.scalar.Real32_1_0
+import reg.udral.physics.kinematics.geodetic.PointStateVarTs_0_1 as PointStateVarTs_0_1
+
+from raccoonlab_tools.cyphal.topic import Subscriber
+from bench_cyphal_registers import make_tool_node
+from measure import BenchmarkResult, measure_async
+
+IFACE = "virtual:bench_cyphal_topic"
+
+async def _bench_subscriber_callback() -> List[BenchmarkResult]:
+    node = make_tool_node(IFACE, 100)
+    transfer_from = TransferFrom(timestamp=Timestamp.now(), priority=Priority.NOMINAL, transfer_id=0,
+                                 fragmented_payload=[], source_node_id=42)
+    results = []
+    for data_type, msg in [
+        (uavcan.primitive.scalar.Real32_1_0, uavcan.primitive.scalar.Real32_1_0(1.0)),
+        (PointStateVarTs_0_1, PointStateVarTs_0_1()),
+    ]:
+        subscriber = Subscriber(node, 42, 2000, "uavcan.pub.bench.id", data_type)
+
+        async def callback():
+            await subscriber._callback(msg, transfer_from)  # pylint: disable=protected-access
+
+        name = f"cyphal.Subscriber._callback ({data_type.__name__})"
+        results.append(await measure_async(name, callback, number=1000))
+
+    node.close()
+    return results
+
+def bench_subscriber_callback() -> List[BenchmarkResult]:
+    return asyncio.run(_bench_subscriber_callback())
+
+BENCHMARKS = [
+    bench_subscriber_callback,
+]
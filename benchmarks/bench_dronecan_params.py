@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+DroneCAN ParametersInterface throughput against a simulated node.
+The dronecan mcast: bus is used here, because the dronecan python-can driver treats the receive
+timeout as milliseconds, so node.spin(0.005) on the python-can virtual bus blocks for seconds.
+"""
+import threading
+from typing import List
+
+import dronecan
+
+from raccoonlab_tools.dronecan.utils import Parameter, ParametersInterface
+from raccoonlab_tools.rl_sim_dronecan_node import SimulatedDronecanNode
+from measure import BenchmarkResult, measure
+
+CHANNEL = "mcast:1"
+SIM_NODE_ID = 42
+TOOL_NODE_ID = 100
+
+class SimulatedNodeThread:
+    def __init__(self) -> None:
+        self.sim = SimulatedDronecanNode(SimulatedDronecanNode.make_node(CHANNEL, SIM_NODE_ID))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.sim.node.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sim.spin(0.01)
+
+def bench_parameters() -> List[BenchmarkResult]:
+    with SimulatedNodeThread():
+        node = dronecan.make_node(CHANNEL, node_id=TOOL_NODE_ID)
+        params = ParametersInterface(node, SIM_NODE_ID)
+        number_of_params = len(params.get_all())
+        assert number_of_params > 0, "The simulated node doesn't respond"
+
+        def set_parameter():
+            assert params.set(Parameter("pwm.frequency", 100)) is not None
+
+        results = [
+            measure("dronecan.ParametersInterface.get_all (per param)", params.get_all, items=number_of_params),
+            measure("dronecan.ParametersInterface.set", set_parameter, number=20),
+        ]
+        node.close()
+        return results
+
+BENCHMARKS = [
+    bench_parameters,
+]
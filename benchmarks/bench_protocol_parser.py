@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Protocol detection latency: CanProtocolParser.find_protocol against a node that publishes
+DroneCAN NodeStatus every millisecond on the python-can virtual bus.
+"""
+import threading
+from typing import List
+
+import can
+import dronecan
+from dronecan import transport
+
+from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from measure import BenchmarkResult, measure
+
+CHANNEL = "bench_protocol_parser"
+PUBLISH_PERIOD_SEC = 0.001
+
+class NodeStatusPublisher:
+    def __init__(self, node_id : int = 42) -> None:
+        node_status = dronecan.uavcan.protocol.NodeStatus(uptime_sec=1)
+        frame = transport.Transfer(payload=node_status, source_node_id=node_id).to_frames()[0]
+        self._msg = can.Message(arbitration_id=frame.message_id, data=frame.bytes, is_extended_id=True)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with can.Bus(interface="virtual", channel=CHANNEL) as bus:
+            while not self._stop.wait(PUBLISH_PERIOD_SEC):
+                bus.send(self._msg)
+
+def bench_find_protocol() -> List[BenchmarkResult]:
+    def find_protocol():
+        CanProtocolParser._detected_protocols.clear()  # pylint: disable=protected-access
+        assert CanProtocolParser.find_protocol(f"virtual:{CHANNEL}") == Protocol.DRONECAN
+
+    def find_cached_protocol():
+        assert CanProtocolParser.find_protocol(f"virtual:{CHANNEL}") == Protocol.DRONECAN
+
+    with NodeStatusPublisher():
+        return [
+            measure("protocol_parser.find_protocol", find_protocol, repeat=20),
+            measure("protocol_parser.find_protocol.cached", find_cached_protocol, number=1000),
+        ]
+
+BENCHMARKS = [
+    bench_find_protocol,
+]
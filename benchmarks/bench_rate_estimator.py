@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Per-message cost of RateEstimator. It is fed with synthetic timestamps of a steady topic,
+so it needs neither a bus nor the DSDL and the window always has the same number of messages.
+"""
+import itertools
+from typing import List
+
+from raccoonlab_tools.common.rate_estimator import RateEstimator
+from measure import BenchmarkResult, measure
+
+TOPIC_RATE_HZ = 1000
+WINDOW_SEC = 2.0
+
+def bench_rate_estimator() -> List[BenchmarkResult]:
+    """A 1 kHz topic keeps 2000 timestamps within the 2 seconds window."""
+    estimator = RateEstimator(window_size_sec=WINDOW_SEC)
+    counter = itertools.count()
+    def register_message():
+        estimator.register_message(next(counter) / TOPIC_RATE_HZ)
+
+    number_of_messages = int(TOPIC_RATE_HZ * WINDOW_SEC)
+    for _ in range(number_of_messages):
+        register_message()
+    now = (number_of_messages - 1) / TOPIC_RATE_HZ     # the time of the last message
+    rate = estimator.get_rate(now)
+    assert rate == TOPIC_RATE_HZ, f"RateEstimator: {rate} Hz instead of {TOPIC_RATE_HZ} Hz"
+
+    return [
+        measure("RateEstimator.register_message", register_message, number=1000),
+        measure("RateEstimator.get_rate", lambda: estimator.get_rate(now), number=1000),
+    ]
+
+BENCHMARKS = [
+    bench_rate_estimator,
+]
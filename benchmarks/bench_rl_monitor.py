@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+rl-monitor frame render time. The output is redirected to /dev/null, so the terminal is not measured.
+"""
+import os
+import asyncio
+import contextlib
+from typing import List
+
+from raccoonlab_tools.common.node import NodeInfo
+from raccoonlab_tools.scripts.rl_monitor.script import RLConfigurator, GpsMagBaroMonitor, UavLightsMonitor
+from bench_cyphal_registers import make_tool_node
+from measure import BenchmarkResult, measure_async
+
+IFACE = "virtual:bench_rl_monitor"
+
+async def _bench_render() -> List[BenchmarkResult]:
+    node = make_tool_node(IFACE, 100)
+    configurator = RLConfigurator()
+    results = []
+    for monitor_type, name in [
+        (GpsMagBaroMonitor, "co.raccoonlab.gps_mag_baro"),
+        (UavLightsMonitor, "co.raccoonlab.lights"),
+    ]:
+        info = NodeInfo(node_id=42, name=name)
+        monitor = monitor_type(node, 42)
+
+        async def render():
+            await configurator.render(info, monitor)
+
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            result = await measure_async(f"rl_monitor.render ({monitor_type.__name__})", render, number=100)
+        results.append(result)
+
+    node.close()
+    return results
+
+def bench_render() -> List[BenchmarkResult]:
+    return asyncio.run(_bench_render())
+
+BENCHMARKS = [
+    bench_render,
+]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Measurement helpers shared by the bench_*.py modules.
+"""
+import time
+import statistics
+from typing import Awaitable, Callable, Dict, List
+from dataclasses import dataclass, field
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark that can't be run in the current environment."""
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    samples are seconds per single item: one call, one parameter, one message, etc.
+    """
+    name : str
+    samples : List[float]
+    items_per_sample : int = 1
+    extra : Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    def to_dict(self) -> dict:
+        return {
+            "median_sec": self.median,
+            "mean_sec": statistics.mean(self.samples),
+            "stdev_sec": statistics.stdev(self.samples) if len(self.samples) > 1 else 0.0,
+            "min_sec": min(self.samples),
+            "max_sec": max(self.samples),
+            "per_second": 1.0 / self.median if self.median > 0 else None,
+            "samples": len(self.samples),
+            "items_per_sample": self.items_per_sample,
+            **self.extra,
+        }
+
+    def __str__(self) -> str:
+        return f"{self.name:<50} {format_time(self.median):>10}  ({1.0 / self.median:,.0f}/s)"
+
+
+def measure(name : str, func : Callable, number : int = 1, repeat : int = 5, items : int = 1) -> BenchmarkResult:
+    """Call func number times per sample, repeat samples, return the time per item."""
+    func()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / (number * items))
+    return BenchmarkResult(name, samples, number * items)
+
+async def measure_async(name : str, func : Callable[[], Awaitable], number : int = 1, repeat : int = 5,
+                        items : int = 1) -> BenchmarkResult:
+    """Asynchronous version of measure()."""
+    await func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        samples.append((time.perf_counter() - start) / (number * items))
+    return BenchmarkResult(name, samples, number * items)
+
+def format_time(seconds : float) -> str:
+    if seconds >= 1.0:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.3f} us"
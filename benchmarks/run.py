@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Lightweight benchmark runner for the tooling's hot paths.
+
+Every bench_*.py module in this directory provides BENCHMARKS: a list of functions that return
+a list of measure.BenchmarkResult or raise measure.BenchmarkSkipped. The benchmarks run against
+simulated nodes on a virtual bus (python-can virtual, dronecan mcast:), so they measure the tooling,
+not a board. Modules that can't be imported (e.g. the Cyphal DSDL is not compiled) are skipped.
+
+The results are stored as JSON, so a run can be compared with the one of a previous release:
+python benchmarks/run.py --output benchmarks/results/1.0.0.json
+python benchmarks/run.py --compare benchmarks/results/1.0.0.json
+"""
+import os
+import sys
+import glob
+import json
+import logging
+import platform
+import argparse
+import datetime
+import warnings
+import importlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from measure import BenchmarkSkipped, format_time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_benchmarks(name_filter : Optional[str] = None) -> Tuple[List[Callable], Dict[str, str]]:
+    """
+    Return the benchmarks and the modules that can't be imported, for example because the Cyphal
+    DSDL is not compiled in this environment.
+    """
+    sys.path.insert(0, BENCHMARKS_DIR)
+    benchmarks = []
+    skipped = {}
+    for path in sorted(glob.glob(os.path.join(BENCHMARKS_DIR, "bench_*.py"))):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as err:
+            skipped[module_name] = str(err)
+            continue
+        for benchmark in module.BENCHMARKS:
+            if name_filter is None or name_filter in f"{module_name}.{benchmark.__name__}":
+                benchmarks.append(benchmark)
+    return benchmarks, skipped
+
+def run_benchmarks(benchmarks : List[Callable], skipped : Dict[str, str]) -> dict:
+    report = {
+        "raccoonlab_tools": _get_package_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": {},
+        "skipped": dict(skipped),
+    }
+    for name, reason in skipped.items():
+        print(f"[WARN] {name} is skipped: {reason}")
+
+    for benchmark in benchmarks:
+        name = f"{benchmark.__module__}.{benchmark.__name__}"
+        try:
+            results = benchmark()
+        except BenchmarkSkipped as err:
+            print(f"[WARN] {name} is skipped: {err}")
+            report["skipped"][name] = str(err)
+            continue
+
+        for result in results:
+            print(result)
+            report["results"][result.name] = result.to_dict()
+
+    return report
+
+def compare(report : dict, baseline : dict, threshold : float) -> int:
+    """Print the difference with a baseline report. Return the number of regressions."""
+    print(f"\nComparison with raccoonlab_tools {baseline.get('raccoonlab_tools')} ({baseline.get('timestamp')}):")
+    number_of_regressions = 0
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["median_sec"]
+        new = result["median_sec"]
+        change = new / old - 1.0
+        status = ""
+        if change > threshold:
+            status = "REGRESSION"
+            number_of_regressions += 1
+        elif change < -threshold:
+            status = "improvement"
+        print(f"{name:<50} {format_time(old):>10} -> {format_time(new):>10} {change:+7.1%} {status}")
+    return number_of_regressions
+
+def _get_package_version() -> str:
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        try:
+            return version("raccoonlab_tools")
+        except PackageNotFoundError:
+            return "unknown"
+    except ImportError:
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tooling against simulated nodes")
+    parser.add_argument("--filter", default=None, type=str, help="Run only benchmarks containing the substring")
+    parser.add_argument("--output", default=None, type=str, help="Store the results to the JSON file")
+    parser.add_argument("--compare", default=None, type=str, help="Compare the results with a previous JSON file")
+    parser.add_argument("--threshold", default=0.2, type=float,
+                        help="Relative slowdown considered as a regression, default is 0.2 (20%%)")
+    args = parser.parse_args()
+
+    logging.getLogger("pycyphal").setLevel(logging.FATAL)
+    logging.getLogger("dronecan").setLevel(logging.FATAL)
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    report = run_benchmarks(*load_benchmarks(args.filter))
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as stream:
+            json.dump(report, stream, indent=4)
+        print(f"[INFO] The results have been saved to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as stream:
+            baseline = json.load(stream)
+        if compare(report, baseline, args.threshold) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,22 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-
+"""
+A minimal Cyphal application that prints a few Heartbeats. With --output all CAN frames of the
+transport are also recorded into a binary capture file (*.rlcap), see rl-capture.
+"""
 import asyncio
+import argparse
 import pycyphal
 import pycyphal.application
+from pycyphal.transport.can import CANCapture
+from pycyphal.transport.can.media import FrameFormat
 import uavcan.node
 import uavcan.node.Heartbeat_1_0
+from raccoonlab_tools.common.binary_capture import CaptureWriter
+from raccoonlab_tools.common.capture import CapturedFrame
 
-async def main():
+async def main(output):
     node_info = uavcan.node.GetInfo_1_0.Response(
         uavcan.node.Version_1_0(major=1, minor=0),
         name="co.raccoonlab.example"
@@ -18,9 +26,27 @@ async def main():
     node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
     node.start()
 
+    writer = None if output is None else CaptureWriter(output, canfd=True)
+    if writer is not None:
+        def record_frame(capture):
+            capture = getattr(capture, "inferior", capture)  # RedundantCapture
+            if isinstance(capture, CANCapture) and not capture.own:
+                writer.write(CapturedFrame(float(capture.timestamp.system),
+                                           capture.frame.identifier,
+                                           bytes(capture.frame.data),
+                                           capture.frame.format == FrameFormat.EXTENDED,
+                                           len(capture.frame.data) > 8))
+        node.presentation.transport.begin_capture(record_frame)
+
     heartbeat_sub = node.make_subscriber(uavcan.node.Heartbeat_1_0)
     for _ in range(10):
         transfer_from = await heartbeat_sub.receive_for(1.1)
         print(transfer_from[0] if transfer_from is not None else None)
 
-asyncio.run(main())
+    node.close()
+    if writer is not None:
+        writer.close()
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-o", "--output", default=None, help="Record the frames into this *.rlcap file")
+asyncio.run(main(parser.parse_args().output))
@@ -2,12 +2,32 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-
+"""
+Subscribe on NodeStatus and print a few messages. With --output all received CAN frames are
+also recorded into a binary capture file (*.rlcap), see rl-capture.
+"""
+import argparse
 import dronecan
+from raccoonlab_tools.common.binary_capture import CaptureWriter
+from raccoonlab_tools.common.capture import CapturedFrame
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-o", "--output", default=None, help="Record the frames into this *.rlcap file")
+args = parser.parse_args()
+
 node = dronecan.make_node('slcan:/dev/ttyACM0', bitrate=1000000, baudrate=1000000)
 
 def handle_node_status(data):
     print(data.message)
 
 node.add_handler(dronecan.uavcan.protocol.NodeStatus, handle_node_status)
-node.spin(1.5)
+
+if args.output is None:
+    node.spin(1.5)
+else:
+    with CaptureWriter(args.output) as writer:
+        def record_frame(direction, frame):
+            if direction == node.can_driver.FRAME_DIRECTION_INCOMING:
+                writer.write(CapturedFrame(frame.ts_real, frame.id, bytes(frame.data), frame.extended, frame.canfd))
+        node.can_driver.add_io_hook(record_frame)
+        node.spin(1.5)
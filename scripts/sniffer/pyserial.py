@@ -2,8 +2,19 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-
+"""
+Open a serial port and print the raw SLCAN frames. With --output the extended frames are also
+recorded into a binary capture file (*.rlcap), see rl-capture.
+"""
+import time
+import argparse
 import serial
+from raccoonlab_tools.common.binary_capture import CaptureWriter
+from raccoonlab_tools.common.capture import CapturedFrame
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-o", "--output", default=None, help="Record the frames into this *.rlcap file")
+args = parser.parse_args()
 
 CMD_EMPTY = b'\r'
 CMD_CLOSE_CHANNEL = b'C\r'
@@ -11,6 +22,12 @@ CMD_SET_SPEED = b'S8\r'
 CMD_OPEN_CHANNEL = b'O\r'
 CMD_CLEAR_ERROR_FLAGS = b'F\r'
 
+def parse_extended_frame(slcan_frame : str, timestamp : float) -> CapturedFrame:
+    """Tiiiiiiiildd..., where i is the 29-bit CAN ID, l is the data length and d are the data bytes"""
+    length = int(slcan_frame[9], 16)
+    return CapturedFrame(timestamp, int(slcan_frame[1:9], 16), bytes.fromhex(slcan_frame[10:10 + 2 * length]))
+
+writer = None if args.output is None else CaptureWriter(args.output)
 with serial.Serial("/dev/ttyACM0", 1000000, timeout=1) as ser:
     commands = [CMD_EMPTY,
                 CMD_CLOSE_CHANNEL,
@@ -29,6 +46,11 @@ with serial.Serial("/dev/ttyACM0", 1000000, timeout=1) as ser:
         if byte == b'\r':
             if can_frame[0] == 'T':
                 print(f"recv CAN-frame: {can_frame}")
+                if writer is not None:
+                    writer.write(parse_extended_frame(can_frame, time.time()))
             can_frame = ''
 
     ser.write(CMD_CLOSE_CHANNEL)
+
+if writer is not None:
+    writer.close()
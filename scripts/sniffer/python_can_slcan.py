@@ -2,9 +2,27 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-
+"""
+Print CAN frames using python-can. With --output the frames are also recorded into
+a binary capture file (*.rlcap), see rl-capture.
+"""
+import argparse
 import can
+from raccoonlab_tools.common.binary_capture import CaptureWriter
+from raccoonlab_tools.common.capture import CapturedFrame
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-o", "--output", default=None, help="Record the frames into this *.rlcap file")
+parser.add_argument("-n", "--number", default=10, type=int, help="Number of frames")
+args = parser.parse_args()
+
+writer = None if args.output is None else CaptureWriter(args.output)
 with can.Bus(interface='slcan', channel='/dev/ttyACM0', ttyBaudrate=1000000, bitrate=1000000) as bus:
-    for _ in range(10):
+    for _ in range(args.number):
         msg = bus.recv()
         print(msg)
+        if writer is not None:
+            writer.write(CapturedFrame(msg.timestamp, msg.arbitration_id, bytes(msg.data),
+                                       msg.is_extended_id, msg.is_fd))
+if writer is not None:
+    writer.close()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Compact binary CAN capture (*.rlcap) for long recordings.
+
+The file is append-only: a header followed by chunks, and each chunk is a fixed number of
+fixed-size records followed by an index block. The last chunk may be incomplete and has no index
+block yet. The reader maps the file into numpy structured arrays without loading it into RAM,
+and a time range or a CAN ID selection reads only the chunks that may contain the frames.
+
+Layout (little-endian):
+- header, 64 bytes: magic, version, data size (8 or 64), records per chunk,
+- record: timestamp_ns int64, can_id uint32, flags uint8, dlc uint8, 2 reserved bytes, data,
+- index block, 64 bytes: magic, min/max timestamp_ns, number of records,
+  a 256-bit bloom filter of the CAN IDs of the chunk.
+"""
+import os
+import struct
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from raccoonlab_tools.common.capture import CapturedFrame
+
+MAGIC = b"RLCANCAP"
+INDEX_MAGIC = b"RLCANIDX"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+HEADER_SIZE = 64
+DEFAULT_CHUNK_RECORDS = 4096
+
+FLAG_EXTENDED = 0x01
+FLAG_CANFD = 0x02
+
+DLC_TO_LENGTH = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64], dtype=np.uint8)
+
+INDEX_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("min_timestamp_ns", "<i8"),
+    ("max_timestamp_ns", "<i8"),
+    ("number_of_records", "<u4"),
+    ("reserved", "<u4"),
+    ("can_id_bloom", "<u8", (4,)),
+])
+
+def make_record_dtype(data_size : int) -> np.dtype:
+    return np.dtype([
+        ("timestamp_ns", "<i8"),
+        ("can_id", "<u4"),
+        ("flags", "u1"),
+        ("dlc", "u1"),
+        ("reserved", "<u2"),
+        ("data", "u1", (data_size,)),
+    ])
+
+def length_to_dlc(length : int) -> int:
+    if length <= 8:
+        return length
+    return int(np.searchsorted(DLC_TO_LENGTH, length))
+
+def get_lengths(records : np.ndarray) -> np.ndarray:
+    """Data lengths in bytes of a record array."""
+    return DLC_TO_LENGTH[records["dlc"] & 0x0F]
+
+def ns_to_sec(timestamp_ns : int) -> float:
+    """Without the precision loss of timestamp_ns / 1e9 on the wall time."""
+    timestamp_us, remainder_ns = divmod(int(timestamp_ns), 1000)
+    return timestamp_us / 1e6 + remainder_ns / 1e9
+
+def _hash_can_ids(can_ids : np.ndarray) -> np.ndarray:
+    """Bloom filter bit numbers 0..255 (Knuth's multiplicative hash)."""
+    return ((can_ids.astype(np.uint64) * np.uint64(2654435761)) >> np.uint64(16)) & np.uint64(0xFF)
+
+def _make_bloom(can_ids : np.ndarray) -> np.ndarray:
+    bloom = np.zeros(4, dtype=np.uint64)
+    for bit in np.unique(_hash_can_ids(can_ids)):
+        bloom[int(bit) >> 6] |= np.uint64(1) << np.uint64(int(bit) & 63)
+    return bloom
+
+
+class CaptureWriter:
+    """
+    Append frames to a new capture file. The records are buffered, flush() writes them to the file,
+    so a crashed recording keeps everything up to the last flush.
+    Classic CAN captures take 24 bytes per frame, CAN FD captures (canfd=True) take 80 bytes.
+    """
+    def __init__(self, path : str, canfd : bool = False, chunk_records : int = DEFAULT_CHUNK_RECORDS) -> None:
+        self.path = path
+        self.data_size = 64 if canfd else 8
+        self.chunk_records = chunk_records
+        self.number_of_frames = 0
+        self._buffer = np.zeros(chunk_records, dtype=make_record_dtype(self.data_size))
+        self._number_in_chunk = 0   # records of the current chunk
+        self._number_written = 0    # records of the current chunk that are in the file already
+        self._stream = open(path, "wb")  # pylint: disable=consider-using-with
+        self._stream.write(HEADER.pack(MAGIC, VERSION, self.data_size, chunk_records).ljust(HEADER_SIZE, b"\x00"))
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write(self, frame : CapturedFrame) -> None:
+        length = len(frame.data)
+        if length > self.data_size:
+            raise ValueError(f"{length}-byte frame doesn't fit into a {self.data_size}-byte record, "
+                             "a CAN FD capture is required")
+        record = self._buffer[self._number_in_chunk]
+        record["timestamp_ns"] = round(frame.timestamp * 1_000_000) * 1000
+        record["can_id"] = frame.can_id
+        record["flags"] = (FLAG_EXTENDED if frame.extended else 0) | (FLAG_CANFD if frame.canfd else 0)
+        record["dlc"] = length_to_dlc(length)
+        record["data"][:length] = np.frombuffer(frame.data, dtype=np.uint8)
+        record["data"][length:] = 0
+        self._on_records_added(1)
+
+    def write_many(self, frames : Iterable[CapturedFrame]) -> int:
+        number_of_frames = self.number_of_frames
+        for frame in frames:
+            self.write(frame)
+        return self.number_of_frames - number_of_frames
+
+    def write_records(self, records : np.ndarray) -> None:
+        """Append records read from another capture with the same data size."""
+        if records.dtype != self._buffer.dtype:
+            raise ValueError(f"The records have {records.dtype['data'].shape[0]}-byte data, "
+                             f"expected {self.data_size}")
+        offset = 0
+        while offset < len(records):
+            number = min(len(records) - offset, self.chunk_records - self._number_in_chunk)
+            self._buffer[self._number_in_chunk : self._number_in_chunk + number] = records[offset : offset + number]
+            offset += number
+            self._on_records_added(number)
+
+    def flush(self) -> None:
+        self._stream.write(self._buffer[self._number_written : self._number_in_chunk].tobytes())
+        self._number_written = self._number_in_chunk
+        self._stream.flush()
+
+    def close(self) -> None:
+        if self._stream.closed:
+            return
+        self.flush()
+        self._stream.close()
+
+    def _on_records_added(self, number : int) -> None:
+        self._number_in_chunk += number
+        self.number_of_frames += number
+        if self._number_in_chunk < self.chunk_records:
+            return
+
+        self._stream.write(self._buffer[self._number_written :].tobytes())
+        index = np.zeros(1, dtype=INDEX_DTYPE)
+        index["magic"] = INDEX_MAGIC
+        index["min_timestamp_ns"] = self._buffer["timestamp_ns"].min()
+        index["max_timestamp_ns"] = self._buffer["timestamp_ns"].max()
+        index["number_of_records"] = self.chunk_records
+        index["can_id_bloom"] = _make_bloom(self._buffer["can_id"])
+        self._stream.write(index.tobytes())
+        self._number_in_chunk = 0
+        self._number_written = 0
+
+
+class CaptureFile:
+    """
+    Memory-mapped reader. The records are returned as numpy structured arrays with the fields
+    timestamp_ns, can_id, flags, dlc and data, see get_lengths() for the data lengths.
+    """
+    def __init__(self, path : str) -> None:
+        self.path = path
+        with open(path, "rb") as stream:
+            header = stream.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+            raise ValueError(f"{path} is not a binary CAN capture")
+        _, version, self.data_size, self.chunk_records = HEADER.unpack_from(header)
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported capture version {version}")
+
+        self.record_dtype = make_record_dtype(self.data_size)
+        chunk_dtype = np.dtype([("records", self.record_dtype, (self.chunk_records,)), ("index", INDEX_DTYPE)])
+        payload_size = os.path.getsize(path) - HEADER_SIZE
+        number_of_chunks = payload_size // chunk_dtype.itemsize
+        tail_offset = HEADER_SIZE + number_of_chunks * chunk_dtype.itemsize
+        number_in_tail = (payload_size - number_of_chunks * chunk_dtype.itemsize) // self.record_dtype.itemsize
+
+        self._chunks = self._map(chunk_dtype, HEADER_SIZE, number_of_chunks)
+        self._tail = self._map(self.record_dtype, tail_offset, number_in_tail)
+        self.index = np.array(self._chunks["index"])
+        if np.any(self.index["magic"] != INDEX_MAGIC):
+            raise ValueError(f"{path}: the index is corrupted")
+
+    def __len__(self) -> int:
+        return len(self._chunks) * self.chunk_records + len(self._tail)
+
+    @property
+    def canfd(self) -> bool:
+        return self.data_size > 8
+
+    def get_time_range_ns(self):
+        """(first, last) timestamps or None if the capture is empty."""
+        timestamps = [self.index["min_timestamp_ns"], self.index["max_timestamp_ns"], self._tail["timestamp_ns"]]
+        timestamps = np.concatenate([np.asarray(array, dtype=np.int64) for array in timestamps])
+        if len(timestamps) == 0:
+            return None
+        return int(timestamps.min()), int(timestamps.max())
+
+    def get_chunks(self,
+                   start_ns : Optional[int] = None,
+                   end_ns : Optional[int] = None,
+                   can_ids : Optional[Iterable[int]] = None) -> Iterator[np.ndarray]:
+        """
+        Memory-mapped record arrays of the chunks that may contain the frames in [start_ns, end_ns)
+        with the given CAN IDs. The records are not filtered, see select().
+        """
+        candidates = np.ones(len(self._chunks), dtype=bool)
+        if start_ns is not None:
+            candidates &= self.index["max_timestamp_ns"] >= start_ns
+        if end_ns is not None:
+            candidates &= self.index["min_timestamp_ns"] < end_ns
+        if can_ids is not None:
+            bits = _hash_can_ids(np.asarray(list(can_ids), dtype=np.uint32))
+            words = self.index["can_id_bloom"][:, (bits >> np.uint64(6)).astype(np.intp)]
+            candidates &= np.any(words & (np.uint64(1) << (bits & np.uint64(63))) != 0, axis=1)
+
+        for chunk_idx in np.flatnonzero(candidates):
+            yield self._chunks["records"][chunk_idx]
+        if len(self._tail):
+            yield self._tail
+
+    def select(self,
+               start_ns : Optional[int] = None,
+               end_ns : Optional[int] = None,
+               can_ids : Optional[Iterable[int]] = None) -> np.ndarray:
+        """A copy of the records in [start_ns, end_ns) with the given CAN IDs, in the file order."""
+        can_ids = None if can_ids is None else np.asarray(list(can_ids), dtype=np.uint32)
+        parts : List[np.ndarray] = []
+        for records in self.get_chunks(start_ns, end_ns, can_ids):
+            mask = np.ones(len(records), dtype=bool)
+            if start_ns is not None:
+                mask &= records["timestamp_ns"] >= start_ns
+            if end_ns is not None:
+                mask &= records["timestamp_ns"] < end_ns
+            if can_ids is not None:
+                mask &= np.isin(records["can_id"], can_ids)
+            parts.append(records[mask])
+        if not parts:
+            return np.zeros(0, dtype=self.record_dtype)
+        return np.concatenate(parts)
+
+    def read(self) -> Iterator[CapturedFrame]:
+        for records in self.get_chunks():
+            yield from CaptureFile.to_frames(records)
+
+    @staticmethod
+    def to_frames(records : np.ndarray) -> Iterator[CapturedFrame]:
+        lengths = get_lengths(records)
+        for record, length in zip(records, lengths):
+            flags = int(record["flags"])
+            yield CapturedFrame(timestamp=ns_to_sec(record["timestamp_ns"]),
+                                can_id=int(record["can_id"]),
+                                data=record["data"][:length].tobytes(),
+                                extended=bool(flags & FLAG_EXTENDED),
+                                canfd=bool(flags & FLAG_CANFD))
+
+    def _map(self, dtype : np.dtype, offset : int, shape : int) -> np.ndarray:
+        if shape == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(shape,))
+
+
+def is_binary_capture(path : str) -> bool:
+    try:
+        with open(path, "rb") as stream:
+            return stream.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
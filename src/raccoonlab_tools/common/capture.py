@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Recorded CAN traffic.
+
+Candump log line examples:
+(1657800496.359233) slcan0 0C60647D#020000FB        - classic CAN, extended identifier
+(1657800496.359233) slcan0 123#DEADBEEF             - classic CAN, base identifier
+(1657800496.359233) can0 0C60647D##1020000FB        - CAN FD (the nibble after ## is the flags)
+
+The format is chosen by the file: *.rlcap is the binary capture (see binary_capture.py),
+*.asc is the Vector ASCII log, anything else is a candump log.
+"""
+import re
+from typing import Iterable, Iterator, Optional
+from dataclasses import dataclass
+
+import can
+
+@dataclass
+class CapturedFrame:
+    timestamp : float   # wall time, seconds
+    can_id : int
+    data : bytes
+    extended : bool = True
+    canfd : bool = False
+
+    def __str__(self) -> str:
+        return f"({self.timestamp:.6f}) {self.can_id:08X} [{len(self.data)}] {self.data.hex(' ').upper()}"
+
+
+class CandumpLog:
+    """
+    Reader and writer of the SocketCAN candump log format (`candump -l`).
+    Remote and error frames are ignored.
+    """
+    LINE_PATTERN = re.compile(r'^\((\d+\.\d+)\)\s+(\S+)\s+([0-9A-Fa-f]{3}|[0-9A-Fa-f]{8})(##?)([0-9A-Fa-f]*)\s*$')
+
+    @staticmethod
+    def read(path : str) -> Iterator[CapturedFrame]:
+        with open(path, "r", encoding="utf-8") as stream:
+            for line in stream:
+                frame = CandumpLog.parse_line(line)
+                if frame is not None:
+                    yield frame
+
+    @staticmethod
+    def parse_line(line : str) -> Optional[CapturedFrame]:
+        match = CandumpLog.LINE_PATTERN.match(line)
+        if match is None:
+            return None
+
+        timestamp, _, can_id, separator, data = match.groups()
+        canfd = separator == "##"
+        if canfd:
+            data = data[1:]  # skip the flags nibble
+        if len(data) % 2 != 0:
+            return None
+
+        return CapturedFrame(timestamp=float(timestamp),
+                             can_id=int(can_id, 16),
+                             data=bytes.fromhex(data),
+                             extended=len(can_id) == 8,
+                             canfd=canfd)
+
+    @staticmethod
+    def write(path : str, frames : Iterable[CapturedFrame], channel : str = "can0") -> int:
+        number_of_frames = 0
+        with open(path, "w", encoding="utf-8") as stream:
+            for frame in frames:
+                stream.write(CandumpLog.format_line(frame, channel) + "\n")
+                number_of_frames += 1
+        return number_of_frames
+
+    @staticmethod
+    def format_line(frame : CapturedFrame, channel : str = "can0") -> str:
+        can_id = f"{frame.can_id:08X}" if frame.extended else f"{frame.can_id:03X}"
+        separator = "##0" if frame.canfd else "#"
+        return f"({frame.timestamp:.6f}) {channel} {can_id}{separator}{frame.data.hex().upper()}"
+
+
+class AscLog:
+    """
+    Reader and writer of the Vector ASCII log format based on python-can.
+    The start time of an ASC log has a millisecond resolution only.
+    Remote and error frames are ignored. python-can doesn't read empty CAN FD frames back,
+    they never appear in DroneCAN and Cyphal traffic anyway because of the tail byte.
+    """
+    @staticmethod
+    def read(path : str) -> Iterator[CapturedFrame]:
+        for msg in can.ASCReader(path, relative_timestamp=False):
+            if msg.is_remote_frame or msg.is_error_frame:
+                continue
+            yield CapturedFrame(timestamp=msg.timestamp,
+                                can_id=msg.arbitration_id,
+                                data=bytes(msg.data),
+                                extended=msg.is_extended_id,
+                                canfd=msg.is_fd)
+
+    @staticmethod
+    def write(path : str, frames : Iterable[CapturedFrame], channel : int = 1) -> int:
+        number_of_frames = 0
+        writer = can.ASCWriter(path, channel=channel)
+        try:
+            for frame in frames:
+                writer.on_message_received(can.Message(timestamp=frame.timestamp,
+                                                       arbitration_id=frame.can_id,
+                                                       data=frame.data,
+                                                       is_extended_id=frame.extended,
+                                                       is_fd=frame.canfd))
+                number_of_frames += 1
+        finally:
+            writer.stop()
+        return number_of_frames
+
+
+def read_capture(path : str) -> Iterator[CapturedFrame]:
+    """
+    Read frames from a capture file of any supported format.
+    """
+    # numpy is required only for the binary captures
+    from raccoonlab_tools.common.binary_capture import CaptureFile, is_binary_capture
+    if is_binary_capture(path):
+        return CaptureFile(path).read()
+    if path.lower().endswith(".asc"):
+        return AscLog.read(path)
+    return CandumpLog.read(path)
+
+def write_capture(path : str, frames : Iterable[CapturedFrame], canfd : bool = False) -> int:
+    """
+    Write frames to a capture file, the format is chosen by the extension.
+    canfd is required to write CAN FD frames longer than 8 bytes to a binary capture.
+    Return the number of frames.
+    """
+    if path.lower().endswith(".rlcap"):
+        from raccoonlab_tools.common.binary_capture import CaptureWriter
+        with CaptureWriter(path, canfd=canfd) as writer:
+            return writer.write_many(frames)
+    if path.lower().endswith(".asc"):
+        return AscLog.write(path, frames)
+    return CandumpLog.write(path, frames)
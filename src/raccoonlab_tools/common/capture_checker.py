@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Run a specification test against recorded captures instead of a live node.
+
+The test module learns about the capture from the RL_SPEC_CAPTURE environment variable.
+A single capture is checked with the usual verbose pytest output. Several captures are checked
+in a process pool, one pytest session per capture, and only a summary table is printed.
+"""
+import os
+import argparse
+import contextlib
+from typing import List, Optional
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from raccoonlab_tools.common.pytest_runner import run_tests
+
+CAPTURE_ENV_VAR = "RL_SPEC_CAPTURE"
+
+def get_capture_path() -> Optional[str]:
+    """Return the capture path if the test is running offline, otherwise None."""
+    return os.environ.get(CAPTURE_ENV_VAR)
+
+def add_capture_arguments(parser : argparse.ArgumentParser) -> None:
+    parser.add_argument('--capture', nargs='+', default=None, metavar='PATH',
+                        help="Check recorded captures (*.rlcap, candump log or Vector *.asc) instead of a live node")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help="Number of captures checked in parallel")
+
+@dataclass
+class CaptureResult:
+    capture : str
+    exit_code : int = 0
+    passed : List[str] = field(default_factory=list)
+    failed : List[str] = field(default_factory=list)
+    skipped : List[str] = field(default_factory=list)
+
+
+class _ResultCollector:
+    """Pytest plugin that records the outcome of every test."""
+    def __init__(self, result : CaptureResult) -> None:
+        self._result = result
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self._result.failed.append(report.nodeid)
+        elif report.skipped:
+            self._result.skipped.append(report.nodeid)
+        elif report.when == "call":
+            self._result.passed.append(report.nodeid)
+
+
+def check_captures(test_file : str, captures : List[str], jobs : int, pytest_args : list) -> int:
+    if len(captures) == 1:
+        os.environ[CAPTURE_ENV_VAR] = captures[0]
+        return run_tests([test_file], pytest_args)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(_check_single_capture,
+                                    [test_file] * len(captures),
+                                    captures,
+                                    [pytest_args] * len(captures)))
+
+    _print_summary(results)
+    return 0 if all(result.exit_code == 0 for result in results) else 1
+
+def _check_single_capture(test_file : str, capture : str, pytest_args : list) -> CaptureResult:
+    os.environ[CAPTURE_ENV_VAR] = capture
+    result = CaptureResult(capture)
+    cmd = [test_file, "-q", "-p", "no:cacheprovider", '-W', 'ignore::DeprecationWarning'] + pytest_args
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        result.exit_code = int(pytest.main(cmd, plugins=[_ResultCollector(result)]))
+    return result
+
+def _print_summary(results : List[CaptureResult]) -> None:
+    width = max(len(result.capture) for result in results)
+    print(f"{'capture':<{width}}  passed  failed  skipped")
+    for result in results:
+        print(f"{result.capture:<{width}}  {len(result.passed):>6}  {len(result.failed):>6}  "
+              f"{len(result.skipped):>7}")
+        for nodeid in result.failed:
+            print(f"- FAILED {nodeid}")
+
+    number_of_failed = sum(1 for result in results if result.exit_code != 0)
+    print(f"{len(results) - number_of_failed}/{len(results)} captures passed.")
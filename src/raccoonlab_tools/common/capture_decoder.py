@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Offline bulk decoding of a recorded capture into columnar tables, one table per data type.
+
+A transfer is reassembled from the frames of one stream: the same source node and the same
+port (and the same destination for services), which is the CAN ID without the priority bits.
+The streams are independent, so they are distributed over a process pool. Each worker maps the
+binary capture by itself and reads only the frames of its streams, so nothing big is pickled.
+"""
+import os
+import csv
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from raccoonlab_tools.common.binary_capture import CaptureFile, FLAG_EXTENDED, get_lengths, is_binary_capture
+from raccoonlab_tools.common.capture import read_capture, write_capture
+from raccoonlab_tools.common.protocol_parser import Protocol
+
+STREAM_KEY_MASKS = {
+    Protocol.DRONECAN: 0x00FFFFFF,  # without the 5-bit priority
+    Protocol.CYPHAL: 0x03FFFFFF,    # without the 3-bit priority
+}
+
+class MessageTable:
+    """
+    Decoded transfers of a single data type: a list of values per column.
+    Nested fields are joined with dots, for example status.uptime_sec. A column is None in the rows
+    that don't have it, for example in the inactive fields of a union.
+    """
+    def __init__(self, name : str) -> None:
+        self.name = name
+        self.columns : Dict[str, List[Any]] = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, row : Dict[str, Any]) -> None:
+        for column in row:
+            if column not in self.columns:
+                self.columns[column] = [None] * self._length
+        for column, values in self.columns.items():
+            values.append(row.get(column))
+        self._length += 1
+
+    def extend(self, other : "MessageTable") -> None:
+        for column in other.columns:
+            if column not in self.columns:
+                self.columns[column] = [None] * self._length
+        for column, values in self.columns.items():
+            values.extend(other.columns.get(column, [None] * len(other)))
+        self._length += len(other)
+
+    def sort_by_timestamp(self) -> None:
+        order = np.argsort(np.asarray(self.columns["timestamp"], dtype=np.float64), kind="stable")
+        self.columns = {column : [values[idx] for idx in order] for column, values in self.columns.items()}
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        """Numeric columns become numeric arrays, the others are object arrays."""
+        arrays = {}
+        for column, values in self.columns.items():
+            if all(isinstance(value, (bool, int, float)) for value in values):
+                arrays[column] = np.asarray(values)
+            else:
+                arrays[column] = np.empty(len(values), dtype=object)
+                arrays[column][:] = values
+        return arrays
+
+    def save_csv(self, path : str) -> None:
+        with open(path, "w", encoding="utf-8", newline="") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(self.columns.keys())
+            writer.writerows(zip(*self.columns.values()))
+
+    def save_npz(self, path : str) -> None:
+        np.savez_compressed(path, **self.to_numpy())
+
+
+@dataclass
+class DecodedCapture:
+    tables : Dict[str, MessageTable] = field(default_factory=dict)
+    number_of_frames : int = 0
+    number_of_transfers : int = 0
+    number_of_errors : int = 0  # broken or unknown transfers
+
+    def add_row(self, name : str, row : Dict[str, Any]) -> None:
+        if name not in self.tables:
+            self.tables[name] = MessageTable(name)
+        self.tables[name].append(row)
+        self.number_of_transfers += 1
+
+    def merge(self, other : "DecodedCapture") -> None:
+        for name, table in other.tables.items():
+            if name in self.tables:
+                self.tables[name].extend(table)
+            else:
+                self.tables[name] = table
+        self.number_of_frames += other.number_of_frames
+        self.number_of_transfers += other.number_of_transfers
+        self.number_of_errors += other.number_of_errors
+
+
+def detect_protocol(capture : CaptureFile, max_frames : int = 1000) -> Protocol:
+    """
+    By the toggle bit of the first frames of the transfers: it is 0 in DroneCAN and 1 in Cyphal.
+    The multi-frame transfers are counted too, so a capture without single-frame traffic is detected.
+    """
+    votes = {Protocol.CYPHAL : 0, Protocol.DRONECAN : 0}
+    for records in capture.get_chunks():
+        records = records[:max_frames]
+        lengths = get_lengths(records).astype(np.intp)
+        records, lengths = records[lengths > 0], lengths[lengths > 0]
+        tail_bytes = records["data"][np.arange(len(records)), lengths - 1]
+        first_frames = tail_bytes[(tail_bytes & 0x80) != 0]
+        votes[Protocol.CYPHAL] += int(np.count_nonzero(first_frames & 0x20))
+        votes[Protocol.DRONECAN] += int(np.count_nonzero((first_frames & 0x20) == 0))
+        max_frames -= len(records)
+        if max_frames <= 0:
+            break
+    if votes[Protocol.CYPHAL] == votes[Protocol.DRONECAN]:
+        return Protocol.UNKNOWN
+    return max(votes, key=votes.get)
+
+def partition_streams(capture : CaptureFile, protocol : Protocol, number_of_partitions : int) -> List[List[int]]:
+    """
+    Distribute the stream keys over the partitions with about the same number of frames each,
+    the biggest streams first. A stream is never split, otherwise its transfers would be broken.
+    """
+    counters : Dict[int, int] = {}
+    for records in capture.get_chunks():
+        keys = records["can_id"][(records["flags"] & FLAG_EXTENDED) != 0] & STREAM_KEY_MASKS[protocol]
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            counters[int(key)] = counters.get(int(key), 0) + int(count)
+
+    partitions : List[List[int]] = [[] for _ in range(max(number_of_partitions, 1))]
+    loads = [0] * len(partitions)
+    for key in sorted(counters, key=counters.get, reverse=True):
+        idx = loads.index(min(loads))
+        partitions[idx].append(key)
+        loads[idx] += counters[key]
+    return [partition for partition in partitions if partition]
+
+def read_stream_records(capture : CaptureFile, protocol : Protocol, keys : Iterable[int]) -> Iterator[np.ndarray]:
+    """The extended frames of the given streams, chunk by chunk."""
+    keys = np.asarray(list(keys), dtype=np.uint32)
+    for records in capture.get_chunks():
+        mask = (records["flags"] & FLAG_EXTENDED) != 0
+        mask &= np.isin(records["can_id"] & STREAM_KEY_MASKS[protocol], keys)
+        if np.any(mask):
+            yield records[mask]
+
+def decode_capture(path : str,
+                   protocol : Optional[Protocol] = None,
+                   jobs : Optional[int] = None,
+                   cyphal_types : Optional[Dict[int, str]] = None) -> DecodedCapture:
+    """
+    Decode all transfers of a capture of any supported format.
+    protocol is detected from the traffic if None.
+    cyphal_types are the data types of the subjects without a fixed ID, for example
+    {2345 : "uavcan.si.sample.temperature.Scalar.1.0"}.
+    """
+    if not is_binary_capture(path):
+        with tempfile.TemporaryDirectory() as directory:
+            binary_path = os.path.join(directory, "capture.rlcap")
+            write_capture(binary_path, read_capture(path), canfd=True)
+            return decode_capture(binary_path, protocol, jobs, cyphal_types)
+
+    capture = CaptureFile(path)
+    if protocol is None:
+        protocol = detect_protocol(capture)
+    if protocol not in STREAM_KEY_MASKS:
+        raise ValueError(f"{path}: the protocol can't be detected")
+
+    jobs = jobs or os.cpu_count() or 1
+    partitions = partition_streams(capture, protocol, jobs)
+    decoded = DecodedCapture()
+    if jobs == 1 or len(partitions) <= 1:
+        results = [_decode_partition(path, protocol, keys, cyphal_types) for keys in partitions]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(partitions))) as executor:
+            results = list(executor.map(_decode_partition,
+                                        [path] * len(partitions),
+                                        [protocol] * len(partitions),
+                                        partitions,
+                                        [cyphal_types] * len(partitions)))
+    for result in results:
+        decoded.merge(result)
+    for table in decoded.tables.values():
+        table.sort_by_timestamp()
+    return decoded
+
+def flatten(value : Any, prefix : str, row : Dict[str, Any]) -> None:
+    """Flatten nested dictionaries into a single row, the keys are joined with dots."""
+    if isinstance(value, dict):
+        for name, item in value.items():
+            flatten(item, f"{prefix}.{name}" if prefix else name, row)
+    else:
+        row[prefix] = value
+
+def _decode_partition(path : str,
+                      protocol : Protocol,
+                      keys : List[int],
+                      cyphal_types : Optional[Dict[int, str]]) -> DecodedCapture:
+    capture = CaptureFile(path)
+    if protocol == Protocol.DRONECAN:
+        from raccoonlab_tools.dronecan.capture_decoder import DronecanStreamDecoder
+        decoder = DronecanStreamDecoder()
+    else:
+        from raccoonlab_tools.cyphal.capture_decoder import CyphalStreamDecoder
+        decoder = CyphalStreamDecoder(cyphal_types)
+    return decoder.decode(read_stream_records(capture, protocol, keys))
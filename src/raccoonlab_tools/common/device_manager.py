@@ -2,8 +2,9 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import re
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import serial.tools.list_ports
 import netifaces
 import platform
@@ -14,6 +15,7 @@ class CanInterface:
     desc: str = "Unknown"
     hwid: str = "Unknown"
     port: Optional[str] = None
+    serial_number: Optional[str] = None
 
 KNOWN_SNIFFERS = [
     CanInterface("RaccoonLab", "STM32 STLink - ST-Link VCP Ctrl",              "USB VID:PID=0483:374B"),
@@ -38,19 +40,24 @@ class DeviceManager:
     def find_transports(verbose=False) -> list:
         transports = []
 
+        virtual_transports = []
         system = platform.system()
         if system == "Linux":
             for interface in netifaces.interfaces():
                 if interface.startswith(("slcan", "can")):
                     transports.append(CanInterface(port=interface))
+                elif interface.startswith("vcan"):
+                    virtual_transports.append(CanInterface(desc="Virtual CAN", port=interface))
 
         for port, desc, hwid in sorted(serial.tools.list_ports.comports()):
             for known_sniffer in KNOWN_SNIFFERS:
                 if desc == known_sniffer.desc or hwid.startswith(known_sniffer.hwid):
-                    known_sniffer.port = port
-                    transports.append(known_sniffer)
+                    transports.append(DeviceManager._create_device(known_sniffer, port, hwid))
                     break
 
+        # A real sniffer is always preferred, a virtual bus is used only if there is nothing else
+        transports += virtual_transports
+
         if verbose:
             DeviceManager._print_finding_transport_results(transports)
 
@@ -74,6 +81,7 @@ class DeviceManager:
         Examples of output.
         - slcan:/dev/ttyACM0@1000000
         - socketcan:slcan0
+        - socketcan:vcan0
         """
         devices = DeviceManager.find_transports()
 
@@ -81,7 +89,7 @@ class DeviceManager:
             return ""
 
         best_device_port = devices[0].port
-        if best_device_port.startswith("slcan"):
+        if best_device_port.startswith(("slcan", "can", "vcan")):
             can_iface_name = f"socketcan:{best_device_port}"
         else:
             can_iface_name = f"slcan:{best_device_port}@1000000"
@@ -94,6 +102,7 @@ class DeviceManager:
         Examples of output.
         - slcan:/dev/ttyACM0
         - slcan0
+        - vcan0
         """
         devices = DeviceManager.find_transports()
 
@@ -101,7 +110,7 @@ class DeviceManager:
             return ""
 
         best_device_port = devices[0].port
-        if best_device_port.startswith("slcan"):
+        if best_device_port.startswith(("slcan", "can", "vcan")):
             can_iface_name = best_device_port
         else:
             can_iface_name = f"slcan:{best_device_port}"
@@ -115,8 +124,7 @@ class DeviceManager:
         for port, desc, hwid in sorted(ports):
             for known_programmer in KNOWN_PROGRAMMERS:
                 if desc == known_programmer.desc or hwid.startswith(known_programmer.hwid):
-                    known_programmer.port = port
-                    programmers.append(known_programmer)
+                    programmers.append(DeviceManager._create_device(known_programmer, port, hwid))
                     break
 
         if len(programmers) == 0:
@@ -135,6 +143,16 @@ class DeviceManager:
             raise ProgrammerNotFoundException("[ERROR] Programmer has not been detected.")
         return programmers[0].port
 
+    @staticmethod
+    def _create_device(known_device : CanInterface, port : str, hwid : str) -> CanInterface:
+        """
+        Copy the known device, so several devices of the same type don't share the same object.
+        hwid example: USB VID:PID=0483:374B SER=066DFF555654725187174122 LOCATION=1-1:1.2
+        """
+        match = re.search(r"SER=(\S+)", hwid)
+        serial_number = match.group(1) if match else None
+        return replace(known_device, port=port, serial_number=serial_number)
+
     @staticmethod
     def _print_finding_transport_results(transports : list):
         if len(transports) == 0:
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Local cache of firmware binaries.
+
+The binaries are stored by their SHA-256 in the cache directory, an index maps a URL to the
+binary and its ETag/Last-Modified headers. A cached binary is revalidated with a conditional
+request at most every REVALIDATE_PERIOD_SEC seconds, so a flashing session downloads it only once.
+All files are written atomically: a temporary file is renamed to the final name.
+
+The cache directory is RL_FIRMWARE_CACHE or ~/.cache/raccoonlab_tools/firmware by default.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import urllib.error
+import urllib.request
+from typing import List, Optional
+
+CACHE_DIR_ENV_VAR = "RL_FIRMWARE_CACHE"
+GITHUB_TOKEN_ENV_VAR = "GITHUB_TOKEN"
+
+class FirmwareCacheError(Exception):
+    """Exception raised when a binary can't be downloaded and it is not cached."""
+
+
+class FirmwareCache:
+    REVALIDATE_PERIOD_SEC = 600
+    TIMEOUT_SEC = 30
+    GITHUB_API_URL = "https://api.github.com"
+
+    def __init__(self, cache_dir : Optional[str] = None) -> None:
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+        if cache_dir is None:
+            xdg_cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+            cache_dir = os.path.join(xdg_cache_home, "raccoonlab_tools", "firmware")
+        self.cache_dir = cache_dir
+        self._index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch_url(self, url : str, sha256 : Optional[str] = None, revalidate : Optional[bool] = None) -> str:
+        """
+        Return the path of the cached binary, download it if it is missing or outdated.
+        revalidate=None means revalidate only if the last check is older than REVALIDATE_PERIOD_SEC.
+        If sha256 is provided, the binary must match it.
+        """
+        index = self._load_index()
+        entry = index.get(url)
+        cached_path = self._get_valid_object_path(entry)
+
+        if cached_path is not None and sha256 is not None and entry["sha256"] != sha256.lower():
+            cached_path = None
+        if cached_path is not None and revalidate is None:
+            revalidate = time.time() - entry.get("checked", 0) > FirmwareCache.REVALIDATE_PERIOD_SEC
+        if cached_path is not None and not revalidate:
+            print(f"[INFO] cached {url}")
+            return cached_path
+
+        headers = {}
+        if cached_path is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        if GITHUB_TOKEN_ENV_VAR in os.environ and url.startswith(FirmwareCache.GITHUB_API_URL):
+            headers["Authorization"] = f"Bearer {os.environ[GITHUB_TOKEN_ENV_VAR]}"
+            headers["Accept"] = "application/octet-stream"
+
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=FirmwareCache.TIMEOUT_SEC) as response:
+                digest, object_path = self._store_object(response)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as err:
+            if err.code == 304 and cached_path is not None:
+                print(f"[INFO] not modified {url}")
+                entry["checked"] = time.time()
+                self._update_index(url, entry)
+                return cached_path
+            return self._fallback(url, cached_path, err)
+        except (urllib.error.URLError, OSError) as err:
+            return self._fallback(url, cached_path, err)
+
+        if sha256 is not None and digest != sha256.lower():
+            raise FirmwareCacheError(f"SHA-256 mismatch of {url}: expected {sha256}, got {digest}")
+
+        print(f"[INFO] downloaded {url}")
+        self._update_index(url, {
+            "sha256": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "checked": time.time(),
+        })
+        return object_path
+
+    def fetch_github_release(self, repo : str, tag : Optional[str] = None,
+                             revalidate : Optional[bool] = None) -> List[str]:
+        """
+        Return the paths of all *.bin assets of a release, the latest one by default.
+        The release description is cached as well, because the GitHub API is rate limited.
+        The asset URLs contain the release tag, so every release is cached separately.
+        """
+        release_url = f"{FirmwareCache.GITHUB_API_URL}/repos/{repo}/releases/"
+        release_url += "latest" if tag is None else f"tags/{tag}"
+        entry = self._load_index().get(release_url)
+
+        if entry is not None and revalidate is None:
+            revalidate = time.time() - entry.get("checked", 0) > FirmwareCache.REVALIDATE_PERIOD_SEC
+        if entry is None or revalidate:
+            entry = self._request_github_release(repo, release_url, entry)
+
+        print(f"[INFO] release {entry['tag']} of {repo}")
+        return [self.fetch_url(url, revalidate=revalidate) for url in entry["assets"]]
+
+    def _request_github_release(self, repo : str, release_url : str, entry : Optional[dict]) -> dict:
+        headers = {"Accept": "application/vnd.github+json"}
+        if GITHUB_TOKEN_ENV_VAR in os.environ:
+            headers["Authorization"] = f"Bearer {os.environ[GITHUB_TOKEN_ENV_VAR]}"
+        if entry is not None and entry.get("etag"):
+            # A conditional request doesn't count against the rate limit if the release is the same
+            headers["If-None-Match"] = entry["etag"]
+
+        try:
+            request = urllib.request.Request(release_url, headers=headers)
+            with urllib.request.urlopen(request, timeout=FirmwareCache.TIMEOUT_SEC) as response:
+                release = json.load(response)
+                etag = response.headers.get("ETag")
+        except urllib.error.HTTPError as err:
+            if err.code != 304 or entry is None:
+                return self._fallback_release(repo, entry, err)
+            entry["checked"] = time.time()
+            self._update_index(release_url, entry)
+            return entry
+        except (urllib.error.URLError, OSError, ValueError) as err:
+            return self._fallback_release(repo, entry, err)
+
+        # Private assets are downloaded through the API with a token, public ones directly
+        url_key = "url" if GITHUB_TOKEN_ENV_VAR in os.environ else "browser_download_url"
+        entry = {
+            "tag": release.get("tag_name"),
+            "assets": [asset[url_key] for asset in release.get("assets", [])
+                       if asset["name"].endswith(".bin")],
+            "etag": etag,
+            "checked": time.time(),
+        }
+        self._update_index(release_url, entry)
+        return entry
+
+    def _get_valid_object_path(self, entry : Optional[dict]) -> Optional[str]:
+        if entry is None:
+            return None
+        object_path = self._get_object_path(entry["sha256"])
+        if not os.path.exists(object_path):
+            return None
+        if FirmwareCache._hash_file(object_path) != entry["sha256"]:
+            print(f"[WARN] {object_path} is corrupted.")
+            return None
+        return object_path
+
+    def _get_object_path(self, digest : str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.bin")
+
+    def _store_object(self, stream) -> tuple:
+        sha256 = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as tmp_file:
+            try:
+                for chunk in iter(lambda: stream.read(65536), b""):
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+            except BaseException:
+                tmp_file.close()
+                os.remove(tmp_file.name)
+                raise
+        digest = sha256.hexdigest()
+        object_path = self._get_object_path(digest)
+        os.replace(tmp_file.name, object_path)
+        return digest, object_path
+
+    def _fallback(self, url : str, cached_path : Optional[str], err : Exception) -> str:
+        if cached_path is None:
+            raise FirmwareCacheError(f"Can't download {url}: {err}")
+        print(f"[WARN] Can't revalidate {url}: {err}. Use the cached binary.")
+        return cached_path
+
+    @staticmethod
+    def _fallback_release(repo : str, entry : Optional[dict], err : Exception) -> dict:
+        if entry is None:
+            raise FirmwareCacheError(f"Can't get the release of {repo}: {err}")
+        print(f"[WARN] Can't revalidate the release of {repo}: {err}. Use the cached release.")
+        return entry
+
+    def _load_index(self) -> dict:
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as stream:
+                return json.load(stream)
+        except ValueError:
+            print(f"[WARN] {self._index_path} is corrupted, the cache index is reset.")
+            return {}
+
+    def _update_index(self, url : str, entry : dict) -> None:
+        # Reload the index right before writing to keep the entries written by other processes
+        index = self._load_index()
+        index[url] = entry
+        with tempfile.NamedTemporaryFile("w", dir=self.cache_dir, suffix=".tmp", delete=False,
+                                         encoding="utf-8") as tmp_file:
+            json.dump(index, tmp_file, indent=4)
+        os.replace(tmp_file.name, self._index_path)
+
+    @staticmethod
+    def _hash_file(path : str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as stream:
+            for chunk in iter(lambda: stream.read(65536), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
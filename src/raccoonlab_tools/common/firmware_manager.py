@@ -6,16 +6,32 @@
 import subprocess
 import platform
 import os
+import re
 import sys
-import wget
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from raccoonlab_tools.common.firmware_cache import FirmwareCache
 
-DOWNLOAD_BINARY_DIR = '.'
-DOWNLOAD_BINARY_PATH = 'latest.bin'
+
+@dataclass
+class UploadResult:
+    serial_number: str
+    success: bool
+    duration_sec: float
+    error: Optional[str] = None
 
 
 class FirmwareManager:
     @staticmethod
-    def upload_firmware(binary_path):
+    def upload_firmware(binary_path, force=False):
+        """
+        Unless force is set, the target flash is compared with the binary first (st-link linux only),
+        and only the changed pages are written on the targets with uniform flash pages.
+        """
         if not os.path.exists(binary_path):
             print(f"[ERROR] The binary file is not exist: {binary_path}.")
             return
@@ -24,20 +40,73 @@ class FirmwareManager:
         if system == "Windows":
             ProgrammerWindows.upload_firmware(binary_path)
         elif system == "Linux":
-            StlinkLinux.upload_firmware(binary_path)
+            StlinkLinux.upload_firmware(binary_path, force=force)
         elif system == "Darwin":
             print("MacOS is not supported yet.")
         else:
             print("Unknown operating system.")
 
     @staticmethod
-    def get_firmware(firmware_link : str):
+    def upload_firmware_batch(binary_path : str,
+                              serial_numbers : List[str],
+                              max_workers : Optional[int] = None,
+                              force : bool = False) -> List[UploadResult]:
+        """
+        Upload the binary with several programmers concurrently, one job per programmer.
+        The output of each job is prefixed with the programmer serial number.
+        """
+        job = FirmwareManager.make_upload_job(binary_path, force)
+        if max_workers is None:
+            max_workers = max(len(serial_numbers), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(job, serial_numbers))
+
+    @staticmethod
+    def make_upload_job(binary_path : str, force : bool = False) -> Callable[[str], UploadResult]:
         """
-        Given a link of any type (URL, local binary, github repo), download a binary.
+        Return a thread-safe function that uploads the binary with the programmer with the given
+        serial number. The programmers are probed once here: st-info can't access the programmers
+        which are already flashing.
+        """
+        error = None
+        system = platform.system()
+        if not os.path.exists(binary_path):
+            print(f"[ERROR] The binary file is not exist: {binary_path}.")
+            error = "binary not found"
+        elif system == "Windows":
+            def upload(serial_number, prefix):
+                return ProgrammerWindows.upload_firmware(binary_path, serial_number, prefix)
+        elif system == "Linux":
+            probe = StlinkLinux._st_info()
+            def upload(serial_number, prefix):
+                return StlinkLinux.upload_firmware(binary_path, serial_number, probe, prefix, force)
+        else:
+            print(f"{system} is not supported yet.")
+            error = "unsupported os"
+
+        def job(serial_number : str) -> UploadResult:
+            if error is not None:
+                return UploadResult(serial_number, False, 0.0, error)
+            start_time = time.time()
+            try:
+                success = upload(serial_number, f"[{serial_number}] ")
+                upload_error = None if success else "target has not been flashed"
+            except (subprocess.CalledProcessError, OSError) as err:
+                success = False
+                upload_error = str(err)
+            return UploadResult(serial_number, success, time.time() - start_time, upload_error)
+
+        return job
+
+    @staticmethod
+    def get_firmware(firmware_link : str, sha256 : Optional[str] = None, revalidate : Optional[bool] = None):
+        """
+        Given a link of any type (URL, local binary, github repo), return the path of a binary.
+        Downloaded binaries are stored in FirmwareCache and reused until they are changed.
         """
         assert isinstance(firmware_link, str)
-        def is_https(string):
-            return string.startswith("https://")
+        def is_url(string):
+            return string.startswith("https://") or string.startswith("http://")
         def is_local_binary(string):
             return string.endswith(".bin")
         def is_gh_repo(string):
@@ -45,20 +114,21 @@ class FirmwareManager:
             return len(parts) == 2 and all(parts)
 
         binary_path = None
-        if is_https(firmware_link):
+        if is_url(firmware_link):
             print(f"[INFO] url {firmware_link}")
-            if os.path.exists(DOWNLOAD_BINARY_PATH):
-                os.remove(DOWNLOAD_BINARY_PATH)
-            binary_path = wget.download(firmware_link, out=DOWNLOAD_BINARY_PATH)
+            binary_path = FirmwareCache().fetch_url(firmware_link, sha256=sha256, revalidate=revalidate)
         elif is_local_binary(firmware_link):
             print(f"[INFO] local path {firmware_link}")
             binary_path = firmware_link
         elif is_gh_repo(firmware_link):
             print(f"[INFO] github repository {firmware_link}")
-            cmd = ["gh", "-R", firmware_link, "release", "download",
-                "--pattern", '*.bin',
-                "--dir", DOWNLOAD_BINARY_DIR]
-            subprocess.run(cmd, check=False)
+            binary_paths = FirmwareCache().fetch_github_release(firmware_link)
+            if len(binary_paths) == 0:
+                print(f"[ERROR] The latest release of {firmware_link} doesn't have .bin assets.")
+                sys.exit(1)
+            if len(binary_paths) > 1:
+                print(f"[WARN] The release has {len(binary_paths)} binaries. Use the first one.")
+            binary_path = binary_paths[0]
         else:
             print("[ERROR] I don't know.")
             sys.exit(1)
@@ -68,39 +138,155 @@ class FirmwareManager:
 
 
 class StlinkLinux:
+    FLASH_ADDRESS = 0x8000000
+
+    # Each st-flash call reconnects to the target, so many small writes are slower than a full one
+    MAX_PARTIAL_WRITES = 4
+
+    # The families with uniform flash pages. The others (F2, F4, F7) have sectors of 16-128 KiB,
+    # so st-flash would erase a whole sector with the unchanged data around a changed page
+    UNIFORM_PAGE_FAMILIES = (b'C0', b'F0', b'F1', b'F3', b'G0', b'G4', b'L0', b'L1', b'L4', b'L5', b'WB', b'WL')
+
     @staticmethod
-    def upload_firmware(binary_path):
+    def upload_firmware(binary_path, serial_number=None, probe=None, prefix=None, force=False) -> bool:
         """
         st-info --probe returns:
         - b'Found 0 stlink programmers' if programmer is not online
         - b'dev-type:   unknown' if target is not detected
         - b'F1xx Medium-density' or 'STM32F1xx_MD' if stm32f103 is detected
+        With serial_number, only the probe of this programmer is checked and flashed.
+        Unless force is set, the flash is read back first: the write is skipped if it already
+        contains the binary, otherwise only the changed pages are erased and written if the flash
+        of the target has uniform pages.
         """
-        res = StlinkLinux._st_info()
+        res = StlinkLinux._st_info() if probe is None else probe
+        prefix = "" if prefix is None else prefix
         if b'Found 0 stlink programmers' in res:
-            print("[ERROR] Programmer has not been detected.")
-            return
-        if b'Found 1 stlink programmer' in res:
+            print(f"{prefix}[ERROR] Programmer has not been detected.")
+            return False
+        if serial_number is not None:
+            res = StlinkLinux._get_programmer_probe(res, serial_number)
+            if res is None:
+                print(f"{prefix}[ERROR] Programmer {serial_number} has not been detected.")
+                return False
+        elif b'Found 1 stlink programmer' in res:
             print("[INFO] Found 1 stlink programmer.")
 
         if b'dev-type:   unknown' in res:
-            print("[ERROR] Target device has not been found.")
-            return
+            print(f"{prefix}[ERROR] Target device has not been found.")
+            return False
 
-        print(f"upload {binary_path}")
+        print(f"{prefix}upload {binary_path}")
+        cmd = ['st-flash']
+        if serial_number is not None:
+            cmd += ['--serial', serial_number]
         if b'F1xx Medium-density' in res or b'STM32F1xx_MD' in res:
-            print("[INFO] stm32f103 has been found.")
-            cmd = ['st-flash', '--flash=0x00020000', "--reset", "write", binary_path, "0x8000000"]
+            print(f"{prefix}[INFO] stm32f103 has been found.")
+            cmd += ['--flash=0x00020000']
         else:
-            print("[INFO] Target has been found.")
-            cmd = ['st-flash', "--reset", "write", binary_path, "0x8000000"]
+            print(f"{prefix}[INFO] Target has been found.")
 
-        subprocess_with_print(cmd)
+        output_prefix = prefix if serial_number is not None else None
+        if not force and StlinkLinux._write_changed_pages(cmd, binary_path, res, prefix, output_prefix):
+            return True
+
+        subprocess_with_print(cmd + ["--reset", "write", binary_path, hex(StlinkLinux.FLASH_ADDRESS)],
+                              output_prefix)
+        return True
+
+    @staticmethod
+    def _write_changed_pages(cmd, binary_path, res, prefix, output_prefix) -> bool:
+        """
+        Return True if the flash is up to date after the call, False if a full write is required.
+        """
+        with open(binary_path, "rb") as stream:
+            binary = stream.read()
+        flash = StlinkLinux._read_flash(cmd, len(binary))
+        if flash is None:
+            print(f"{prefix}[WARN] Can't read the flash. Write the whole binary.")
+            return False
+        if flash == binary:
+            print(f"{prefix}[INFO] The target already has this binary. Skip the write.")
+            return True
+
+        page_size = StlinkLinux._get_page_size(res)
+        if page_size is None or not StlinkLinux._has_uniform_pages(res):
+            print(f"{prefix}[INFO] The flash of the target has no uniform pages. Write the whole binary.")
+            return False
+        changed_ranges = StlinkLinux._get_changed_ranges(flash, binary, page_size)
+        if len(changed_ranges) > StlinkLinux.MAX_PARTIAL_WRITES:
+            return False
+
+        changed_size = sum(end - begin for begin, end in changed_ranges)
+        print(f"{prefix}[INFO] {changed_size} of {len(binary)} bytes are changed.")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for idx, (begin, end) in enumerate(changed_ranges):
+                chunk_path = os.path.join(tmp_dir, f"chunk_{idx}.bin")
+                with open(chunk_path, "wb") as stream:
+                    stream.write(binary[begin:end])
+                reset = ["--reset"] if idx + 1 == len(changed_ranges) else []
+                address = hex(StlinkLinux.FLASH_ADDRESS + begin)
+                subprocess_with_print(cmd + reset + ["write", chunk_path, address], output_prefix)
+        return True
+
+    @staticmethod
+    def _read_flash(cmd, size : int) -> Optional[bytes]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            flash_path = os.path.join(tmp_dir, "flash.bin")
+            read_cmd = cmd + ["read", flash_path, hex(StlinkLinux.FLASH_ADDRESS), str(size)]
+            try:
+                subprocess.run(read_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                with open(flash_path, "rb") as stream:
+                    flash = stream.read()
+            except (subprocess.CalledProcessError, OSError):
+                return None
+        return flash if len(flash) == size else None
+
+    @staticmethod
+    def _get_page_size(res : bytes) -> Optional[int]:
+        """flash:      131072 (pagesize: 1024)"""
+        match = re.search(rb"pagesize:\s*(\d+)", res)
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _has_uniform_pages(res : bytes) -> bool:
+        """dev-type:   F1xx_MD or STM32F1xx_MD depending on the st-info version"""
+        match = re.search(rb"dev-type:\s*(?:STM32)?([A-Z]\w)", res)
+        return match is not None and match.group(1) in StlinkLinux.UNIFORM_PAGE_FAMILIES
+
+    @staticmethod
+    def _get_changed_ranges(flash : bytes, binary : bytes, page_size : int) -> List[tuple]:
+        """Return the [begin, end) byte ranges of the contiguous changed pages."""
+        ranges = []
+        for begin in range(0, len(binary), page_size):
+            end = min(begin + page_size, len(binary))
+            if flash[begin:end] == binary[begin:end]:
+                continue
+            if ranges and ranges[-1][1] == begin:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((begin, end))
+        return ranges
 
     @staticmethod
     def _st_info() -> str:
         return subprocess.Popen(["st-info", "--probe"], stdout=subprocess.PIPE).communicate()[0]
 
+    @staticmethod
+    def _get_programmer_probe(res : bytes, serial_number : str) -> Optional[bytes]:
+        """
+        The probe of each programmer starts with the version line:
+          version:    V2J37S7
+          serial:     066DFF555654725187174122
+          ...
+        """
+        for probe in res.split(b'  version:')[1:]:
+            for line in probe.splitlines():
+                if line.strip().startswith(b'serial:') and \
+                        line.split(b':', 1)[1].strip().decode().lower() == serial_number.lower():
+                    return probe
+        return None
+
 class ProgrammerWindows:
     ENV_VAR_NAME = 'STM32_PROGRAMMER_CLI'
     DEFAULT_PATH = ["C:\\Program Files",
@@ -112,25 +298,37 @@ class ProgrammerWindows:
     ]
     DEFAULT_PATH = os.path.join(*DEFAULT_PATH)
     @staticmethod
-    def upload_firmware(binary_path : str):
+    def upload_firmware(binary_path : str, serial_number=None, prefix=None) -> bool:
+        prefix = "" if prefix is None else prefix
         stm32_programmer_cli_path = os.environ.get(ProgrammerWindows.ENV_VAR_NAME)
         if stm32_programmer_cli_path is None:
             stm32_programmer_cli_path = ProgrammerWindows.DEFAULT_PATH
-            print((f"[WARN] The `{ProgrammerWindows.ENV_VAR_NAME}` env is not specified. "
+            print((f"{prefix}[WARN] The `{ProgrammerWindows.ENV_VAR_NAME}` env is not specified. "
                    f"Use the default path: {ProgrammerWindows.DEFAULT_PATH}."))
 
         if not os.path.exists(stm32_programmer_cli_path):
-            print(f"[ERROR] The cli has not been found here: {stm32_programmer_cli_path}.")
-            return
+            print(f"{prefix}[ERROR] The cli has not been found here: {stm32_programmer_cli_path}.")
+            return False
 
-        cmd = [stm32_programmer_cli_path, "-c", "port=SWD", "-w", binary_path, "0x08000000", "-rst"]
-        subprocess_with_print(cmd)
+        cmd = [stm32_programmer_cli_path, "-c", "port=SWD"]
+        if serial_number is not None:
+            cmd += [f"sn={serial_number}"]
+        cmd += ["-w", binary_path, "0x08000000", "-rst"]
+        subprocess_with_print(cmd, prefix if serial_number is not None else None)
+        return True
 
 
-def subprocess_with_print(cmd):
-    """Origin: https://stackoverflow.com/a/4417735"""
+_print_lock = threading.Lock()
+
+def subprocess_with_print(cmd, prefix=None):
+    """
+    Origin: https://stackoverflow.com/a/4417735
+    With a prefix, stderr is printed as well and each line is prefixed,
+    so the output of concurrent jobs can be distinguished.
+    """
     def execute(cmd):
-        with subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True) as popen:
+        stderr = None if prefix is None else subprocess.STDOUT
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, universal_newlines=True) as popen:
             for stdout_line in iter(popen.stdout.readline, ""):
                 yield stdout_line
             popen.stdout.close()
@@ -139,7 +337,11 @@ def subprocess_with_print(cmd):
                 raise subprocess.CalledProcessError(return_code, cmd)
 
     for path in execute(cmd):
-        print(path, end="")
+        if prefix is None:
+            print(path, end="")
+        else:
+            with _print_lock:
+                print(f"{prefix}{path}", end="", flush=True)
 
 
 # Just for test purposes
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Protocol independent part of the firmware update over CAN: the image served by a file server
+and the update progress of each node.
+"""
+import os
+import mmap
+import time
+from enum import Enum
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+class FirmwareImage:
+    """
+    Read-only memory mapped image. It is mapped once and shared by all nodes being updated,
+    the kernel is asked to read the whole image ahead, so the reads are served from memory.
+    """
+    def __init__(self, path : str) -> None:
+        self.path = path
+        with open(path, "rb") as stream:
+            self.size = os.fstat(stream.fileno()).st_size
+            if self.size == 0:
+                raise ValueError(f"The image is empty: {path}")
+            self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # madvise is not available on Windows and on Python < 3.8
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    def read(self, offset : int, size : int) -> bytes:
+        """Return up to size bytes. An empty or a short result means the end of the image."""
+        return self._mmap[offset:offset + size]
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> "FirmwareImage":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class UpdateState(Enum):
+    REQUESTED = 0
+    IN_PROGRESS = 1
+    FINISHED = 2
+    FAILED = 3
+
+
+@dataclass
+class NodeUpdateProgress:
+    node_id: int
+    image_size: int
+    state: UpdateState = UpdateState.REQUESTED
+    bytes_read: int = 0
+    start_time: Optional[float] = None
+    last_read_time: Optional[float] = None
+    end_time: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def percent(self) -> float:
+        return 100.0 * self.bytes_read / self.image_size
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second from the first to the last read request."""
+        if self.start_time is None or self.last_read_time is None or self.last_read_time <= self.start_time:
+            return 0.0
+        return self.bytes_read / (self.last_read_time - self.start_time)
+
+    @property
+    def is_done(self) -> bool:
+        return self.state in (UpdateState.FINISHED, UpdateState.FAILED)
+
+    def on_read(self, offset : int, size : int) -> None:
+        """Account a served read request. A node can retry a read, so the offset is used."""
+        now = time.time()
+        if self.start_time is None:
+            self.start_time = now
+        self.last_read_time = now
+        self.bytes_read = max(self.bytes_read, offset + size)
+        if self.state == UpdateState.REQUESTED:
+            self.state = UpdateState.IN_PROGRESS
+
+    def finish(self) -> None:
+        self.state = UpdateState.FINISHED
+        self.end_time = time.time()
+
+    def fail(self, error : str) -> None:
+        self.state = UpdateState.FAILED
+        self.error = error
+        self.end_time = time.time()
+
+    def __str__(self) -> str:
+        string = (f"node {self.node_id :>3}: {self.state.name :<11} {self.percent :5.1f}% "
+                  f"{self.throughput / 1024 :6.1f} KiB/s")
+        if self.error is not None:
+            string += f" ({self.error})"
+        return string
+
+
+def print_progress(progresses : Iterable[NodeUpdateProgress]) -> None:
+    for progress in progresses:
+        print(progress)
+
+def format_summary(progresses : Iterable[NodeUpdateProgress]) -> str:
+    """One line summary of all nodes: the number of nodes in each state and the total throughput."""
+    progresses = list(progresses)
+    counters = {state : 0 for state in UpdateState}
+    for progress in progresses:
+        counters[progress.state] += 1
+    in_progress = [progress for progress in progresses if progress.state == UpdateState.IN_PROGRESS]
+    throughput = sum(progress.throughput for progress in in_progress)
+    min_percent = min((progress.percent for progress in in_progress), default=100.0)
+    states = ", ".join(f"{state.name.lower()}: {counter}" for state, counter in counters.items())
+    return f"{states}. Slowest node: {min_percent :.1f}%. Total: {throughput / 1024 :.1f} KiB/s"
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Optional local SQLite inventory of the boards.
+
+The boards are identified by their hardware unique ID. The inventory keeps:
+- the history of NodeInfo (name, software and hardware versions),
+- snapshots of the parameters: the desired values from a config and the values read from a node,
+- the uploaded firmware,
+- the test outcomes.
+
+The inventory is disabled unless RL_INVENTORY is set to the path of the database.
+The writes of a tool are grouped into one transaction that is committed when the tool is done:
+
+with Inventory("inventory.sqlite") as inventory:
+    inventory.record_node_infos(node_infos)
+    inventory.record_params(uid, params, source="get_params")
+"""
+import os
+import time
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from raccoonlab_tools.common.node import NodeInfo
+
+INVENTORY_ENV_VAR = "RL_INVENTORY"
+
+ParamValue = Union[None, bool, int, float, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boards (
+    uid TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS node_infos (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL,
+    node_id INTEGER,
+    name TEXT,
+    sw_major INTEGER,
+    sw_minor INTEGER,
+    vcs_commit TEXT,
+    hw_major INTEGER,
+    hw_minor INTEGER,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS node_infos_uid ON node_infos(uid, timestamp);
+CREATE INDEX IF NOT EXISTS node_infos_vcs_commit ON node_infos(vcs_commit);
+CREATE TABLE IF NOT EXISTS param_snapshots (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL,
+    source TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS param_snapshots_uid ON param_snapshots(uid, source, timestamp);
+CREATE TABLE IF NOT EXISTS params (
+    snapshot_id INTEGER NOT NULL REFERENCES param_snapshots(id),
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (snapshot_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS flashes (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    programmer TEXT,
+    sha256 TEXT,
+    binary TEXT,
+    success INTEGER NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS flashes_uid ON flashes(uid, timestamp);
+CREATE INDEX IF NOT EXISTS flashes_programmer ON flashes(programmer, timestamp);
+CREATE TABLE IF NOT EXISTS test_results (
+    id INTEGER PRIMARY KEY,
+    uid TEXT,
+    node_id INTEGER,
+    test TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_results_uid ON test_results(uid, timestamp);
+"""
+
+LATEST_NODE_INFOS = """
+SELECT * FROM node_infos AS info
+WHERE info.id = (SELECT id FROM node_infos WHERE uid = info.uid ORDER BY timestamp DESC, id DESC LIMIT 1)
+"""
+
+@dataclass
+class BoardRecord:
+    uid: str
+    node_id: Optional[int]
+    name: str
+    software_version: Tuple[int, int]
+    vcs_commit: str
+    hardware_version: Tuple[int, int]
+    last_seen: float
+
+    def __str__(self) -> str:
+        last_seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_seen))
+        return (f"{self.uid :<32} node {self.node_id if self.node_id is not None else '-' :>3}  {self.name :<32} "
+                f"SW v{self.software_version[0]}.{self.software_version[1]}_{self.vcs_commit :<10} "
+                f"HW v{self.hardware_version[0]}.{self.hardware_version[1]}  {last_seen}")
+
+
+@dataclass
+class ParamDrift:
+    name: str
+    expected: ParamValue
+    actual: ParamValue
+
+    def __str__(self) -> str:
+        return f"{self.name :<30}: {self.expected} -> {self.actual}"
+
+
+@dataclass
+class TestResult:
+    test: str
+    outcome: str
+    node_id: Optional[int] = None
+    uid: Optional[str] = None
+
+
+class Inventory:
+    def __init__(self, path : str) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    @staticmethod
+    def open_default() -> Optional["Inventory"]:
+        """Return the inventory configured by RL_INVENTORY or None if it is disabled."""
+        path = os.environ.get(INVENTORY_ENV_VAR)
+        return None if not path else Inventory(path)
+
+    def __enter__(self) -> "Inventory":
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self._connection.rollback()
+        self.close()
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def record_node_infos(self, node_infos : Iterable[NodeInfo], timestamp : Optional[float] = None) -> None:
+        """A new NodeInfo row is added only if it differs from the latest one of the board."""
+        timestamp = time.time() if timestamp is None else timestamp
+        for info in node_infos:
+            uid = info.hardware_version.unique_id
+            self._touch_board(uid, timestamp)
+            row = (info.node_id,
+                   info.name,
+                   info.software_version.major,
+                   info.software_version.minor,
+                   info.software_version.vcs_commit,
+                   info.hardware_version.major,
+                   info.hardware_version.minor)
+            latest = self._connection.execute(
+                "SELECT node_id, name, sw_major, sw_minor, vcs_commit, hw_major, hw_minor FROM node_infos "
+                "WHERE uid = ? ORDER BY timestamp DESC, id DESC LIMIT 1", (uid,)).fetchone()
+            if latest is None or tuple(latest) != row:
+                self._connection.execute(
+                    "INSERT INTO node_infos (uid, node_id, name, sw_major, sw_minor, vcs_commit, hw_major, "
+                    "hw_minor, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (uid, *row, timestamp))
+
+    def record_params(self,
+                      uid : str,
+                      params : Dict[str, ParamValue],
+                      source : str,
+                      timestamp : Optional[float] = None) -> int:
+        """
+        source is "config" for the desired values and the name of the tool for the values read from a node.
+        Return the snapshot ID.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        self._touch_board(uid, timestamp)
+        cursor = self._connection.execute(
+            "INSERT INTO param_snapshots (uid, source, timestamp) VALUES (?, ?, ?)", (uid, source, timestamp))
+        snapshot_id = cursor.lastrowid
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO params (snapshot_id, name, type, value) VALUES (?, ?, ?, ?)",
+            [(snapshot_id, name, *Inventory._encode_value(value)) for name, value in params.items()])
+        return snapshot_id
+
+    def record_flash(self,
+                     programmer : Optional[str],
+                     sha256 : Optional[str],
+                     binary : Optional[str],
+                     success : bool,
+                     uid : Optional[str] = None,
+                     timestamp : Optional[float] = None) -> None:
+        """The unique ID is known only if the board has been online after the upload."""
+        timestamp = time.time() if timestamp is None else timestamp
+        if uid is not None:
+            self._touch_board(uid, timestamp)
+        self._connection.execute(
+            "INSERT INTO flashes (uid, programmer, sha256, binary, success, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            (uid, programmer, sha256, binary, int(success), timestamp))
+
+    def record_test_results(self, results : Iterable[TestResult], timestamp : Optional[float] = None) -> None:
+        timestamp = time.time() if timestamp is None else timestamp
+        results = list(results)
+        for uid in {result.uid for result in results if result.uid is not None}:
+            self._touch_board(uid, timestamp)
+        self._connection.executemany(
+            "INSERT INTO test_results (uid, node_id, test, outcome, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [(result.uid, result.node_id, result.test, result.outcome, timestamp) for result in results])
+
+    def get_boards(self) -> List[BoardRecord]:
+        """The latest known NodeInfo of each board."""
+        rows = self._connection.execute(
+            f"SELECT info.*, boards.last_seen FROM ({LATEST_NODE_INFOS}) AS info "
+            "JOIN boards ON boards.uid = info.uid ORDER BY info.name, info.uid").fetchall()
+        return [Inventory._create_board_record(row) for row in rows]
+
+    def get_outdated_boards(self, major : int, minor : int) -> List[BoardRecord]:
+        """The boards whose latest known software version is older than major.minor."""
+        return [board for board in self.get_boards() if board.software_version < (major, minor)]
+
+    def get_boards_with_other_firmware(self, vcs_commit : str) -> List[BoardRecord]:
+        """The boards whose latest known VCS commit is not the given one."""
+        return [board for board in self.get_boards() if board.vcs_commit != vcs_commit.lower()]
+
+    def get_param_drift(self, uid : str) -> Optional[List[ParamDrift]]:
+        """
+        Compare the latest config snapshot with the latest snapshot read from the node after it.
+        None means that there is nothing to compare.
+        """
+        config = self._connection.execute(
+            "SELECT id, timestamp FROM param_snapshots WHERE uid = ? AND source = 'config' "
+            "ORDER BY timestamp DESC, id DESC LIMIT 1", (uid,)).fetchone()
+        if config is None:
+            return None
+        actual = self._connection.execute(
+            "SELECT id FROM param_snapshots WHERE uid = ? AND source != 'config' AND timestamp >= ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT 1", (uid, config["timestamp"])).fetchone()
+        if actual is None:
+            return None
+
+        from raccoonlab_tools.dronecan.utils import Parameter
+        expected_params = self._get_snapshot(config["id"])
+        actual_params = self._get_snapshot(actual["id"])
+        return [ParamDrift(name, value, actual_params.get(name)) for name, value in expected_params.items()
+                if name not in actual_params or not Parameter(name, value).is_equal(actual_params[name])]
+
+    def get_uids(self) -> List[str]:
+        return [row["uid"] for row in self._connection.execute("SELECT uid FROM boards ORDER BY uid")]
+
+    def get_history(self, uid : str) -> List[Tuple[float, str]]:
+        """All records of the board sorted by time: (timestamp, description)."""
+        history = []
+        for row in self._connection.execute("SELECT * FROM node_infos WHERE uid = ?", (uid,)):
+            history.append((row["timestamp"], f"info   node {row['node_id']} {row['name']} "
+                                              f"v{row['sw_major']}.{row['sw_minor']}_{row['vcs_commit']}"))
+        for row in self._connection.execute("SELECT * FROM param_snapshots WHERE uid = ?", (uid,)):
+            number = self._connection.execute("SELECT COUNT(*) FROM params WHERE snapshot_id = ?",
+                                              (row["id"],)).fetchone()[0]
+            history.append((row["timestamp"], f"params {row['source']}: {number} parameters"))
+        for row in self._connection.execute("SELECT * FROM flashes WHERE uid = ?", (uid,)):
+            history.append((row["timestamp"], f"flash  {'OK' if row['success'] else 'FAIL'} "
+                                              f"{row['binary']} sha256 {row['sha256']}"))
+        for row in self._connection.execute("SELECT * FROM test_results WHERE uid = ?", (uid,)):
+            history.append((row["timestamp"], f"test   {row['outcome']} {row['test']}"))
+        return sorted(history, key=lambda record: record[0])
+
+    def _touch_board(self, uid : str, timestamp : float) -> None:
+        self._connection.execute(
+            "INSERT INTO boards (uid, first_seen, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)",
+            (uid, timestamp, timestamp))
+
+    def _get_snapshot(self, snapshot_id : int) -> Dict[str, ParamValue]:
+        rows = self._connection.execute("SELECT name, type, value FROM params WHERE snapshot_id = ?", (snapshot_id,))
+        return {row["name"] : Inventory._decode_value(row["type"], row["value"]) for row in rows}
+
+    @staticmethod
+    def _create_board_record(row : sqlite3.Row) -> BoardRecord:
+        return BoardRecord(uid=row["uid"],
+                           node_id=row["node_id"],
+                           name=row["name"],
+                           software_version=(row["sw_major"], row["sw_minor"]),
+                           vcs_commit=row["vcs_commit"],
+                           hardware_version=(row["hw_major"], row["hw_minor"]),
+                           last_seen=row["last_seen"])
+
+    @staticmethod
+    def _encode_value(value : ParamValue) -> Tuple[str, Optional[str]]:
+        if value is None:
+            return "none", None
+        return type(value).__name__, str(value)
+
+    @staticmethod
+    def _decode_value(value_type : str, value : Optional[str]) -> ParamValue:
+        if value_type == "bool":
+            return value == "True"
+        if value_type == "int":
+            return int(value)
+        if value_type == "float":
+            return float(value)
+        if value_type == "none":
+            return None
+        return value
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from raccoonlab_tools.common.node import NodeInfo
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _CacheEntry:
+    info: NodeInfo
+    uptime_sec: int
+    seen_time: float    # time.monotonic() when uptime_sec has been received
+
+
+class NodeInfoCache:
+    """
+    NodeInfo of the nodes on one bus by node ID, kept in memory of the process.
+    The hardware and the software of a node can't change without a reboot, so an entry is valid
+    while the uptime of the node grows together with the local clock. The uptime must come from
+    a live NodeStatus or Heartbeat. After a reboot the node is asked again: if the unique ID and
+    the VCS commit are the same, the entry is kept, otherwise the board has been replaced or
+    reflashed and the entry is replaced.
+    """
+    UPTIME_TOLERANCE_SEC = 2    # the uptime resolution is 1 second and the message may be delayed
+
+    def __init__(self) -> None:
+        self._entries : Dict[int, _CacheEntry] = {}
+
+    def get(self, node_id : int, uptime_sec : Optional[int], seen_time : Optional[float] = None) -> Optional[NodeInfo]:
+        """
+        None means that there is no valid entry and the node should be asked.
+        seen_time is time.monotonic() when uptime_sec has been received, now by default.
+        """
+        entry = self._entries.get(node_id)
+        if entry is None or uptime_sec is None:
+            return None
+        seen_time = time.monotonic() if seen_time is None else seen_time
+        expected_uptime_sec = entry.uptime_sec + (seen_time - entry.seen_time)
+        if uptime_sec + NodeInfoCache.UPTIME_TOLERANCE_SEC < expected_uptime_sec:
+            return None     # the node has rebooted since the entry has been validated
+        entry.uptime_sec = uptime_sec
+        entry.seen_time = seen_time
+        return entry.info
+
+    def put(self, info : NodeInfo, uptime_sec : Optional[int], seen_time : Optional[float] = None) -> bool:
+        """Return True if there was another board or another firmware with the same node ID."""
+        previous = self._entries.get(info.node_id)
+        seen_time = time.monotonic() if seen_time is None else seen_time
+        uptime_sec = 0 if uptime_sec is None else uptime_sec
+        if previous is not None and NodeInfoCache.is_same_node(previous.info, info):
+            logger.debug(f"Node {info.node_id} has rebooted, {info.software_version} is the same")
+            previous.info = info
+            previous.uptime_sec = uptime_sec
+            previous.seen_time = seen_time
+            return False
+
+        self._entries[info.node_id] = _CacheEntry(info, uptime_sec, seen_time)
+        if previous is not None:
+            logger.warning(f"Node {info.node_id} has been replaced or reflashed: "
+                           f"{previous.info.hardware_version.unique_id} {previous.info.software_version} -> "
+                           f"{info.hardware_version.unique_id} {info.software_version}")
+        return previous is not None
+
+    def invalidate(self, node_id : Optional[int] = None) -> None:
+        """Forget the given node or all nodes if None."""
+        if node_id is None:
+            self._entries = {}
+        else:
+            self._entries.pop(node_id, None)
+
+    def get_all(self) -> List[NodeInfo]:
+        return [self._entries[node_id].info for node_id in sorted(self._entries)]
+
+    @staticmethod
+    def is_same_node(first : NodeInfo, second : NodeInfo) -> bool:
+        return first.hardware_version.unique_id == second.hardware_version.unique_id and \
+               first.software_version.vcs_commit == second.software_version.vcs_commit
@@ -75,7 +75,11 @@ class CanMessage:
 class CanProtocolParser:
     """
     Static class to find or verify which protocol is used on a given CAN-channel.
+    A detected protocol is cached per channel, so the following calls within the same process
+    neither reopen the CAN device nor wait for the traffic again.
     """
+    _detected_protocols = {}
+
     @staticmethod
     def find_protocol(transport=None, verbose=False) -> Protocol:
         """
@@ -87,7 +91,12 @@ class CanProtocolParser:
         if transport is None:
             transport = DeviceManager.get_device_port(verbose=verbose)
 
-        protocol = CanProtocolParser._parse_protocol(transport)
+        protocol = CanProtocolParser._detected_protocols.get(transport)
+        if protocol is None:
+            protocol = CanProtocolParser._parse_protocol(transport)
+            if protocol in [Protocol.CYPHAL, Protocol.DRONECAN]:
+                CanProtocolParser._detected_protocols[transport] = protocol
+
         if protocol == Protocol.NONE:
             print("[ERROR] CAN-node is offline.")
         elif protocol == Protocol.UNKNOWN:
@@ -118,10 +127,12 @@ class CanProtocolParser:
         - If CAN-node exists, it should send at least one 1-byte message within 1 second.
         - Max number of CAN-frames within 1 second is 5000
         """
-        if channel.startswith("slcan"):
+        if channel.startswith(("slcan", "can", "vcan")):
             config = {"interface": "socketcan", "channel": channel}
         elif channel.startswith("/dev/") or channel.startswith("COM"):
             config = {"interface": "slcan", "channel": channel, "ttyBaudrate": 1000000, "bitrate": 1000000}
+        elif channel.startswith("virtual:"):
+            config = {"interface": "virtual", "channel": channel[8:]}  # python-can in-process bus
         else:
             assert False, f"Unsupported interface {channel}"
 
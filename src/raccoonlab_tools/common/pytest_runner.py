@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Run test suites in the current process instead of spawning a new pytest process.
+
+The interpreter, the imported modules, the open node (DronecanNode / GlobalCyphalNode) and
+the detected protocol are shared by all suites run within the same pytest session.
+"""
+import os
+import re
+import sys
+import importlib.util
+from typing import Callable, Dict, List, Optional
+
+import pytest
+from raccoonlab_tools.common.inventory import TestResult
+
+DEFAULT_PYTEST_ARGS = ["-v", "-W", "ignore::DeprecationWarning"]
+
+SUITES = {
+    "cyphal-specification": "raccoonlab_tools.scripts.cyphal.test_specification",
+    "dronecan-specification": "raccoonlab_tools.scripts.dronecan.test_specification",
+    "dronecan-gps-mag-baro": "raccoonlab_tools.scripts.dronecan.test_gps_mag_baro",
+    "dronecan-lights": "raccoonlab_tools.scripts.dronecan.test_lights",
+    "dronecan-flash": "raccoonlab_tools.scripts.dronecan.test_flash",
+    "dronecan-pmu-buzzer": "raccoonlab_tools.scripts.dronecan.test_pmu_buzzer",
+    "dronecan-circuit-status": "raccoonlab_tools.rl_test_dronecan_circuit_status",
+}
+
+def run_tests(test_files : List[str], pytest_args : Optional[List[str]] = None, plugins : Optional[list] = None) -> int:
+    """
+    Run the given test files within a single pytest session and return the pytest exit code.
+    """
+    assert isinstance(test_files, list)
+    cmd = [os.path.abspath(test_file) for test_file in test_files] + DEFAULT_PYTEST_ARGS
+    if pytest_args is not None:
+        cmd += pytest_args
+    return int(pytest.main(cmd, plugins=plugins))
+
+
+class InventoryPlugin:
+    """
+    Record the outcomes of the tests parametrized by node ID (test_name[node42]) into the inventory.
+    get_uids maps the node IDs to the unique IDs at the end of the session.
+    """
+    NODE_ID_PATTERN = re.compile(r"\[node(\d+)\]")
+
+    def __init__(self, inventory, get_uids : Callable[[List[int]], Dict[int, str]]) -> None:
+        self._inventory = inventory
+        self._get_uids = get_uids
+        self._results = []
+
+    def pytest_runtest_logreport(self, report) -> None:
+        if report.when != "call" and report.passed:
+            return
+        match = InventoryPlugin.NODE_ID_PATTERN.search(report.nodeid)
+        if match is None:
+            return
+        test = InventoryPlugin.NODE_ID_PATTERN.sub("", report.nodeid.split("::", 1)[-1])
+        self._results.append(TestResult(test=test, outcome=report.outcome, node_id=int(match.group(1))))
+
+    def pytest_sessionfinish(self, session, exitstatus) -> None:
+        uids = self._get_uids(sorted({result.node_id for result in self._results})) if self._results else {}
+        for result in self._results:
+            result.uid = uids.get(result.node_id)
+        with self._inventory:
+            self._inventory.record_test_results(self._results)
+
+def get_suite_path(suite : str) -> str:
+    """Return the test file of a known suite without importing it."""
+    spec = importlib.util.find_spec(SUITES[suite])
+    if spec is None or spec.origin is None:
+        print(f"[ERROR] Test suite {suite} is not found.")
+        sys.exit(1)
+    return spec.origin
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2023-2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Message rate of a topic over a sliding window. It doesn't depend on the protocol.
+"""
+import time
+from typing import Optional
+
+class RateEstimator:
+    def __init__(self, window_size_sec=1.0) -> None:
+        self._timestamps = []
+        self._window_size_sec = window_size_sec
+
+    def register_message(self, timestamp : Optional[float] = None):
+        """timestamp is the current time by default, a recorded or synthetic one can be provided."""
+        if timestamp is None:
+            timestamp = time.time()
+        deadline = timestamp - self._window_size_sec
+        self._timestamps = [stamp for stamp in self._timestamps if stamp > deadline]
+        self._timestamps.append(timestamp)
+
+    def get_rate(self, timestamp : Optional[float] = None) -> int:
+        if timestamp is None:
+            timestamp = time.time()
+        deadline = timestamp - self._window_size_sec
+        self._timestamps = [stamp for stamp in self._timestamps if stamp > deadline]
+        return int(len(self._timestamps) / self._window_size_sec)
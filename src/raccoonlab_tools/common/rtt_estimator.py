@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Round trip time estimation of service requests to a node, the same way as TCP does (RFC 6298).
+The retransmission timeout adapts to the node: it is short for a fast node
+and long enough for a node that is busy, for example, writing flash.
+A node may answer one service in microseconds and another one in hundreds of milliseconds,
+so the RTT is estimated per node and per data type.
+"""
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+class RttEstimator:
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    INITIAL_TIMEOUT_SEC = 0.5
+    MIN_TIMEOUT_SEC = 0.02
+    MAX_TIMEOUT_SEC = 4.0
+
+    _estimators : Dict[Tuple[Hashable, int, Optional[str]], "RttEstimator"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self,
+                 node_id : Optional[int] = None,
+                 data_type : Optional[str] = None,
+                 min_timeout : float = MIN_TIMEOUT_SEC) -> None:
+        self.node_id = node_id
+        self.data_type = data_type
+        self.min_timeout = min_timeout
+        self.srtt : Optional[float] = None
+        self.rttvar : Optional[float] = None
+        self.timeout = max(RttEstimator.INITIAL_TIMEOUT_SEC, min_timeout)
+        self.last_rtt : Optional[float] = None
+        self.min_rtt : Optional[float] = None
+        self.max_rtt : Optional[float] = None
+        self.number_of_samples = 0
+        self.number_of_timeouts = 0
+
+    @staticmethod
+    def get(node_id : int,
+            bus : Hashable = None,
+            data_type : Optional[str] = None,
+            min_timeout : float = MIN_TIMEOUT_SEC) -> "RttEstimator":
+        """
+        Estimators are shared by all service clients, because the RTT is a property of the node
+        and of the service. The same node ID may be used on several buses at once, so the bus
+        is a part of the key. min_timeout is applied when the estimator is created.
+        """
+        key = (bus, node_id, data_type)
+        with RttEstimator._lock:
+            if key not in RttEstimator._estimators:
+                RttEstimator._estimators[key] = RttEstimator(node_id, data_type, min_timeout)
+            return RttEstimator._estimators[key]
+
+    @staticmethod
+    def get_all() -> Dict[Tuple[Hashable, int, Optional[str]], "RttEstimator"]:
+        with RttEstimator._lock:
+            return dict(RttEstimator._estimators)
+
+    def on_response(self, rtt : float) -> None:
+        """
+        Add an RTT sample. According to Karn's algorithm, the caller must not sample
+        a response to a retransmitted request, because it is unknown which request it answers.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RttEstimator.BETA) * self.rttvar + RttEstimator.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RttEstimator.ALPHA) * self.srtt + RttEstimator.ALPHA * rtt
+        self.timeout = self._clamp(self.srtt + RttEstimator.K * self.rttvar)
+
+        self.last_rtt = rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+        self.number_of_samples += 1
+
+    def on_timeout(self, timeout : Optional[float] = None) -> None:
+        """
+        Exponential backoff. It stays until the next sample.
+        timeout is the timeout of the expired request: when several requests sent with the same
+        timeout expire together, the timeout is doubled only once.
+        """
+        if timeout is None or timeout >= self.timeout:
+            self.timeout = self._clamp(self.timeout * 2)
+        self.number_of_timeouts += 1
+
+    def __str__(self) -> str:
+        name = f"node {self.node_id}" if self.data_type is None else f"node {self.node_id} {self.data_type}"
+        if self.srtt is None:
+            return f"{name}: no responses, timeouts: {self.number_of_timeouts}"
+        return (f"{name}: srtt {self.srtt * 1000 :.1f} ms, "
+                f"rttvar {self.rttvar * 1000 :.1f} ms, "
+                f"min/max {self.min_rtt * 1000 :.1f}/{self.max_rtt * 1000 :.1f} ms, "
+                f"timeout {self.timeout * 1000 :.0f} ms, "
+                f"responses: {self.number_of_samples}, timeouts: {self.number_of_timeouts}")
+
+    def _clamp(self, timeout : float) -> float:
+        return min(max(timeout, self.min_timeout), max(RttEstimator.MAX_TIMEOUT_SEC, self.min_timeout))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Transfer-ID gap analysis per stream, where a stream is a source node, a port and a destination.
+
+A transmitter increments the 5-bit transfer-ID of a stream by one with each transfer, so a jump
+of the transfer-ID means lost transfers. If only one node loses transfers, the node drops them;
+if all streams lose transfers at the same time, the frames are dropped by the CAN adapter.
+
+For each stream the analyser counts:
+- lost: the transfer-IDs skipped between two received transfers,
+- duplicates: the same transfer-ID again (a redundant interface or a retransmission),
+- out of order: a transfer-ID counted as lost that arrives late (the frames have been reordered),
+- broken: multi-frame transfers with a missing frame (a wrong toggle bit or no end of transfer),
+- resyncs: silence long enough for the transfer-ID to wrap around, the jump is not counted.
+A node reboot restarts its transfer-IDs, so it may look like a single gap.
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set
+from dataclasses import dataclass, field, replace
+
+from raccoonlab_tools.common.capture import CapturedFrame
+from raccoonlab_tools.common.protocol_parser import Protocol, TailByte
+
+TRANSFER_ID_MODULO = 32
+INTERVAL_SMOOTHING = 1 / 8
+REORDER_WINDOW = 8      # how far back a late or a duplicated transfer-ID is recognized
+
+@dataclass(frozen=True)
+class StreamKey:
+    protocol: Protocol
+    source_node_id: int
+    kind: str                   # message, request or response
+    port_id: int                # data type ID (DroneCAN), subject or service ID (Cyphal)
+    destination_node_id: Optional[int] = None
+
+    @staticmethod
+    def from_can_id(protocol : Protocol, can_id : int) -> Optional["StreamKey"]:
+        """None for the anonymous transfers, they have no meaningful stream."""
+        if protocol == Protocol.DRONECAN:
+            source_node_id = can_id & 0x7F
+            if can_id & 0x80:
+                kind = "request" if can_id & 0x8000 else "response"
+                return StreamKey(protocol, source_node_id, kind, (can_id >> 16) & 0xFF, (can_id >> 8) & 0x7F)
+            if source_node_id == 0:
+                return None
+            return StreamKey(protocol, source_node_id, "message", (can_id >> 8) & 0xFFFF)
+
+        source_node_id = can_id & 0x7F
+        if can_id & (1 << 25):
+            kind = "request" if can_id & (1 << 24) else "response"
+            return StreamKey(protocol, source_node_id, kind, (can_id >> 14) & 0x1FF, (can_id >> 7) & 0x7F)
+        if can_id & (1 << 24):
+            return None
+        return StreamKey(protocol, source_node_id, "message", (can_id >> 8) & 0x1FFF)
+
+    def __str__(self) -> str:
+        string = f"node {self.source_node_id :>3} {self.kind :<8} {self.port_id :>5}"
+        if self.destination_node_id is not None:
+            string += f" -> {self.destination_node_id}"
+        return string
+
+
+@dataclass
+class StreamStats:
+    key: StreamKey
+    transfers: int = 0
+    lost: int = 0
+    duplicates: int = 0
+    out_of_order: int = 0
+    broken: int = 0
+    resyncs: int = 0
+    last_transfer_id: Optional[int] = None
+    last_timestamp: Optional[float] = None
+    interval: Optional[float] = None    # smoothed time between the transfers, sec
+
+    @property
+    def loss_rate(self) -> float:
+        expected = self.transfers + self.lost
+        return self.lost / expected if expected else 0.0
+
+    def format_counters(self) -> str:
+        return (f"{self.transfers} transfers, lost {self.lost} ({self.loss_rate * 100 :.2f}%), "
+                f"duplicates {self.duplicates}, out of order {self.out_of_order}, broken {self.broken}, "
+                f"resyncs {self.resyncs}")
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.format_counters()}"
+
+
+@dataclass
+class _TransferState:
+    transfer_id: int
+    expected_toggle: bool
+
+
+@dataclass
+class _StreamHistory:
+    received: Deque[int] = field(default_factory=lambda: deque(maxlen=REORDER_WINDOW))
+    lost: Set[int] = field(default_factory=set)     # the transfer-IDs counted as lost since the last cycle
+
+
+class TransferIdAnalyzer:
+    """
+    Streaming analyser: feed it with the frames in the order of reception.
+    It is thread-safe, so a capture callback may feed it while another thread reads the stats.
+    """
+    def __init__(self, protocol : Protocol) -> None:
+        assert protocol in [Protocol.DRONECAN, Protocol.CYPHAL]
+        self.protocol = protocol
+        self._streams : Dict[StreamKey, StreamStats] = {}
+        self._transfers : Dict[StreamKey, _TransferState] = {}  # multi-frame transfers in progress
+        self._orphan_transfer_ids : Dict[StreamKey, int] = {}
+        self._histories : Dict[StreamKey, _StreamHistory] = {}
+        self._lock = threading.Lock()
+
+    def on_frame(self, timestamp : float, can_id : int, data : bytes) -> None:
+        if len(data) == 0:
+            return
+        key = StreamKey.from_can_id(self.protocol, can_id)
+        if key is None:
+            return
+        tail_byte = TailByte(data[-1])
+        with self._lock:
+            stats = self._streams.get(key)
+            if stats is None:
+                stats = StreamStats(key)
+                self._streams[key] = stats
+                self._histories[key] = _StreamHistory()
+            self._process_frame(stats, timestamp, tail_byte)
+
+    def on_captured_frame(self, frame : CapturedFrame) -> None:
+        if frame.extended:
+            self.on_frame(frame.timestamp, frame.can_id, frame.data)
+
+    def process(self, frames : Iterable[CapturedFrame]) -> "TransferIdAnalyzer":
+        for frame in frames:
+            self.on_captured_frame(frame)
+        return self
+
+    def get_stats(self, source_node_id : Optional[int] = None) -> List[StreamStats]:
+        """A copy of the stats of all streams or of the streams of one node."""
+        with self._lock:
+            streams = [replace(stats) for stats in self._streams.values()
+                       if source_node_id is None or stats.key.source_node_id == source_node_id]
+        return sorted(streams, key=lambda stats: (stats.key.source_node_id, stats.key.kind, stats.key.port_id))
+
+    def get_total(self, source_node_id : Optional[int] = None) -> StreamStats:
+        """The sum of the counters of all streams, the key describes no real stream."""
+        total = StreamStats(StreamKey(self.protocol, -1 if source_node_id is None else source_node_id, "all", -1))
+        for stats in self.get_stats(source_node_id):
+            total.transfers += stats.transfers
+            total.lost += stats.lost
+            total.duplicates += stats.duplicates
+            total.out_of_order += stats.out_of_order
+            total.broken += stats.broken
+            total.resyncs += stats.resyncs
+        return total
+
+    def _process_frame(self, stats : StreamStats, timestamp : float, tail_byte : TailByte) -> None:
+        key = stats.key
+        transfer = self._transfers.get(key)
+
+        if not tail_byte.sot:
+            if transfer is not None and tail_byte.transfer_id != transfer.transfer_id:
+                stats.broken += 1   # the end of the transfer in progress is lost
+                del self._transfers[key]
+                transfer = None
+            if transfer is None:
+                # The start of the transfer is lost. Count it once, not for every remaining frame
+                if self._orphan_transfer_ids.get(key) != tail_byte.transfer_id:
+                    self._orphan_transfer_ids[key] = tail_byte.transfer_id
+                    stats.broken += 1
+            elif tail_byte.toggle != transfer.expected_toggle:
+                stats.broken += 1   # a frame in the middle is lost
+                del self._transfers[key]
+                self._orphan_transfer_ids[key] = tail_byte.transfer_id
+            elif tail_byte.eot:
+                del self._transfers[key]
+            else:
+                transfer.expected_toggle = not transfer.expected_toggle
+            return
+
+        if transfer is not None:
+            stats.broken += 1   # the end of the previous transfer is lost
+            del self._transfers[key]
+        self._orphan_transfer_ids.pop(key, None)
+        if not tail_byte.eot:
+            # The first frame toggle is 0 in DroneCAN and 1 in Cyphal
+            self._transfers[key] = _TransferState(tail_byte.transfer_id, not tail_byte.toggle)
+        self._on_transfer(stats, timestamp, tail_byte.transfer_id)
+
+    def _on_transfer(self, stats : StreamStats, timestamp : float, transfer_id : int) -> None:
+        history = self._histories[stats.key]
+        if stats.last_transfer_id is None:
+            self._on_new_transfer(stats, history, timestamp, transfer_id)
+            return
+
+        elapsed = timestamp - stats.last_timestamp
+        distance = (transfer_id - stats.last_transfer_id) % TRANSFER_ID_MODULO
+        if stats.interval is not None and elapsed > (TRANSFER_ID_MODULO - 1) * stats.interval:
+            # The transfer-ID could have wrapped around any number of times
+            stats.resyncs += 1
+            history.lost.clear()
+            self._on_new_transfer(stats, history, timestamp, transfer_id)
+            return
+
+        if distance == 0:
+            stats.duplicates += 1
+            return
+
+        # A transfer-ID a few steps back is either a late one or a burst loss of almost a full cycle.
+        # The transmitter needs about distance intervals for the burst, a late transfer comes at once
+        is_recent = TRANSFER_ID_MODULO - distance <= REORDER_WINDOW and \
+                    (stats.interval is None or elapsed < distance * stats.interval / 2)
+        if is_recent and transfer_id in history.lost:
+            history.lost.discard(transfer_id)
+            stats.lost -= 1
+            stats.out_of_order += 1
+            return
+        if is_recent and transfer_id in history.received:
+            stats.duplicates += 1
+            return
+
+        skipped = [(stats.last_transfer_id + step) % TRANSFER_ID_MODULO for step in range(1, distance)]
+        stats.lost += len(skipped)
+        history.lost.update(skipped)
+        interval = max(elapsed, 0.0) / distance
+        stats.interval = interval if stats.interval is None else \
+                         (1 - INTERVAL_SMOOTHING) * stats.interval + INTERVAL_SMOOTHING * interval
+        self._on_new_transfer(stats, history, timestamp, transfer_id)
+
+    @staticmethod
+    def _on_new_transfer(stats : StreamStats, history : _StreamHistory, timestamp : float, transfer_id : int) -> None:
+        """Only the new in-order transfers are counted, so the late ones don't inflate the loss rate base."""
+        stats.transfers += 1
+        stats.last_transfer_id = transfer_id
+        stats.last_timestamp = timestamp
+        history.received.append(transfer_id)
+        history.lost.discard(transfer_id)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Cyphal part of the offline capture decoder, see common/capture_decoder.py.
+
+The data types of the ports with a fixed ID (Heartbeat, GetInfo, register.Access, etc.)
+are found in the compiled uavcan namespace. The types of the other subjects are configured
+by the node registers, so they should be provided explicitly.
+"""
+import re
+import pkgutil
+import functools
+import importlib
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+import pycyphal.dsdl
+from pycyphal.transport import Timestamp, MessageDataSpecifier, ServiceDataSpecifier, TransferTrace, ErrorTrace
+from pycyphal.transport.can import CANCapture, CANTracer
+from pycyphal.transport.can.media import DataFrame, FrameFormat
+
+from raccoonlab_tools.common.binary_capture import get_lengths, ns_to_sec
+from raccoonlab_tools.common.capture_decoder import DecodedCapture, flatten
+
+TYPE_MODULE_PATTERN = re.compile(r'^[A-Z]\w*_\d+_\d+$')
+TYPE_NAME_PATTERN = re.compile(r'^(.+)\.(\w+)\.(\d+)\.(\d+)$')
+
+def import_type(name : str) -> type:
+    """Both uavcan.node.Heartbeat.1.0 and uavcan.node.Heartbeat_1_0 are accepted."""
+    match = TYPE_NAME_PATTERN.match(name)
+    if match is not None:
+        namespace, short_name, major, minor = match.groups()
+        name = f"{namespace}.{short_name}_{major}_{minor}"
+    module_name, short_name = name.rsplit(".", 1)
+    module = importlib.import_module(name)
+    data_type = getattr(module, short_name, None)
+    if data_type is None:
+        raise ValueError(f"{short_name} is not found in {module_name}")
+    return data_type
+
+@functools.lru_cache(maxsize=None)
+def get_fixed_port_types() -> Tuple[Dict[int, type], Dict[int, type]]:
+    """Return (subject ID -> message type, service ID -> service type) of the uavcan namespace."""
+    import uavcan  # pylint: disable=import-error
+    subjects, services = {}, {}
+    for module_info in pkgutil.walk_packages(uavcan.__path__, "uavcan."):
+        short_name = module_info.name.rsplit(".", 1)[-1]
+        if module_info.ispkg or not TYPE_MODULE_PATTERN.match(short_name):
+            continue
+        data_type = getattr(importlib.import_module(module_info.name), short_name, None)
+        port_id = None if data_type is None else pycyphal.dsdl.get_fixed_port_id(data_type)
+        if port_id is None:
+            continue
+        if pycyphal.dsdl.is_service_type(data_type):
+            services[port_id] = data_type
+        else:
+            subjects[port_id] = data_type
+    return subjects, services
+
+
+class CyphalStreamDecoder:
+    """
+    Reassemble the transfers with the pycyphal CAN tracer and decode them with the compiled DSDL.
+    """
+    def __init__(self, subject_types : Optional[Dict[int, str]] = None) -> None:
+        subjects, services = get_fixed_port_types()
+        self._subjects = dict(subjects)
+        self._services = services
+        for subject_id, name in (subject_types or {}).items():
+            self._subjects[subject_id] = import_type(name)
+
+    def decode(self, chunks : Iterable[np.ndarray]) -> DecodedCapture:
+        decoded = DecodedCapture()
+        tracer = CANTracer()
+        for records in chunks:
+            decoded.number_of_frames += len(records)
+            for record, length in zip(records, get_lengths(records)):
+                timestamp_ns = int(record["timestamp_ns"])
+                capture = CANCapture(Timestamp(system_ns=timestamp_ns, monotonic_ns=timestamp_ns),
+                                     DataFrame(FrameFormat.EXTENDED,
+                                               int(record["can_id"]),
+                                               bytearray(record["data"][:length].tobytes())),
+                                     own=False)
+                trace = tracer.update(capture)
+                if isinstance(trace, TransferTrace):
+                    self._decode_transfer(ns_to_sec(timestamp_ns), trace, decoded)
+                elif isinstance(trace, ErrorTrace):
+                    decoded.number_of_errors += 1
+        return decoded
+
+    def _decode_transfer(self, timestamp : float, trace : TransferTrace, decoded : DecodedCapture) -> None:
+        specifier = trace.transfer.metadata.session_specifier
+        data_specifier = specifier.data_specifier
+        row = {
+            "timestamp": timestamp,
+            "source_node_id": specifier.source_node_id,
+            "transfer_id": trace.transfer.metadata.transfer_id,
+        }
+
+        if isinstance(data_specifier, MessageDataSpecifier):
+            data_type = self._subjects.get(data_specifier.subject_id)
+        else:
+            assert isinstance(data_specifier, ServiceDataSpecifier)
+            service_type = self._services.get(data_specifier.service_id)
+            is_request = data_specifier.role == ServiceDataSpecifier.Role.REQUEST
+            data_type = None if service_type is None else \
+                        service_type.Request if is_request else service_type.Response
+            row["destination_node_id"] = specifier.destination_node_id
+
+        msg = None if data_type is None else pycyphal.dsdl.deserialize(data_type, trace.transfer.fragmented_payload)
+        if msg is None:
+            decoded.number_of_errors += 1
+            return
+        flatten(pycyphal.dsdl.to_builtin(msg), "", row)
+        decoded.add_row(str(pycyphal.dsdl.get_model(data_type)), row)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import pycyphal
+# pylint: disable=import-error
+import uavcan.file
+import uavcan.node
+import uavcan.primitive
+
+from raccoonlab_tools.common.firmware_update import FirmwareImage, \
+                                                    NodeUpdateProgress, \
+                                                    UpdateState, \
+                                                    format_summary, \
+                                                    print_progress
+
+logger = logging.getLogger(__name__)
+
+class FirmwareUpdater:
+    """
+    Update the firmware of several nodes concurrently with uavcan.node.ExecuteCommand
+    COMMAND_BEGIN_SOFTWARE_UPDATE. The local node serves uavcan.file.Read from a memory mapped image.
+    A node is updated when it has read the whole image and its Heartbeat is operational again.
+    """
+    READ_SIZE = 256
+    MAX_PATH_LENGTH = 255
+    READ_TIMEOUT_SEC = 10.0
+    REQUEST_ATTEMPTS = 3
+    PROGRESS_PERIOD_SEC = 1.0
+
+    def __init__(self, cyphal_node, image : FirmwareImage, remote_path : Optional[str] = None) -> None:
+        self.node = cyphal_node
+        self.image = image
+        if remote_path is None:
+            remote_path = os.path.basename(image.path)
+        self.remote_path = remote_path.encode()[:FirmwareUpdater.MAX_PATH_LENGTH]
+        self._progresses : Dict[int, NodeUpdateProgress] = {}
+
+        self._read_server = self.node.get_server(uavcan.file.Read_1_1)
+        self._read_server.serve_in_background(self._on_read)
+        self._heartbeat_sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
+        self._heartbeat_sub.receive_in_background(self._on_heartbeat)
+
+    async def update(self, node_ids : List[int], timeout_sec : float = 120.0, verbose : bool = True) -> List[NodeUpdateProgress]:
+        """Request the update of all nodes at once and serve them until all are done or timeout."""
+        self._progresses = {node_id : NodeUpdateProgress(node_id, self.image.size) for node_id in node_ids}
+        await asyncio.gather(*(self._request_update(node_id) for node_id in node_ids))
+
+        end_time = time.time() + timeout_sec
+        next_print_time = time.time() + FirmwareUpdater.PROGRESS_PERIOD_SEC
+        while time.time() < end_time and not all(progress.is_done for progress in self._progresses.values()):
+            await asyncio.sleep(0.05)
+            self._check_read_timeouts()
+            if verbose and time.time() >= next_print_time:
+                next_print_time += FirmwareUpdater.PROGRESS_PERIOD_SEC
+                print(f"[INFO] {format_summary(self._progresses.values())}")
+
+        for progress in self._progresses.values():
+            if not progress.is_done:
+                progress.fail("timeout")
+        if verbose:
+            print("Summary:")
+            print_progress(self._progresses.values())
+        return list(self._progresses.values())
+
+    def close(self) -> None:
+        self._read_server.close()
+        self._heartbeat_sub.close()
+
+    async def _request_update(self, node_id : int) -> None:
+        progress = self._progresses[node_id]
+        request = uavcan.node.ExecuteCommand_1_1.Request(
+            command=uavcan.node.ExecuteCommand_1_1.Request.COMMAND_BEGIN_SOFTWARE_UPDATE,
+            parameter=self.remote_path
+        )
+        client = self.node.make_client(uavcan.node.ExecuteCommand_1_1, node_id)
+        response = None
+        for _ in range(FirmwareUpdater.REQUEST_ATTEMPTS):
+            response = await client.call(request)
+            # A node may reboot into the bootloader without a response, so retry only until it reads
+            if response is not None or progress.state != UpdateState.REQUESTED:
+                break
+        client.close()
+
+        if response is None:
+            if progress.state == UpdateState.REQUESTED:
+                progress.fail("no response")
+        elif response[0].status != uavcan.node.ExecuteCommand_1_1.Response.STATUS_SUCCESS:
+            progress.fail(f"status {response[0].status}")
+
+    async def _on_read(self,
+                       request : uavcan.file.Read_1_1.Request,
+                       metadata : pycyphal.presentation.ServiceRequestMetadata,
+                       ) -> uavcan.file.Read_1_1.Response:
+        if request.path.path.tobytes() != self.remote_path:
+            return uavcan.file.Read_1_1.Response(error=uavcan.file.Error_1_0(uavcan.file.Error_1_0.NOT_FOUND))
+
+        data = self.image.read(request.offset, FirmwareUpdater.READ_SIZE)
+        progress = self._progresses.get(metadata.client_node_id)
+        if progress is not None and not progress.is_done:
+            progress.on_read(request.offset, len(data))
+        return uavcan.file.Read_1_1.Response(data=uavcan.primitive.Unstructured_1_0(data))
+
+    async def _on_heartbeat(self, msg : uavcan.node.Heartbeat_1_0, transfer_from : pycyphal.transport.TransferFrom) -> None:
+        progress = self._progresses.get(transfer_from.source_node_id)
+        if progress is None or progress.is_done or progress.bytes_read < self.image.size:
+            return
+        if msg.mode.value == uavcan.node.Mode_1_0.OPERATIONAL:
+            logger.info(f"Node {progress.node_id} is operational after the update")
+            progress.finish()
+
+    def _check_read_timeouts(self) -> None:
+        now = time.time()
+        for progress in self._progresses.values():
+            if progress.state == UpdateState.IN_PROGRESS and progress.bytes_read < self.image.size and \
+                    now - progress.last_read_time > FirmwareUpdater.READ_TIMEOUT_SEC:
+                progress.fail("read timeout")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Publish repeating Cyphal messages without serializing them again.
+
+The serialized fragments of a message are cached per field values and sent directly to the
+publisher's transport session with the next transfer ID of the publisher.
+"""
+import asyncio
+import collections
+from typing import Any, Callable, Dict, Hashable, List, Union
+
+import pycyphal.dsdl
+import pycyphal.presentation
+import pycyphal.transport
+
+class CachedPublisher:
+    def __init__(self, publisher : pycyphal.presentation.Publisher, max_size : int = 256) -> None:
+        self.publisher = publisher
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fragments : Dict[Hashable, List[memoryview]] = collections.OrderedDict()
+
+    async def publish(self, message : Union[Any, Callable], key : Hashable = None) -> bool:
+        """
+        message is either a Cyphal message or a function that creates it.
+        By default, the key is built from the message field values. With an explicit key, a function
+        is called only on a cache miss, so a cache hit doesn't create any message at all.
+        Building the key walks all message fields and costs about as much as the serialization
+        itself, so hot loops should pass an explicit key.
+        """
+        if key is None:
+            message = message() if callable(message) else message
+            key = str(pycyphal.dsdl.to_builtin(message))
+
+        fragments = self._fragments.get(key)
+        if fragments is None:
+            self.misses += 1
+            message = message() if callable(message) else message
+            fragments = list(pycyphal.dsdl.serialize(message))
+            self._fragments[key] = fragments
+            if len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+        else:
+            self.hits += 1
+            self._fragments.move_to_end(key)
+
+        transfer = pycyphal.transport.Transfer(
+            timestamp=pycyphal.transport.Timestamp.now(),
+            priority=self.publisher.priority,
+            transfer_id=self.publisher.transfer_id_counter.get_then_increment(),
+            fragmented_payload=fragments,
+        )
+        deadline = asyncio.get_running_loop().time() + self.publisher.send_timeout
+        return await self.publisher.transport_session.send(transfer, deadline)
+
+    def clear(self) -> None:
+        self._fragments.clear()
+
+    def close(self) -> None:
+        self.publisher.close()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+
+import pycyphal.application
+# pylint: disable=import-error
+import uavcan.node.GetInfo_1_0
+import uavcan.node.Mode_1_0
+import uavcan.node.Version_1_0
+
+class GlobalCyphalNode:
+    """
+    Let's create a Cyphal node once and reuse it for all tests.
+    The node is bound to the event loop it has been created in, so all suites that share it
+    should be run within the same pytest session.
+    """
+    cyphal_node = None
+
+    @staticmethod
+    def get_node() -> pycyphal.application._node.Node:
+        if GlobalCyphalNode.cyphal_node is not None:
+            return GlobalCyphalNode.cyphal_node
+
+        GlobalCyphalNode.cyphal_node = GlobalCyphalNode.create_node()
+        return GlobalCyphalNode.cyphal_node
+
+    @staticmethod
+    def close() -> None:
+        """Release the transport, for example before the bus is accessed from another event loop."""
+        if GlobalCyphalNode.cyphal_node is not None:
+            GlobalCyphalNode.cyphal_node.close()
+            GlobalCyphalNode.cyphal_node = None
+
+    @staticmethod
+    def create_node() -> pycyphal.application._node.Node:
+        cyphal_node = pycyphal.application.make_node(
+            uavcan.node.GetInfo_1_0.Response(
+                uavcan.node.Version_1_0(major=1, minor=0),
+                name="co.raccoonlab.spec_checker"
+        ))
+
+        cyphal_node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
+        cyphal_node.start()
+        return cyphal_node
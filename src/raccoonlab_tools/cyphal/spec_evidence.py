@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Evidence store for the Cyphal specification checker.
+
+The passive observations (Heartbeat, port.List) and the active queries (GetInfo, register.List,
+register.Access of the port registers) are started concurrently, so collecting the evidence takes
+as long as the longest observation window instead of the sum of them.
+
+The same evidence can be reconstructed from a recorded capture, so the passive checks can be
+performed offline using the recorded timestamps.
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass, field
+
+import pycyphal.dsdl
+from pycyphal.transport import Timestamp, MessageDataSpecifier, ServiceDataSpecifier, TransferTrace
+from pycyphal.transport.can import CANCapture, CANTracer
+from pycyphal.transport.can.media import DataFrame, FrameFormat
+
+# pylint: disable=import-error
+import uavcan.node.GetInfo_1_0
+import uavcan.node.Heartbeat_1_0
+import uavcan.node.port.List_1_0
+import uavcan.register.Access_1_0
+import uavcan.register.List_1_0
+import uavcan.register.Name_1_0
+
+from raccoonlab_tools.common.capture import CapturedFrame
+from raccoonlab_tools.cyphal.utils import RegisterInterface, PortRegisterInterface, _np_array_to_string
+
+HEARTBEAT_WINDOW_SEC = 5.5
+PORT_LIST_TIMEOUT_SEC = 10.1
+
+@dataclass
+class SpecEvidence:
+    """
+    Everything the passive specification checks need to know about a single node.
+    None means that the corresponding data has not been observed.
+    """
+    node_id : Optional[int] = None
+    heartbeat_timestamps : List[float] = field(default_factory=list)
+    heartbeat_uptimes : List[int] = field(default_factory=list)
+    get_info : Optional[uavcan.node.GetInfo_1_0.Response] = None
+    port_list : Optional[uavcan.node.port.List_1_0] = None
+    register_names : List[str] = field(default_factory=list)
+    register_values : Dict[str, uavcan.register.Access_1_0.Response] = field(default_factory=dict)
+    from_capture : bool = False
+
+    @property
+    def name(self) -> str:
+        if self.get_info is None:
+            return ""
+        return "".join([chr(item) for item in self.get_info.name])
+
+
+class EvidenceCollector:
+    """
+    Collect SpecEvidence of live nodes.
+    """
+    def __init__(self, cyphal_node) -> None:
+        self.node = cyphal_node
+
+    async def collect(self, dest_node_id : int) -> SpecEvidence:
+        assert isinstance(dest_node_id, int)
+
+        evidence = SpecEvidence(node_id=dest_node_id)
+        await asyncio.gather(
+            self._collect_heartbeats(evidence),
+            self._collect_get_info(evidence),
+            self._collect_port_list(evidence),
+            self._collect_registers(evidence),
+        )
+        return evidence
+
+    async def collect_many(self, dest_node_ids : Iterable[int]) -> Dict[int, SpecEvidence]:
+        """Collect the evidence of all nodes concurrently. Return a dictionary: node ID -> SpecEvidence."""
+        dest_node_ids = list(dest_node_ids)
+        evidences = await asyncio.gather(*[self.collect(node_id) for node_id in dest_node_ids])
+        return dict(zip(dest_node_ids, evidences))
+
+    async def _collect_heartbeats(self, evidence : SpecEvidence) -> None:
+        sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
+        end_time = time.time() + HEARTBEAT_WINDOW_SEC
+        time_left = HEARTBEAT_WINDOW_SEC
+        while time_left > 0:
+            transfer = await sub.receive_for(time_left)
+            if transfer is not None and transfer[1].source_node_id == evidence.node_id:
+                evidence.heartbeat_timestamps.append(float(transfer[1].timestamp.monotonic))
+                evidence.heartbeat_uptimes.append(transfer[0].uptime)
+            time_left = end_time - time.time()
+        sub.close()
+
+    async def _collect_get_info(self, evidence : SpecEvidence) -> None:
+        client = self.node.make_client(uavcan.node.GetInfo_1_0, evidence.node_id)
+        response = await client.call(uavcan.node.GetInfo_1_0.Request())
+        client.close()
+        if response is not None:
+            evidence.get_info = response[0]
+        else:
+            logging.warning(f"Node {evidence.node_id} has not respond to GetInfo request.")
+
+    async def _collect_port_list(self, evidence : SpecEvidence) -> None:
+        sub = self.node.make_subscriber(uavcan.node.port.List_1_0)
+        end_time = time.time() + PORT_LIST_TIMEOUT_SEC
+        time_left = PORT_LIST_TIMEOUT_SEC
+        while time_left > 0:
+            transfer = await sub.receive_for(time_left)
+            if transfer is not None and transfer[1].source_node_id == evidence.node_id:
+                evidence.port_list = transfer[0]
+                break
+            time_left = end_time - time.time()
+        sub.close()
+
+    async def _collect_registers(self, evidence : SpecEvidence) -> None:
+        evidence.register_names = await RegisterInterface(self.node).register_list(evidence.node_id)
+
+        port_registers = [name for name in evidence.register_names
+                          if PortRegisterInterface.is_port_id(name) or
+                             PortRegisterInterface.is_port_type(name)]
+
+        client = self.node.make_client(uavcan.register.Access_1_0, evidence.node_id)
+        for register_name in port_registers:
+            request = uavcan.register.Access_1_0.Request(name=uavcan.register.Name_1_0(register_name))
+            response = await client.call(request)
+            if response is not None:
+                evidence.register_values[register_name] = response[0]
+        client.close()
+
+
+class CaptureEvidenceCollector:
+    """
+    Reconstruct SpecEvidence of every node found in a recorded capture.
+    Only the data that has actually been recorded is available: GetInfo, register.List and
+    register.Access are filled in only if somebody has requested them during the recording.
+    """
+    HEARTBEAT_SUBJECT_ID = 7509
+    PORT_LIST_SUBJECT_ID = 7510
+    REGISTER_ACCESS_SERVICE_ID = 384
+    REGISTER_LIST_SERVICE_ID = 385
+    GET_INFO_SERVICE_ID = 430
+
+    def __init__(self) -> None:
+        self._evidences : Dict[int, SpecEvidence] = {}
+        self._pending_access_requests : Dict[tuple, str] = {}
+
+    def collect(self, frames : Iterable[CapturedFrame]) -> Dict[int, SpecEvidence]:
+        """Return a dictionary: node ID -> SpecEvidence."""
+        tracer = CANTracer()
+        for frame in frames:
+            if not frame.extended:
+                continue
+            timestamp_ns = int(frame.timestamp * 1e9)
+            capture = CANCapture(Timestamp(system_ns=timestamp_ns, monotonic_ns=timestamp_ns),
+                                 DataFrame(FrameFormat.EXTENDED, frame.can_id, bytearray(frame.data)),
+                                 own=False)
+            trace = tracer.update(capture)
+            if isinstance(trace, TransferTrace):
+                self._process_transfer(frame.timestamp, trace)
+
+        return self._evidences
+
+    def _process_transfer(self, timestamp : float, trace : TransferTrace) -> None:
+        specifier = trace.transfer.metadata.session_specifier
+        source_node_id = specifier.source_node_id
+        if source_node_id is None:
+            return
+        payload = trace.transfer.fragmented_payload
+        transfer_id = trace.transfer.metadata.transfer_id
+        data_specifier = specifier.data_specifier
+
+        if isinstance(data_specifier, MessageDataSpecifier):
+            if data_specifier.subject_id == self.HEARTBEAT_SUBJECT_ID:
+                msg = pycyphal.dsdl.deserialize(uavcan.node.Heartbeat_1_0, payload)
+                if msg is not None:
+                    evidence = self._get_evidence(source_node_id)
+                    evidence.heartbeat_timestamps.append(timestamp)
+                    evidence.heartbeat_uptimes.append(msg.uptime)
+            elif data_specifier.subject_id == self.PORT_LIST_SUBJECT_ID:
+                msg = pycyphal.dsdl.deserialize(uavcan.node.port.List_1_0, payload)
+                if msg is not None:
+                    self._get_evidence(source_node_id).port_list = msg
+            return
+
+        assert isinstance(data_specifier, ServiceDataSpecifier)
+        is_request = data_specifier.role == ServiceDataSpecifier.Role.REQUEST
+        server_node_id = specifier.destination_node_id if is_request else source_node_id
+        client_node_id = source_node_id if is_request else specifier.destination_node_id
+        service_id = data_specifier.service_id
+
+        if service_id == self.GET_INFO_SERVICE_ID and not is_request:
+            response = pycyphal.dsdl.deserialize(uavcan.node.GetInfo_1_0.Response, payload)
+            if response is not None:
+                self._get_evidence(server_node_id).get_info = response
+        elif service_id == self.REGISTER_LIST_SERVICE_ID and not is_request:
+            response = pycyphal.dsdl.deserialize(uavcan.register.List_1_0.Response, payload)
+            if response is not None:
+                register_name = _np_array_to_string(response.name.name)
+                evidence = self._get_evidence(server_node_id)
+                if len(register_name) != 0 and register_name not in evidence.register_names:
+                    evidence.register_names.append(register_name)
+        elif service_id == self.REGISTER_ACCESS_SERVICE_ID:
+            key = (client_node_id, server_node_id, transfer_id)
+            if is_request:
+                request = pycyphal.dsdl.deserialize(uavcan.register.Access_1_0.Request, payload)
+                if request is not None:
+                    self._pending_access_requests[key] = _np_array_to_string(request.name.name)
+            elif key in self._pending_access_requests:
+                response = pycyphal.dsdl.deserialize(uavcan.register.Access_1_0.Response, payload)
+                register_name = self._pending_access_requests.pop(key)
+                if response is not None:
+                    self._get_evidence(server_node_id).register_values[register_name] = response
+
+    def _get_evidence(self, node_id : int) -> SpecEvidence:
+        if node_id not in self._evidences:
+            self._evidences[node_id] = SpecEvidence(node_id=node_id, from_capture=True)
+        return self._evidences[node_id]
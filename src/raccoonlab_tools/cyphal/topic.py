@@ -10,6 +10,7 @@ import logging
 from typing import Any, Union
 import pycyphal.application
 from raccoonlab_tools.common.colorizer import Colors
+from raccoonlab_tools.common.rate_estimator import RateEstimator
 from raccoonlab_tools.cyphal.utils import PortRegisterInterface
 
 class Port:
@@ -109,21 +110,6 @@ class Publisher(Topic):
     def __str__(self) -> str:
         return super().__str__()
 
-class RateEstimator:
-    def __init__(self, window_size_sec=1.0) -> None:
-        self._timestamps = []
-        self._window_size_sec = window_size_sec
-
-    def register_message(self):
-        deadline = time.time() - self._window_size_sec
-        self._timestamps = [timestamp for timestamp in self._timestamps if timestamp > deadline]
-        self._timestamps.append(time.time())
-
-    def get_rate(self) -> int:
-        deadline = time.time() - self._window_size_sec
-        self._timestamps = [timestamp for timestamp in self._timestamps if timestamp > deadline]
-        return int(len(self._timestamps) / self._window_size_sec)
-
 class Subscriber(Topic):
     def __init__(self,
                  node: pycyphal.application._node_factory.SimpleNode,
@@ -7,7 +7,7 @@ import time
 import logging
 import asyncio
 import numpy as np
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 # pylint: disable=import-error
 import uavcan.register.Access_1_0
@@ -17,6 +17,7 @@ import uavcan.register.Value_1_0
 import uavcan.node.port.List_1_0
 
 from raccoonlab_tools.common.node import NodeInfo
+from raccoonlab_tools.common.node_info_cache import NodeInfoCache
 
 UAVCAN_PUB = "uavcan.pub"
 UAVCAN_SUB = "uavcan.sub"
@@ -28,9 +29,13 @@ class NodeFinder:
     This class performs a network scan for a target node and collects a basic information.
     Possible target nodes id are [0, 126].
     Node ID 127 is intentionally ignored because it is usually occupied by debugging tools.
+    NodeInfo is cached and validated by the uptime of a live Heartbeat, see NodeInfoCache.
     """
+    HEARTBEAT_TIMEOUT_SEC = 1.1     # the Heartbeat period is 1 second
     target_node_id = None
     black_list = [127]
+    _cache = NodeInfoCache()
+    _uptimes : Dict[int, Tuple[int, float]] = {}    # node ID -> (uptime, time.monotonic() when received)
 
     def __init__(self, cyphal_node) -> None:
         self.node = cyphal_node
@@ -50,6 +55,7 @@ class NodeFinder:
             if transfer is None:
                 break
             assert isinstance(transfer, tuple), "Type is type(transfer) :("
+            NodeFinder._uptimes[transfer[1].source_node_id] = (transfer[0].uptime, time.monotonic())
             if transfer[1].source_node_id not in NodeFinder.black_list:
                 NodeFinder.target_node_id = transfer[1].source_node_id
                 break
@@ -57,12 +63,89 @@ class NodeFinder:
 
         return NodeFinder.target_node_id
 
+    async def find_online_nodes(self, timeout : float = 1.1) -> List[int]:
+        """Return IDs of all nodes that have published Heartbeat within the timeout."""
+        assert isinstance(timeout, float)
+
+        node_ids = []
+        time_left_sec = timeout
+        start_time_sec = time.time()
+        sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
+        while time_left_sec > 0.0:
+            transfer = await sub.receive_for(time_left_sec)
+            time_left_sec = (start_time_sec + timeout) - time.time()
+            if transfer is None:
+                continue
+            source_node_id = transfer[1].source_node_id
+            NodeFinder._uptimes[source_node_id] = (transfer[0].uptime, time.monotonic())
+            if source_node_id not in NodeFinder.black_list and source_node_id not in node_ids:
+                node_ids.append(source_node_id)
+        sub.close()
+
+        return sorted(node_ids)
+
     async def get_info(self, number_of_attempts: int=3) -> dict:
         """Return a dictionary on success. Otherwise return None."""
         dest_node_id = await self.find_online_node()
+        infos = await self.get_infos([dest_node_id], number_of_attempts)
+        return infos.get(dest_node_id)
+
+    async def get_infos(self, node_ids : Optional[List[int]] = None, number_of_attempts: int=3) -> Dict[int, NodeInfo]:
+        """
+        NodeInfo of the given nodes or all online nodes. The nodes that are not cached are asked
+        concurrently. The nodes that didn't respond are not in the result.
+        """
+        if node_ids is None:
+            node_ids = await self.find_online_nodes()
+
+        # find_online_node() may return the target without listening, so the uptime may be stale
+        await self._update_uptimes(node_ids)
+
+        infos = {}
+        for node_id in node_ids:
+            uptime, seen_time = NodeFinder._get_live_uptime(node_id)
+            info = NodeFinder._cache.get(node_id, uptime, seen_time)
+            if info is not None:
+                infos[node_id] = info
+
+        node_ids_to_ask = [node_id for node_id in node_ids if node_id not in infos]
+        uptimes = {node_id : NodeFinder._get_live_uptime(node_id) for node_id in node_ids_to_ask}
+        responses = await asyncio.gather(*(self._request_info(node_id, number_of_attempts)
+                                           for node_id in node_ids_to_ask))
+        for node_id, response in zip(node_ids_to_ask, responses):
+            if response is not None:
+                infos[node_id] = NodeInfo.create_from_cyphal_response(response)
+                uptime, seen_time = uptimes[node_id]
+                if uptime is not None:
+                    NodeFinder._cache.put(infos[node_id], uptime, seen_time)
 
+        return {node_id : infos[node_id] for node_id in node_ids if node_id in infos}
+
+    async def _update_uptimes(self, node_ids : List[int]) -> None:
+        """Listen to the Heartbeats of the nodes that have no live uptime, but not longer than a period."""
+        node_ids = {node_id for node_id in node_ids if NodeFinder._get_live_uptime(node_id)[0] is None}
+        end_time_sec = time.time() + NodeFinder.HEARTBEAT_TIMEOUT_SEC
+        sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
+        while node_ids and time.time() < end_time_sec:
+            transfer = await sub.receive_for(end_time_sec - time.time())
+            if transfer is None:
+                break
+            NodeFinder._uptimes[transfer[1].source_node_id] = (transfer[0].uptime, time.monotonic())
+            node_ids.discard(transfer[1].source_node_id)
+        sub.close()
+
+    @staticmethod
+    def _get_live_uptime(node_id : int) -> Tuple[Optional[int], Optional[float]]:
+        """The uptime from the Heartbeat received within the last period or None."""
+        uptime, seen_time = NodeFinder._uptimes.get(node_id, (None, None))
+        if seen_time is None or time.monotonic() - seen_time > NodeFinder.HEARTBEAT_TIMEOUT_SEC:
+            return None, None
+        return uptime, seen_time
+
+    async def _request_info(self, dest_node_id : int, number_of_attempts: int) -> Optional[tuple]:
         request = uavcan.node.GetInfo_1_0.Request()
         client = self.node.make_client(uavcan.node.GetInfo_1_0, dest_node_id)
+        response = None
         for attempt in range(number_of_attempts):
             if attempt == 0:
                 logging.debug(f"NodeInfo: send request to {dest_node_id}")
@@ -73,12 +156,9 @@ class NodeFinder:
                 break
         client.close()
 
-        if response is not None:
-            node_info = NodeInfo.create_from_cyphal_response(response)
-        else:
+        if response is None:
             logging.warn(f"Node {dest_node_id} has not respond to NodeInfo request.")
-            node_info = None
-        return node_info
+        return response
 
     async def get_port_list(self, timeout : float = 10.1) -> uavcan.node.port.List_1_0:
         dest_node_id = await self.find_online_node()
@@ -241,6 +321,8 @@ class NodeCommander:
     """
     Wrapper under ExecuteCommand
     """
+    RESTART_TIMEOUT_SEC = 5.0
+
     def __init__(self, cyphal_node, dest_node_id) -> None:
         self.node = cyphal_node
         self.cmd_client = None
@@ -256,6 +338,47 @@ class NodeCommander:
         save_request = uavcan.node.ExecuteCommand_1_1.Request(command = 65535)
         await self.cmd_client.call(save_request)
 
+    async def restart_and_wait(self, timeout : float = RESTART_TIMEOUT_SEC) -> Optional[float]:
+        """
+        Restart the node and wait until its Heartbeat uptime is reset and it is operational again.
+        Return the reboot time in seconds or None if the node hasn't come back within the timeout.
+        """
+        end_time = time.time() + timeout
+        sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
+        try:
+            # The uptime resolution is 1 second, so a reset from 0 to 0 can't be noticed
+            heartbeat = await self._receive_heartbeat(sub, end_time)
+            while heartbeat is not None and heartbeat.uptime == 0:
+                heartbeat = await self._receive_heartbeat(sub, end_time)
+            if heartbeat is None:
+                return None
+
+            last_uptime = heartbeat.uptime
+            has_rebooted = False
+            start_time = time.time()
+            await self.restart()
+            while True:
+                heartbeat = await self._receive_heartbeat(sub, end_time)
+                if heartbeat is None:
+                    return None
+                has_rebooted = has_rebooted or heartbeat.uptime < last_uptime
+                last_uptime = heartbeat.uptime
+                if has_rebooted and heartbeat.mode.value == uavcan.node.Mode_1_0.OPERATIONAL:
+                    return time.time() - start_time
+        finally:
+            sub.close()
+
+    async def _receive_heartbeat(self, sub, end_time : float) -> Optional[uavcan.node.Heartbeat_1_0]:
+        while True:
+            time_left_sec = end_time - time.time()
+            if time_left_sec <= 0.0:
+                return None
+            transfer = await sub.receive_for(time_left_sec)
+            if transfer is None:
+                return None
+            if transfer[1].source_node_id == self.dest_node_id:
+                return transfer[0]
+
 def _np_array_to_string(np_array : np.ndarray) -> str:
     assert isinstance(np_array, np.ndarray)
     return "".join([chr(item) for item in np_array])
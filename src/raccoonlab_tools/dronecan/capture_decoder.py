@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+DroneCAN part of the offline capture decoder, see common/capture_decoder.py.
+"""
+from typing import Any, Iterable
+
+import numpy as np
+
+import dronecan
+from dronecan import transport
+
+from raccoonlab_tools.common.binary_capture import FLAG_CANFD, get_lengths, ns_to_sec
+from raccoonlab_tools.common.capture_decoder import DecodedCapture, flatten
+
+class DronecanStreamDecoder:
+    """
+    Reassemble and decode the transfers with the pydronecan DSDL.
+    The service tables are named after the service with .Request or .Response suffix.
+    """
+    def decode(self, chunks : Iterable[np.ndarray]) -> DecodedCapture:
+        decoded = DecodedCapture()
+        transfer_manager = transport.TransferManager()
+        for records in chunks:
+            decoded.number_of_frames += len(records)
+            for record, length in zip(records, get_lengths(records)):
+                timestamp = ns_to_sec(record["timestamp_ns"])
+                frame = transport.Frame(int(record["can_id"]),
+                                        record["data"][:length].tobytes(),
+                                        timestamp,
+                                        timestamp,
+                                        bool(record["flags"] & FLAG_CANFD))
+                transfer_frames = transfer_manager.receive_frame(frame)
+                if transfer_frames:
+                    self._decode_transfer(transfer_frames, decoded)
+        return decoded
+
+    @staticmethod
+    def _decode_transfer(transfer_frames : list, decoded : DecodedCapture) -> None:
+        transfer = transport.Transfer()
+        try:
+            transfer.from_frames(transfer_frames)
+        except (transport.TransferError, ValueError):  # ValueError: a payload is too short
+            decoded.number_of_errors += 1
+            return
+
+        name = dronecan.get_dronecan_data_type(transfer.payload).full_name
+        row = {
+            "timestamp": transfer.ts_real,
+            "source_node_id": transfer.source_node_id,
+            "transfer_id": transfer.transfer_id,
+        }
+        if transfer.service_not_message:
+            name += ".Request" if transfer.request_not_response else ".Response"
+            row["destination_node_id"] = transfer.dest_node_id
+        flatten(to_builtin(transfer.payload), "", row)
+        decoded.add_row(name, row)
+
+
+def to_builtin(value : Any) -> Any:
+    """
+    A DroneCAN value as built-in types: a compound value is a dictionary (only the active field
+    of a union, without the void fields), a string-like array is a string, the other arrays are lists.
+    """
+    if isinstance(value, transport.CompoundValue):
+        if transport.is_union(value):
+            field_names = [transport.get_active_union_field(value)]
+        else:
+            field_names = [name for name, field in transport.get_fields(value).items()
+                           if not isinstance(field, transport.VoidValue)]
+        return {name : to_builtin(getattr(value, name)) for name in field_names}
+    if isinstance(value, transport.ArrayValue):
+        if value._type.is_string_like:  # pylint: disable=protected-access
+            try:
+                return value.decode()
+            except UnicodeDecodeError:
+                return value.to_bytes()
+        return [to_builtin(item) for item in value]
+    return value
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+import dronecan
+from raccoonlab_tools.common.firmware_update import FirmwareImage, \
+                                                    NodeUpdateProgress, \
+                                                    UpdateState, \
+                                                    format_summary, \
+                                                    print_progress
+
+logger = logging.getLogger(__name__)
+
+class FirmwareUpdater:
+    """
+    Update the firmware of several nodes concurrently with uavcan.protocol.file.BeginFirmwareUpdate.
+    The local node serves uavcan.protocol.file.Read and uavcan.protocol.file.GetInfo from a memory
+    mapped image. A node is updated when it has read the whole image and is operational again.
+    """
+    READ_SIZE = 256
+    MAX_PATH_LENGTH = 200
+    READ_TIMEOUT_SEC = 10.0
+    REQUEST_ATTEMPTS = 3
+    PROGRESS_PERIOD_SEC = 1.0
+
+    def __init__(self, node : dronecan.node.Node, image : FirmwareImage, remote_path : Optional[str] = None) -> None:
+        assert node.node_id is not None, "An anonymous node can't serve files"
+        self.node = node
+        self.image = image
+        if remote_path is None:
+            remote_path = os.path.basename(image.path)
+        self.remote_path = remote_path.encode()[:FirmwareUpdater.MAX_PATH_LENGTH]
+        self._progresses : Dict[int, NodeUpdateProgress] = {}
+        self._handlers = [
+            node.add_handler(dronecan.uavcan.protocol.file.Read, self._on_read),
+            node.add_handler(dronecan.uavcan.protocol.file.GetInfo, self._on_get_info),
+            node.add_handler(dronecan.uavcan.protocol.NodeStatus, self._on_node_status),
+        ]
+
+    def update(self, node_ids : List[int], timeout_sec : float = 120.0, verbose : bool = True) -> List[NodeUpdateProgress]:
+        """Request the update of all nodes at once and serve them until all are done or timeout."""
+        self._progresses = {node_id : NodeUpdateProgress(node_id, self.image.size) for node_id in node_ids}
+        for node_id in node_ids:
+            self._request_update(node_id, attempt=1)
+
+        end_time = time.time() + timeout_sec
+        next_print_time = time.time() + FirmwareUpdater.PROGRESS_PERIOD_SEC
+        while time.time() < end_time and not all(progress.is_done for progress in self._progresses.values()):
+            self.node.spin(0.005)
+            self._check_read_timeouts()
+            if verbose and time.time() >= next_print_time:
+                next_print_time += FirmwareUpdater.PROGRESS_PERIOD_SEC
+                print(f"[INFO] {format_summary(self._progresses.values())}")
+
+        for progress in self._progresses.values():
+            if not progress.is_done:
+                progress.fail("timeout")
+        if verbose:
+            print("Summary:")
+            print_progress(self._progresses.values())
+        return list(self._progresses.values())
+
+    def close(self) -> None:
+        for handler in self._handlers:
+            handler.remove()
+        self._handlers = []
+
+    def _request_update(self, node_id : int, attempt : int) -> None:
+        request = dronecan.uavcan.protocol.file.BeginFirmwareUpdate.Request()
+        request.source_node_id = self.node.node_id
+        request.image_file_remote_path.path = self.remote_path
+        callback = lambda event: self._on_begin_firmware_update_response(node_id, attempt, event)
+        self.node.request(request, node_id, callback)
+
+    def _on_begin_firmware_update_response(self, node_id : int, attempt : int, event) -> None:
+        progress = self._progresses.get(node_id)
+        if progress is None or progress.is_done:
+            return
+
+        if event is None:
+            # A node may reboot into the bootloader without a response, so retry only until it reads
+            if progress.state != UpdateState.REQUESTED:
+                return
+            if attempt < FirmwareUpdater.REQUEST_ATTEMPTS:
+                self._request_update(node_id, attempt + 1)
+            else:
+                progress.fail("no response")
+            return
+
+        response = event.response
+        if response.error not in (response.ERROR_OK, response.ERROR_IN_PROGRESS):
+            optional_error_message = response.optional_error_message.decode(errors="replace")
+            progress.fail(f"error {response.error} {optional_error_message}".strip())
+
+    def _on_read(self, event) -> dronecan.uavcan.protocol.file.Read.Response:
+        response = dronecan.uavcan.protocol.file.Read.Response()
+        if bytes(event.request.path.path) != self.remote_path:
+            response.error.value = response.error.NOT_FOUND
+            return response
+
+        offset = event.request.offset
+        data = self.image.read(offset, FirmwareUpdater.READ_SIZE)
+        response.data = data
+
+        progress = self._progresses.get(event.transfer.source_node_id)
+        if progress is not None and not progress.is_done:
+            progress.on_read(offset, len(data))
+        return response
+
+    def _on_get_info(self, event) -> dronecan.uavcan.protocol.file.GetInfo.Response:
+        response = dronecan.uavcan.protocol.file.GetInfo.Response()
+        if bytes(event.request.path.path) != self.remote_path:
+            response.error.value = response.error.NOT_FOUND
+            return response
+
+        response.size = self.image.size
+        response.entry_type.flags = response.entry_type.FLAG_FILE | response.entry_type.FLAG_READABLE
+        return response
+
+    def _on_node_status(self, event) -> None:
+        progress = self._progresses.get(event.transfer.source_node_id)
+        if progress is None or progress.is_done or progress.bytes_read < self.image.size:
+            return
+        if event.message.mode == event.message.MODE_OPERATIONAL:
+            logger.info(f"Node {progress.node_id} is operational after the update")
+            progress.finish()
+
+    def _check_read_timeouts(self) -> None:
+        now = time.time()
+        for progress in self._progresses.values():
+            if progress.state == UpdateState.IN_PROGRESS and progress.bytes_read < self.image.size and \
+                    now - progress.last_read_time > FirmwareUpdater.READ_TIMEOUT_SEC:
+                progress.fail("read timeout")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Fleet provisioning: flash -> wait for boot -> configure -> verify over many boards at once.
+
+Each board is connected to its own jig: an ST-Link programmer and a CAN interface.
+Every stage has its own worker pool, so a board goes to the next stage as soon as it is ready,
+while the other boards are still being flashed or configured.
+"""
+import time
+import threading
+from enum import Enum
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import dronecan
+from raccoonlab_tools.common.node import NodeInfo
+from raccoonlab_tools.common.firmware_manager import FirmwareManager, UploadResult
+from raccoonlab_tools.dronecan.utils import Parameter, ParametersInterface, NodeCommander, NodeFinder
+
+@dataclass
+class Jig:
+    can_transport: str
+    programmer: Optional[str] = None
+
+    @staticmethod
+    def from_string(string : str) -> "Jig":
+        """
+        Examples:
+        - 066DFF555654725187174122,slcan:/dev/ttyACM0 - a programmer serial number and a CAN interface
+        - slcan:/dev/ttyACM0 - only a CAN interface, the board is not flashed
+        """
+        if "," not in string:
+            return Jig(can_transport=string)
+        programmer, can_transport = string.split(",", 1)
+        return Jig(can_transport=can_transport, programmer=programmer)
+
+    @property
+    def name(self) -> str:
+        return self.can_transport if self.programmer is None else self.programmer
+
+
+class Stage(Enum):
+    QUEUED = 0
+    FLASH = 1
+    BOOT = 2
+    CONFIGURE = 3
+    VERIFY = 4
+    DONE = 5
+    FAILED = 6
+
+
+@dataclass
+class BoardStatus:
+    jig: Jig
+    stage: Stage = Stage.QUEUED
+    node_id: Optional[int] = None
+    error: Optional[str] = None
+    start_time: float = field(default_factory=time.time)
+    end_time: Optional[float] = None
+    flash_result: Optional[UploadResult] = None
+    node_info: Optional[NodeInfo] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_sec(self) -> float:
+        end_time = time.time() if self.end_time is None else self.end_time
+        return end_time - self.start_time
+
+    def __str__(self) -> str:
+        node_id = "-" if self.node_id is None else self.node_id
+        string = f"{self.jig.name :<30} node {node_id :>3}  {self.stage.name :<9} {self.duration_sec :6.1f} sec"
+        if self.error is not None:
+            string += f"  {self.error}"
+        return string
+
+
+class FleetPipeline:
+    BOOT_TIMEOUT_SEC = 5.0
+    MIN_UPTIME_BEFORE_RESTART_SEC = 2.5
+    PRINT_PERIOD_SEC = 2.0
+    DEBUG_NODE_ID = 127
+
+    def __init__(self,
+                 config : dict,
+                 jigs : List[Jig],
+                 binary_path : Optional[str] = None,
+                 flash_jobs : Optional[int] = None,
+                 can_jobs : Optional[int] = None,
+                 force : bool = False) -> None:
+        """
+        flash_jobs and can_jobs are the worker pool sizes of the flash stage and of the CAN stages.
+        By default, each stage handles all boards at once.
+        """
+        self.statuses = [BoardStatus(jig) for jig in jigs]
+        self._params = [Parameter(name=name, value=value) for name, value in (config.get('params') or {}).items()]
+        self._binary_path = binary_path
+        self._force = force
+        self._flash_jobs = flash_jobs or max(len(jigs), 1)
+        self._can_jobs = can_jobs or max(len(jigs), 1)
+
+        self._stages : Dict[Stage, Callable[[BoardStatus], None]] = {
+            Stage.FLASH: self._flash,
+            Stage.BOOT: self._wait_for_boot,
+            Stage.CONFIGURE: self._configure,
+            Stage.VERIFY: self._verify,
+        }
+        self._pools : Dict[Stage, ThreadPoolExecutor] = {}
+        self._nodes : Dict[int, dronecan.node.Node] = {}
+        self._boot_times : Dict[int, float] = {}
+        self._restart_times : Dict[int, Optional[float]] = {}
+        self._upload_job = None
+        self._number_of_finished_boards = 0
+        self._lock = threading.Lock()
+
+    def run(self, verbose : bool = True) -> List[BoardStatus]:
+        # Some drivers fork a process on creation, so the nodes are created before any subprocess
+        # is started, otherwise the child may inherit the pipes of st-flash
+        for status in self.statuses:
+            try:
+                self._get_node(status)
+            except Exception as err:  # pylint: disable=broad-except
+                # A missing or busy adapter fails only its own board
+                status.error = f"can: {err}"
+                status.stage = Stage.FAILED
+                self._finish(status)
+
+        try:
+            if self._binary_path is not None:
+                self._upload_job = FirmwareManager.make_upload_job(self._binary_path, self._force)
+            self._pools = {
+                Stage.FLASH: ThreadPoolExecutor(self._flash_jobs, thread_name_prefix="flash"),
+                Stage.BOOT: ThreadPoolExecutor(self._can_jobs, thread_name_prefix="boot"),
+                Stage.CONFIGURE: ThreadPoolExecutor(self._can_jobs, thread_name_prefix="configure"),
+                Stage.VERIFY: ThreadPoolExecutor(self._can_jobs, thread_name_prefix="verify"),
+            }
+
+            for status in self.statuses:
+                if status.stage != Stage.FAILED:
+                    self._submit(status, self._get_next_stage(status, Stage.QUEUED))
+
+            next_print_time = time.time() + FleetPipeline.PRINT_PERIOD_SEC
+            while self._number_of_finished_boards < len(self.statuses):
+                time.sleep(0.05)
+                if verbose and time.time() >= next_print_time:
+                    next_print_time += FleetPipeline.PRINT_PERIOD_SEC
+                    self.print_table()
+        finally:
+            for pool in self._pools.values():
+                pool.shutdown()
+            for node in self._nodes.values():
+                node.close()
+            self._nodes = {}
+
+        if verbose:
+            self.print_table()
+        return self.statuses
+
+    def print_table(self) -> None:
+        counters = {stage : 0 for stage in Stage}
+        for status in self.statuses:
+            counters[status.stage] += 1
+        print(", ".join(f"{stage.name.lower()}: {counter}" for stage, counter in counters.items() if counter))
+        for status in self.statuses:
+            print(f"- {status}")
+
+    def _get_next_stage(self, status : BoardStatus, stage : Stage) -> Stage:
+        if stage == Stage.QUEUED:
+            return Stage.FLASH if self._binary_path is not None and status.jig.programmer is not None else Stage.BOOT
+        if stage == Stage.BOOT:
+            return Stage.CONFIGURE if self._params else Stage.DONE
+        if stage == Stage.CONFIGURE and self._restart_times[id(status)] is None:
+            # The parameters have been read back already during configuration
+            return Stage.DONE
+        return Stage(stage.value + 1)
+
+    def _submit(self, status : BoardStatus, stage : Stage) -> None:
+        status.stage = stage
+        if stage == Stage.DONE:
+            self._finish(status)
+            return
+        future = self._pools[stage].submit(self._stages[stage], status)
+        future.add_done_callback(lambda future: self._on_stage_done(status, stage, future))
+
+    def _on_stage_done(self, status : BoardStatus, stage : Stage, future : Future) -> None:
+        try:
+            future.result()
+        except Exception as err:  # pylint: disable=broad-except
+            status.error = f"{stage.name.lower()}: {err}"
+
+        if status.error is not None:
+            status.stage = Stage.FAILED
+            self._finish(status)
+        else:
+            self._submit(status, self._get_next_stage(status, stage))
+
+    def _finish(self, status : BoardStatus) -> None:
+        status.end_time = time.time()
+        with self._lock:
+            self._number_of_finished_boards += 1
+
+    def _flash(self, status : BoardStatus) -> None:
+        result = self._upload_job(status.jig.programmer)
+        status.flash_result = result
+        if not result.success:
+            status.error = f"flash: {result.error}"
+
+    def _wait_for_boot(self, status : BoardStatus, restart_time : Optional[float] = None) -> None:
+        """
+        Wait for an operational node on the jig bus. The node ID may change after a restart,
+        so a node is considered as restarted if its uptime is not longer than the time since
+        the restart request (the uptime resolution is 1 second).
+        """
+        node = self._get_node(status)
+        booted = []
+        def node_status_cb(event):
+            source_node_id = event.transfer.source_node_id
+            if source_node_id in (node.node_id, FleetPipeline.DEBUG_NODE_ID):
+                return
+            if event.message.mode != event.message.MODE_OPERATIONAL:
+                return
+            if restart_time is not None and event.message.uptime_sec > time.time() - restart_time + 1:
+                return
+            booted.append((source_node_id, event.message.uptime_sec, time.time()))
+
+        handler = node.add_handler(dronecan.uavcan.protocol.NodeStatus, node_status_cb)
+        end_time = time.time() + FleetPipeline.BOOT_TIMEOUT_SEC
+        while time.time() < end_time and not booted:
+            node.spin(0.005)
+        handler.remove()
+
+        if not booted:
+            status.error = "boot: the node is not online"
+            return
+        status.node_id, uptime_sec, timestamp = booted[0]
+        self._boot_times[id(status)] = timestamp - uptime_sec
+        if status.node_info is None:
+            status.node_info = NodeFinder(node).get_info(status.node_id)
+
+    def _configure(self, status : BoardStatus) -> None:
+        node = self._get_node(status)
+        params_interface = ParametersInterface(node=node, target_node_id=status.node_id)
+        update = params_interface.apply(self._params)
+        status.params = {param.name : param.value for param in update.changed + update.unchanged}
+        if update.failed:
+            status.error = f"configure: {', '.join(param.name for param in update.failed)} failed"
+            return
+        if not update.changed:
+            self._restart_times[id(status)] = None
+            return
+
+        commander = NodeCommander(node=node, target_node_id=status.node_id)
+        if not commander.store_persistent_states():
+            status.error = "configure: store persistent states failed"
+            return
+
+        # Otherwise the restart can't be distinguished from the previous boot by the uptime
+        uptime_sec = time.time() - self._boot_times[id(status)]
+        if uptime_sec < FleetPipeline.MIN_UPTIME_BEFORE_RESTART_SEC:
+            time.sleep(FleetPipeline.MIN_UPTIME_BEFORE_RESTART_SEC - uptime_sec)
+        self._restart_times[id(status)] = time.time()
+        if not commander.restart():
+            status.error = "configure: restart failed"
+
+    def _verify(self, status : BoardStatus) -> None:
+        self._wait_for_boot(status, restart_time=self._restart_times[id(status)])
+        if status.error is not None:
+            status.error = "verify: the node is not online after restart"
+            return
+
+        params_interface = ParametersInterface(node=self._get_node(status), target_node_id=status.node_id)
+        mismatches = []
+        for param, actual in zip(self._params, params_interface.get_many([param.name for param in self._params])):
+            if actual is not None:
+                status.params[param.name] = actual.value
+            if actual is None or not param.is_equal(actual.value):
+                mismatches.append(f"{param.name}={None if actual is None else actual.value}")
+        if mismatches:
+            status.error = f"verify: {', '.join(mismatches)}"
+
+    def _get_node(self, status : BoardStatus) -> dronecan.node.Node:
+        """Each jig has its own bus, so each board has its own local node."""
+        node = self._nodes.get(id(status))
+        if node is None:
+            node = dronecan.make_node(status.jig.can_transport, node_id=100, bitrate=1000000, baudrate=1000000)
+            self._nodes[id(status)] = node
+        return node
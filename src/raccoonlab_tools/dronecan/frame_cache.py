@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Broadcast repeating DroneCAN messages without serializing them again.
+
+The CAN frames of a message are cached per (message type, field values). On reuse only the
+transfer ID in the tail byte of every frame is patched: the CAN ID, the toggle bits and the
+multi-frame CRC don't depend on it. The frames are sent directly with the node's CAN driver.
+"""
+import collections
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+import dronecan
+
+TRANSFER_ID_MASK = 0x1F
+
+class FrameCache:
+    def __init__(self,
+                 node : dronecan.node.Node,
+                 source_node_id : Optional[int] = None,
+                 priority : int = dronecan.node.DEFAULT_TRANSFER_PRIORITY,
+                 max_size : int = 256) -> None:
+        """
+        By default, the frames are sent from the node itself and the transfer IDs are shared with
+        node.broadcast(). Another source_node_id allows to simulate several nodes with a single one.
+        """
+        self.node = node
+        self.source_node_id = node.node_id if source_node_id is None else source_node_id
+        assert self.source_node_id, "An anonymous node can't broadcast"
+        self.priority = priority
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._frames : Dict[Hashable, Tuple[int, List[Tuple[int, bytearray]]]] = collections.OrderedDict()
+        self._next_transfer_ids : Dict[int, int] = {}
+
+    def broadcast(self, message : Union[dronecan.transport.CompoundValue, Callable], key : Hashable = None) -> None:
+        """
+        message is either a DroneCAN message or a function that creates it.
+        By default, the key is built from the message field values. With an explicit key, a function
+        is called only on a cache miss, so a cache hit doesn't create any message at all.
+        Building the key walks all message fields and costs about as much as the serialization
+        itself, so hot loops should pass an explicit key.
+        """
+        if key is None:
+            message = message() if callable(message) else message
+            key = repr(message)
+
+        cached = self._frames.get(key)
+        if cached is None:
+            self.misses += 1
+            message = message() if callable(message) else message
+            cached = self._serialize(message)
+            self._frames[key] = cached
+            if len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        else:
+            self.hits += 1
+            self._frames.move_to_end(key)
+
+        data_type_id, frames = cached
+        transfer_id = self._next_transfer_id(data_type_id)
+        for can_id, data in frames:
+            data[-1] = (data[-1] & ~TRANSFER_ID_MASK) | transfer_id
+            self.node.can_driver.send(can_id, bytes(data), extended=True)
+
+    def send(self, message : dronecan.transport.CompoundValue) -> None:
+        """Serialize and send a message without caching, for messages that change every time."""
+        data_type_id, frames = self._serialize(message)
+        transfer_id = self._next_transfer_id(data_type_id)
+        for can_id, data in frames:
+            data[-1] |= transfer_id
+            self.node.can_driver.send(can_id, bytes(data), extended=True)
+
+    def clear(self) -> None:
+        self._frames.clear()
+
+    def _serialize(self, message : dronecan.transport.CompoundValue) -> Tuple[int, List[Tuple[int, bytearray]]]:
+        transfer = dronecan.transport.Transfer(payload=message,
+                                               source_node_id=self.source_node_id,
+                                               transfer_id=0,
+                                               transfer_priority=self.priority,
+                                               service_not_message=False)
+        frames = [(frame.message_id, bytearray(frame.bytes)) for frame in transfer.to_frames()]
+        return dronecan.get_dronecan_data_type(message).default_dtid, frames
+
+    def _next_transfer_id(self, data_type_id : int) -> int:
+        if self.source_node_id == self.node.node_id:
+            # pylint: disable=protected-access
+            return self.node._next_transfer_id(data_type_id)
+
+        transfer_id = self._next_transfer_ids.get(data_type_id, 0)
+        self._next_transfer_ids[data_type_id] = (transfer_id + 1) & TRANSFER_ID_MASK
+        return transfer_id
@@ -10,11 +10,18 @@ from typing import List, Optional, Callable
 from raccoonlab_tools.common.device_manager import DeviceManager
 
 class DronecanNode:
+    """
+    The DroneCAN node is created once and shared by all users within the process.
+    The transport is detected automatically unless it is explicitly provided on the first call,
+    for example vcan0 or mcast:0 for a simulated bus.
+    """
     node = None
-    def __init__(self, node_id: int = 100) -> None:
+    transport = None
+    def __init__(self, node_id: int = 100, transport: Optional[str] = None) -> None:
         if DronecanNode.node is None:
-            transport = DeviceManager.get_device_port()
-            if transport.startswith(("slcan", "can")):
+            if transport is None:
+                transport = DeviceManager.get_device_port()
+            if transport.startswith(("slcan", "can", "vcan", "mcast:")):
                 dronecan_transport = f'{transport}'
             elif transport.startswith("/dev/") or transport.startswith("COM"):
                 dronecan_transport = f'slcan:{transport}'
@@ -22,6 +29,7 @@ class DronecanNode:
                 print(f"Unsupported interface {transport}")
                 sys.exit(1)
 
+            DronecanNode.transport = dronecan_transport
             DronecanNode.node = dronecan.make_node(dronecan_transport,
                                                    node_id=node_id,
                                                    bitrate=1000000,
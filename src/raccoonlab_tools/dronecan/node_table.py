@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+A long-lived table of the nodes on the bus fed by a single uavcan.protocol.NodeStatus handler.
+Lookups don't spin the node, and the tools wait for the events they need with futures
+instead of scanning the bus again and again:
+
+table = NodeTable.get(node)
+future = table.when_reappears(42)
+commander.restart()
+entry = table.wait(future, timeout_sec=5.0)
+"""
+import time
+from dataclasses import dataclass
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import dronecan
+
+@dataclass
+class NodeEntry:
+    node_id: int
+    health: int
+    mode: int
+    sub_mode: int
+    vendor_specific_status_code: int
+    uptime_sec: int
+    first_seen: float
+    last_seen: float
+    number_of_reboots: int = 0
+    last_reboot_time: Optional[float] = None
+
+    @property
+    def is_online(self) -> bool:
+        return time.monotonic() - self.last_seen < NodeTable.OFFLINE_TIMEOUT_SEC
+
+    def __str__(self) -> str:
+        return (f"node {self.node_id :>3}: health {self.health}, mode {self.mode}, "
+                f"uptime {self.uptime_sec} sec, reboots {self.number_of_reboots}"
+                f"{'' if self.is_online else ', offline'}")
+
+
+class NodeTable:
+    """
+    There is one table per local node. Time is measured with time.monotonic().
+    The table is updated only while someone spins the node: the tools do it anyway,
+    and wait() spins it until a future is done.
+    """
+    OFFLINE_TIMEOUT_SEC = 3.0   # The DroneCAN specification: no NodeStatus for 3 seconds
+    DISCOVERY_TIME_SEC = 1.1    # NodeStatus is published at least once per second
+
+    _tables : Dict[int, "NodeTable"] = {}
+
+    @staticmethod
+    def get(node : dronecan.node.Node) -> "NodeTable":
+        table = NodeTable._tables.get(id(node))
+        if table is None or table.node is not node:
+            table = NodeTable(node)
+            NodeTable._tables[id(node)] = table
+        return table
+
+    def __init__(self, node : dronecan.node.Node) -> None:
+        self.node = node
+        self.created_time = time.monotonic()
+        self._entries : Dict[int, NodeEntry] = {}
+        self._waiters : List[Tuple[Callable[[NodeEntry, bool, bool], bool], Future]] = []
+        self._reboot_callbacks : List[Callable[[NodeEntry], None]] = []
+        self._handler = node.add_handler(dronecan.uavcan.protocol.NodeStatus, self._on_node_status)
+
+    def close(self) -> None:
+        self._handler.remove()
+        for _, future in self._waiters:
+            future.cancel()
+        self._waiters = []
+        if NodeTable._tables.get(id(self.node)) is self:
+            del NodeTable._tables[id(self.node)]
+
+    def get_entry(self, node_id : int) -> Optional[NodeEntry]:
+        return self._entries.get(node_id)
+
+    def get_entries(self) -> List[NodeEntry]:
+        return [self._entries[node_id] for node_id in sorted(self._entries)]
+
+    def get_online_node_ids(self, exclude : Iterable[int] = ()) -> List[int]:
+        exclude = set(exclude)
+        return sorted(node_id for node_id, entry in self._entries.items()
+                      if entry.is_online and node_id not in exclude)
+
+    def is_discovery_finished(self, discovery_time_sec : float = DISCOVERY_TIME_SEC) -> bool:
+        """The table has listened long enough to have seen every online node."""
+        return time.monotonic() - self.created_time >= discovery_time_sec
+
+    def add_reboot_callback(self, callback : Callable[[NodeEntry], None]) -> None:
+        """The callback is called when the uptime of a node is reset."""
+        self._reboot_callbacks.append(callback)
+
+    def when_online(self, node_id : Optional[int] = None, exclude : Iterable[int] = ()) -> Future:
+        """
+        The future is resolved with the NodeEntry of the given node (any node if None) as soon as
+        it is online. It is resolved immediately if the node is online already.
+        """
+        exclude = set(exclude)
+        def is_matched(entry : NodeEntry, *_) -> bool:
+            return entry.node_id not in exclude and (node_id is None or entry.node_id == node_id)
+
+        future = Future()
+        online_entries = [entry for entry in self.get_entries() if entry.is_online and is_matched(entry)]
+        if online_entries:
+            future.set_result(online_entries[0])
+        else:
+            self._waiters.append((is_matched, future))
+        return future
+
+    def when(self, node_id : int, predicate : Callable[[NodeEntry], bool]) -> Future:
+        """
+        The future is resolved with the NodeEntry when the node is online and the predicate is true.
+        It is resolved immediately if it is true already.
+        """
+        def is_matched(entry : NodeEntry, *_) -> bool:
+            return entry.node_id == node_id and predicate(entry)
+
+        future = Future()
+        entry = self._entries.get(node_id)
+        if entry is not None and entry.is_online and predicate(entry):
+            future.set_result(entry)
+        else:
+            self._waiters.append((is_matched, future))
+        return future
+
+    def when_reappears(self, node_id : int) -> Future:
+        """
+        The future is resolved with the NodeEntry when the node reboots (its uptime is reset)
+        or comes back after being offline. Create it before the action that restarts the node.
+        """
+        def is_matched(entry : NodeEntry, has_appeared : bool, has_rebooted : bool) -> bool:
+            return entry.node_id == node_id and (has_appeared or has_rebooted)
+
+        future = Future()
+        self._waiters.append((is_matched, future))
+        return future
+
+    def wait(self, future : Future, timeout_sec : float) -> Optional[NodeEntry]:
+        """Spin the node until the future is done. Return None on timeout and cancel the future."""
+        end_time = time.monotonic() + timeout_sec
+        while not future.done() and time.monotonic() < end_time:
+            self.node.spin(0.005)
+        if not future.done():
+            future.cancel()
+            self._waiters = [waiter for waiter in self._waiters if waiter[1] is not future]
+            return None
+        return future.result()
+
+    def wait_for_discovery(self, discovery_time_sec : float = DISCOVERY_TIME_SEC) -> List[int]:
+        """Spin only if the table hasn't listened long enough yet. Return all online node IDs."""
+        while not self.is_discovery_finished(discovery_time_sec):
+            self.node.spin(0.005)
+        self.node.spin(0)
+        return self.get_online_node_ids()
+
+    def _on_node_status(self, event : dronecan.node.TransferEvent) -> None:
+        node_id = event.transfer.source_node_id
+        msg = event.message
+        now = time.monotonic()
+
+        entry = self._entries.get(node_id)
+        has_appeared = entry is None or not entry.is_online
+        has_rebooted = entry is not None and msg.uptime_sec < entry.uptime_sec
+        if entry is None:
+            entry = NodeEntry(node_id, msg.health, msg.mode, msg.sub_mode, msg.vendor_specific_status_code,
+                              msg.uptime_sec, first_seen=now, last_seen=now)
+            self._entries[node_id] = entry
+        else:
+            entry.health = msg.health
+            entry.mode = msg.mode
+            entry.sub_mode = msg.sub_mode
+            entry.vendor_specific_status_code = msg.vendor_specific_status_code
+            entry.uptime_sec = msg.uptime_sec
+            entry.last_seen = now
+
+        if has_rebooted:
+            entry.number_of_reboots += 1
+            entry.last_reboot_time = now
+            for callback in self._reboot_callbacks:
+                callback(entry)
+
+        waiters = []
+        for is_matched, future in self._waiters:
+            if future.done():
+                continue
+            if is_matched(entry, has_appeared, has_rebooted):
+                future.set_result(entry)
+            else:
+                waiters.append((is_matched, future))
+        self._waiters = waiters
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Evidence store for the DroneCAN specification checker.
+It can be collected from a live node or reconstructed from a recorded capture.
+"""
+import time
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass, field
+
+import dronecan
+from dronecan import transport
+
+from raccoonlab_tools.common.capture import CapturedFrame
+from raccoonlab_tools.dronecan.global_node import DronecanNode
+
+NODE_STATUS_WINDOW_SEC = 2.75
+
+@dataclass
+class SpecEvidence:
+    """
+    Everything the passive specification checks need to know about a single node.
+    """
+    node_id : Optional[int] = None
+    node_status_timestamps : List[float] = field(default_factory=list)
+    node_statuses : List[dronecan.uavcan.protocol.NodeStatus] = field(default_factory=list)
+    from_capture : bool = False
+
+
+class EvidenceCollector:
+    """
+    Collect SpecEvidence of live nodes.
+    A single NodeStatus handler fills the evidence of all requested nodes during the same window.
+    """
+    def __init__(self, node : Optional[dronecan.node.Node] = None) -> None:
+        self._node = DronecanNode().node if node is None else node
+        self._evidences : Dict[int, SpecEvidence] = {}
+
+    def collect(self, dest_node_id : int, window_sec : float = NODE_STATUS_WINDOW_SEC) -> SpecEvidence:
+        assert isinstance(dest_node_id, int)
+        return self.collect_many([dest_node_id], window_sec)[dest_node_id]
+
+    def collect_many(self, dest_node_ids : Iterable[int],
+                     window_sec : float = NODE_STATUS_WINDOW_SEC) -> Dict[int, SpecEvidence]:
+        """Return a dictionary: node ID -> SpecEvidence."""
+        self._evidences = {node_id : SpecEvidence(node_id=node_id) for node_id in dest_node_ids}
+        handler = self._node.add_handler(dronecan.uavcan.protocol.NodeStatus, self._node_status_cb)
+        end_time_sec = time.time() + window_sec
+        while time.time() < end_time_sec:
+            self._node.spin(0.005)
+        handler.remove()
+
+        return self._evidences
+
+    def _node_status_cb(self, transfer : dronecan.node.TransferEvent):
+        evidence = self._evidences.get(transfer.transfer.source_node_id)
+        if evidence is not None:
+            # The reception time of the frames, so the spin and scheduling jitter is not measured
+            evidence.node_status_timestamps.append(transfer.transfer.ts_monotonic)
+            evidence.node_statuses.append(transfer.message)
+
+
+class CaptureEvidenceCollector:
+    """
+    Reconstruct SpecEvidence of every node found in a recorded capture.
+    """
+    def __init__(self) -> None:
+        self._evidences : Dict[int, SpecEvidence] = {}
+
+    def collect(self, frames : Iterable[CapturedFrame]) -> Dict[int, SpecEvidence]:
+        """Return a dictionary: node ID -> SpecEvidence."""
+        transfer_manager = transport.TransferManager()
+        node_status_dtid = dronecan.uavcan.protocol.NodeStatus.default_dtid
+        for frame in frames:
+            if not frame.extended:
+                continue
+            transfer_frames = transfer_manager.receive_frame(
+                transport.Frame(frame.can_id, frame.data, frame.timestamp, frame.timestamp, frame.canfd))
+            if not transfer_frames:
+                continue
+
+            transfer = transport.Transfer()
+            try:
+                transfer.from_frames(transfer_frames)
+            except transport.TransferError:
+                continue
+
+            if transfer.service_not_message or transfer.data_type_id != node_status_dtid:
+                continue
+
+            if transfer.source_node_id not in self._evidences:
+                self._evidences[transfer.source_node_id] = SpecEvidence(transfer.source_node_id,
+                                                                        from_capture=True)
+            evidence = self._evidences[transfer.source_node_id]
+            evidence.node_status_timestamps.append(transfer.ts_real)
+            evidence.node_statuses.append(transfer.payload)
+
+        return self._evidences
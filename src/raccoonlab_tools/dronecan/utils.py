@@ -3,11 +3,20 @@
 # Copyright (c) 2023 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 
+import math
+import time
+import logging
+from collections import deque
 import dronecan
-from typing import List, Union, Optional
-from dataclasses import dataclass
+from typing import Dict, List, Union, Optional
+from dataclasses import dataclass, field
 from raccoonlab_tools.common.node import NodeInfo
+from raccoonlab_tools.common.node_info_cache import NodeInfoCache
+from raccoonlab_tools.common.rtt_estimator import RttEstimator
 from raccoonlab_tools.dronecan.global_node import DronecanNode
+from raccoonlab_tools.dronecan.node_table import NodeTable
+
+logger = logging.getLogger(__name__)
 
 @dataclass
 class Parameter:
@@ -25,15 +34,142 @@ class Parameter:
         req.name = self.name
         if isinstance(self.value, int):
             req.value.integer_value = self.value
+        elif isinstance(self.value, float):
+            req.value.real_value = self.value
         elif isinstance(self.value, str):
             req.value.string_value = self.value
         return req
 
+    def is_equal(self, value : Union[None, str, int, float]) -> bool:
+        """A node stores real values as float32, so they are compared with a tolerance."""
+        if isinstance(value, float) or isinstance(self.value, float):
+            return isinstance(value, (int, float)) and isinstance(self.value, (int, float)) and \
+                   math.isclose(value, self.value, rel_tol=1e-6)
+        return value == self.value
+
+
+@dataclass
+class ParametersUpdate:
+    """
+    Result of ParametersInterface.apply():
+    - changed - the parameters that have been written,
+    - unchanged - the parameters that already had the desired values,
+    - failed - the parameters that don't exist, have no response or haven't accepted the value.
+    """
+    changed: List[Parameter] = field(default_factory=list)
+    unchanged: List[Parameter] = field(default_factory=list)
+    failed: List[Parameter] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [f"changed   {param}" for param in self.changed]
+        lines += [f"unchanged {param}" for param in self.unchanged]
+        lines += [f"failed    {param}" for param in self.failed]
+        return "\n".join(lines)
+
+
+class ServiceClient:
+    """
+    Service requests with adaptive timeouts and retries.
+    The timeout is estimated from the previous responses of the same node to the same service,
+    see RttEstimator.
+    """
+    MAX_ATTEMPTS = 3
+    MAX_REQUESTS_IN_FLIGHT = 31  # the transfer ID is 5 bits
+    MIN_TIMEOUTS_SEC = {
+        # Writing or erasing flash takes much longer than answering a parameter request
+        "uavcan.protocol.param.ExecuteOpcode": 1.0,
+    }
+
+    @staticmethod
+    def get_latency(node : dronecan.node.Node, dest_node_id : int, data_type : str) -> RttEstimator:
+        """Measured latency of the target node for the given service as seen by the local node."""
+        return RttEstimator.get(dest_node_id,
+                                bus=id(node),
+                                data_type=data_type,
+                                min_timeout=ServiceClient.MIN_TIMEOUTS_SEC.get(data_type, RttEstimator.MIN_TIMEOUT_SEC))
+
+    @staticmethod
+    def call(node : dronecan.node.Node,
+             request,
+             dest_node_id : int,
+             max_attempts : int = MAX_ATTEMPTS) -> Optional[dronecan.node.TransferEvent]:
+        """Blocking request. None means that the target node didn't respond to any attempt."""
+        return ServiceClient.call_many(node, [request], dest_node_id, max_attempts=max_attempts)[0]
+
+    @staticmethod
+    def call_many(node : dronecan.node.Node,
+                  requests : list,
+                  dest_node_id : int,
+                  max_in_flight : int = 1,
+                  max_attempts : int = MAX_ATTEMPTS) -> List[Optional[dronecan.node.TransferEvent]]:
+        """
+        Pipelined requests: up to max_in_flight requests are sent without waiting for responses.
+        The responses have the same order as the requests.
+        """
+        max_in_flight = max(1, min(max_in_flight, ServiceClient.MAX_REQUESTS_IN_FLIGHT))
+        transfers = [(request, dest_node_id) for request in requests]
+        return ServiceClient._call(node, transfers, max_in_flight, max_attempts)
+
+    @staticmethod
+    def call_each(node : dronecan.node.Node,
+                  request,
+                  dest_node_ids : List[int],
+                  max_attempts : int = MAX_ATTEMPTS) -> List[Optional[dronecan.node.TransferEvent]]:
+        """Fan-out: the same request to all given nodes at once. The responses have the same order."""
+        transfers = [(request, dest_node_id) for dest_node_id in dest_node_ids]
+        return ServiceClient._call(node, transfers, max(len(transfers), 1), max_attempts)
+
+    @staticmethod
+    def _call(node : dronecan.node.Node,
+              transfers : list,
+              max_in_flight : int,
+              max_attempts : int) -> List[Optional[dronecan.node.TransferEvent]]:
+        """transfers is a list of (request, dest_node_id)"""
+        responses : List[Optional[dronecan.node.TransferEvent]] = [None] * len(transfers)
+        attempts = [0] * len(transfers)
+        pending = deque(range(len(transfers)))
+        in_flight = set()
+
+        def send(idx : int) -> None:
+            request, dest_node_id = transfers[idx]
+            data_type = dronecan.get_dronecan_data_type(request).full_name
+            estimator = ServiceClient.get_latency(node, dest_node_id, data_type)
+            attempts[idx] += 1
+            is_retransmission = attempts[idx] > 1
+            timeout = estimator.timeout
+            sent_time = time.monotonic()
+
+            def callback(event : Optional[dronecan.node.TransferEvent]) -> None:
+                in_flight.discard(idx)
+                if event is not None:
+                    # Karn's algorithm: a response to a retransmitted request is ambiguous
+                    if not is_retransmission:
+                        estimator.on_response(time.monotonic() - sent_time)
+                    responses[idx] = event
+                    return
+                estimator.on_timeout(timeout)
+                if attempts[idx] < max_attempts:
+                    pending.appendleft(idx)
+                else:
+                    logger.warning(f"{data_type}: no response after {attempts[idx]} attempts, {estimator}")
+
+            in_flight.add(idx)
+            node.request(request, dest_node_id, callback, timeout=timeout)
+
+        while pending or in_flight:
+            while pending and len(in_flight) < max_in_flight:
+                send(pending.popleft())
+            node.spin(0.005)
+
+        return responses
+
 
 class ParametersInterface:
     """
     A simple wrapper under uavcan.protocol.param.GetSet.
     """
+    MAX_REQUESTS_IN_FLIGHT = 8
+
     def __init__(self, node : Optional[dronecan.node.Node] = None, target_node_id : Optional[int] = None) -> None:
         if isinstance(node, dronecan.node.Node):
             self.node = node
@@ -50,8 +186,6 @@ class ParametersInterface:
         else:
             assert False, "target_node_id argument should be either integer or None"
 
-        self._parameter = None
-
     def get(self, idx_or_name : Union[int, str]) -> Parameter:
         """
         None means that the target node dodn't respond
@@ -63,14 +197,8 @@ class ParametersInterface:
             req = dronecan.uavcan.protocol.param.GetSet.Request(index=idx_or_name)
         else:
             req = dronecan.uavcan.protocol.param.GetSet.Request(name=idx_or_name)
-        self._parameter = None
-        self.node.request(req, self._target_node_id, self._callback)
-        for _ in range(20):
-            self.node.spin(0.005)
-            if self._parameter is not None:
-                break
-
-        return self._parameter
+        response = ServiceClient.call(self.node, req, self._target_node_id)
+        return None if response is None else ParametersInterface._parse_response(response)
 
     def get_all(self) -> list:
         all_params = []
@@ -102,10 +230,49 @@ class ParametersInterface:
 
         return responses
 
-    def _callback(self, msg : dronecan.uavcan.protocol.param.GetSet.Response):
+    def get_many(self, names : List[str], max_in_flight : int = MAX_REQUESTS_IN_FLIGHT) -> List[Optional[Parameter]]:
+        """
+        Pipelined version of get(): up to max_in_flight requests are sent without waiting for responses.
+        The result has the same order as the names. None means that the target node didn't respond.
+        """
+        requests = [dronecan.uavcan.protocol.param.GetSet.Request(name=name) for name in names]
+        return self._request_many(requests, max_in_flight)
+
+    def set_many(self, params : List[Parameter], max_in_flight : int = MAX_REQUESTS_IN_FLIGHT) -> List[Optional[Parameter]]:
+        """Pipelined version of set(). Return the parameters after the change in the same order."""
+        requests = [param.create_getset_request() for param in params]
+        return self._request_many(requests, max_in_flight)
+
+    def apply(self, params : List[Parameter], max_in_flight : int = MAX_REQUESTS_IN_FLIGHT) -> ParametersUpdate:
+        """
+        Read the current values in one pass and write only the parameters that differ.
+        If nothing is changed, there is no need to store the parameters and restart the node.
+        """
+        update = ParametersUpdate()
+        to_write = []
+        for param, actual in zip(params, self.get_many([param.name for param in params], max_in_flight)):
+            if actual is not None and actual.value is None:
+                update.failed.append(param)
+            elif actual is not None and param.is_equal(actual.value):
+                update.unchanged.append(actual)
+            else:
+                to_write.append(param)
+
+        for param, actual in zip(to_write, self.set_many(to_write, max_in_flight)):
+            if actual is None or not param.is_equal(actual.value):
+                update.failed.append(param)
+            else:
+                update.changed.append(actual)
+        return update
+
+    def _request_many(self, requests : list, max_in_flight : int) -> List[Optional[Parameter]]:
+        responses = ServiceClient.call_many(self.node, requests, self._target_node_id, max_in_flight)
+        return [None if response is None else ParametersInterface._parse_response(response)
+                for response in responses]
+
+    @staticmethod
+    def _parse_response(msg) -> Parameter:
         min_value, max_value = None, None
-        if msg is None:
-            return
         if hasattr(msg.response.value, 'boolean_value'):
             value = bool(msg.response.value.boolean_value)
         elif hasattr(msg.response.value, 'integer_value'):
@@ -120,7 +287,7 @@ class ParametersInterface:
         else:
             value = None
 
-        self._parameter = Parameter(
+        return Parameter(
             name = str(msg.response.name),
             value = value,
             min_value=min_value,
@@ -133,89 +300,90 @@ class ParametersInterface:
         Empty means the parameter doesn't exist.
         """
         assert isinstance(param, Parameter)
-        self._parameter = None
-        self.node.request(param.create_getset_request(), self._target_node_id, self._callback)
-        for _ in range(20):
-            self.node.spin(0.005)
-            if self._parameter is not None:
-                break
-
-        return self._parameter
+        response = ServiceClient.call(self.node, param.create_getset_request(), self._target_node_id)
+        return None if response is None else ParametersInterface._parse_response(response)
 
 class NodeFinder:
     """
     Sscan a network for a target node.
     Possible target nodes id are [0, 126].
     Node ID 127 is intentionally ignored because it is usually occupied by debugging tools.
+    The nodes are tracked by a NodeTable shared by all finders of the same local node,
+    so only the first call listens to the bus. NodeInfo is cached in the same way and validated
+    by the live NodeStatus uptime, see NodeInfoCache.
     """
-    node_id = None
-    nodes_ids: List[int] = None
     black_list = [127]
+    _caches : Dict[int, NodeInfoCache] = {}
 
     def __init__(self, node : Optional[dronecan.node.Node] = None) -> None:
         self._node = DronecanNode().node if node is None else node
-        self._response = None
-        self._found_node_id = None
+        self.table = NodeTable.get(self._node)
 
-    def find_online_node(self, time_left_sec : float = 1.1) -> int:
+    def find_online_node(self, time_left_sec : float = 1.1) -> Optional[int]:
+        """Return the lowest ID of the online nodes seen so far or None if there are no nodes."""
         assert isinstance(time_left_sec, float)
-
-        if NodeFinder.nodes_ids is not None:
-            return NodeFinder.nodes_ids[0]
-
-        handler = self._node.add_handler(dronecan.uavcan.protocol.NodeStatus, self._node_status_cb)
-        while time_left_sec > 0.0:
-            time_left_sec -= 0.005
-            self._node.spin(0.005)
-            if self._found_node_id is not None:
-                break
-        handler.remove()
-        NodeFinder.nodes_ids = [self._found_node_id]
-        NodeFinder.node_id = self._found_node_id
-        return self._found_node_id
+        self._node.spin(0)
+        entry = self.table.wait(self.table.when_online(exclude=NodeFinder.black_list), time_left_sec)
+        return None if entry is None else self.table.get_online_node_ids(exclude=NodeFinder.black_list)[0]
 
     def find_online_nodes(self, time_lest_sec: float = 1.1) -> list:
         assert isinstance(time_lest_sec, float)
-
-        NodeFinder.nodes_ids = []
-        self._found_node_id = None
-        handler = self._node.add_handler(dronecan.uavcan.protocol.NodeStatus, self._node_status_cb)
-        while time_lest_sec > 0.0:
-            time_lest_sec -= 0.005
-            self._node.spin(0.005)
-            if self._found_node_id not in NodeFinder.nodes_ids:
-                print(f"Found node {self._found_node_id}")
-                NodeFinder.nodes_ids.append(self._found_node_id)
-        print(f"Found nodes {NodeFinder.nodes_ids}")
-        handler.remove()
-        return NodeFinder.nodes_ids
-
-    def get_info(self) -> NodeInfo:
-        node_id = self.find_online_node()
+        self.table.wait_for_discovery(time_lest_sec)
+        nodes_ids = self.table.get_online_node_ids(exclude=NodeFinder.black_list)
+        print(f"Found nodes {nodes_ids}")
+        return nodes_ids
+
+    def get_info(self, node_id : Optional[int] = None) -> Optional[NodeInfo]:
+        """NodeInfo of the given node or the first online node. None if the node didn't respond."""
+        if node_id is None:
+            node_id = self.find_online_node()
         assert node_id >= 1 and node_id <= 127
+        return self.get_infos([node_id]).get(node_id)
 
-        self._response = None
-        get_node_info_request = dronecan.uavcan.protocol.GetNodeInfo.Request()
-        self._node.request(get_node_info_request, node_id, self._node_info_response_cb)
-        for _ in range(20):
-            self._node.spin(0.005)
-            if self._response is not None:
-                return NodeInfo.create_from_dronecan_get_info_response(self._response)
-
-        return None
-
-    def _node_status_cb(self, transfer : dronecan.node.TransferEvent):
-        source_node_id = transfer.transfer.source_node_id
-        if source_node_id not in NodeFinder.black_list:
-            self._found_node_id  = source_node_id
-
-    def _node_info_response_cb(self, transfer):
-        self._response = transfer
+    def get_infos(self, node_ids : Optional[List[int]] = None) -> Dict[int, NodeInfo]:
+        """
+        NodeInfo of the given nodes or all online nodes. The nodes that are not cached are asked
+        concurrently. The nodes that didn't respond are not in the result.
+        """
+        if node_ids is None:
+            node_ids = self.find_online_nodes()
+        self._node.spin(0)
+
+        cache = NodeFinder._get_cache(self._node)
+        infos = {}
+        entries = {}
+        for node_id in node_ids:
+            entry = self.table.get_entry(node_id)
+            entries[node_id] = entry if entry is not None and entry.is_online else None
+            if entries[node_id] is not None:
+                info = cache.get(node_id, entry.uptime_sec, entry.last_seen)
+                if info is not None:
+                    infos[node_id] = info
+
+        node_ids_to_ask = [node_id for node_id in node_ids if node_id not in infos]
+        request = dronecan.uavcan.protocol.GetNodeInfo.Request()
+        for node_id, response in zip(node_ids_to_ask, ServiceClient.call_each(self._node, request, node_ids_to_ask)):
+            if response is not None:
+                infos[node_id] = NodeInfo.create_from_dronecan_get_info_response(response)
+                entry = entries[node_id]
+                if entry is not None:
+                    cache.put(infos[node_id], entry.uptime_sec, entry.last_seen)
+
+        return {node_id : infos[node_id] for node_id in node_ids if node_id in infos}
+
+    @staticmethod
+    def _get_cache(node : dronecan.node.Node) -> NodeInfoCache:
+        if id(node) not in NodeFinder._caches:
+            NodeFinder._caches[id(node)] = NodeInfoCache()
+        return NodeFinder._caches[id(node)]
 
 class NodeCommander:
     """
     Wrapper under ExecuteCommand
     """
+    RESTART_TIMEOUT_SEC = 5.0
+    MODE_OPERATIONAL = dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL
+
     def __init__(self, node : Optional[dronecan.node.Node] = None, target_node_id : Optional[int] = None) -> None:
         if isinstance(node, dronecan.node.Node):
             self.node = node
@@ -233,36 +401,41 @@ class NodeCommander:
             assert False, "target_node_id argument should be either integer or None"
 
 
-        self._stored = False
-        self._restarted = False
-
     def store_persistent_states(self):
+        # A retry would have a new transfer ID, so a late response to the first attempt would be
+        # dropped and the node would write the flash again. The request is not repeated
         req = dronecan.uavcan.protocol.param.ExecuteOpcode.Request(opcode=0)
-        self.node.request(req, self.dest_node_id, self._execute_opcode_response_cb)
-        self._stored = None
-        for _ in range(20):
-            self.node.spin(0.005)
-            if self._stored is not None:
-                break
-        return self._stored
+        response = ServiceClient.call(self.node, req, self.dest_node_id, max_attempts=1)
+        return None if response is None else response.response.ok
 
-    def restart(self):
-        req = dronecan.uavcan.protocol.RestartNode.Request(magic_number=0xACCE551B1E)
-        self.node.request(req, self.dest_node_id, self._restart_node_response_cb)
-        self._restarted = None
-        for _ in range(20):
-            self.node.spin(0.005)
-            if self._restarted is not None:
-                break
-        return self._restarted
+    def restart_and_wait(self, timeout_sec : float = RESTART_TIMEOUT_SEC) -> Optional[float]:
+        """
+        Restart the node and wait until its uptime is reset and it is operational again.
+        Return the reboot time in seconds or None if the node hasn't come back within the timeout.
+        """
+        table = NodeTable.get(self.node)
+        end_time = time.monotonic() + timeout_sec
+
+        # The uptime resolution is 1 second, so a reset from 0 to 0 can't be noticed
+        if table.wait(table.when(self.dest_node_id, lambda entry: entry.uptime_sec > 0), timeout_sec) is None:
+            return None
 
-    def _execute_opcode_response_cb(self, transfer_event):
-        assert isinstance(transfer_event, dronecan.node.TransferEvent)
-        self._stored = transfer_event.transfer.payload.ok
+        rebooted = table.when_reappears(self.dest_node_id)
+        start_time = time.monotonic()
+        self.restart()
+        if table.wait(rebooted, end_time - time.monotonic()) is None:
+            return None
 
-    def _restart_node_response_cb(self, transfer_event : Optional[dronecan.node.TransferEvent]):
-        if isinstance(transfer_event, dronecan.node.TransferEvent):
-            self._restarted = transfer_event.transfer.payload.ok
+        operational = table.when(self.dest_node_id, lambda entry: entry.mode == NodeCommander.MODE_OPERATIONAL)
+        if table.wait(operational, end_time - time.monotonic()) is None:
+            return None
+        return time.monotonic() - start_time
+
+    def restart(self):
+        # A node may restart before the response is sent, so the request is not repeated
+        req = dronecan.uavcan.protocol.RestartNode.Request(magic_number=0xACCE551B1E)
+        response = ServiceClient.call(self.node, req, self.dest_node_id, max_attempts=1)
+        return None if response is None else response.response.ok
 
 
 # Tests
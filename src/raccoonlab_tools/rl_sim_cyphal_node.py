@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Spec-compliant simulated Cyphal node.
+
+It passes rl-test-cyphal-specification without any hardware:
+- Heartbeat (mode OPERATIONAL), GetInfo and port.List are served by pycyphal,
+- register List/Access with a register file as the persistent memory,
+- ExecuteCommand: restart, store persistent states, factory reset, begin software update
+  (the image is read with uavcan.file.Read like a bootloader does, then the node restarts),
+- a publisher configured via the standard uavcan.pub.voltage.id/type registers.
+
+The register file is written on every register modification, so "store persistent states"
+always succeeds. A restart recreates the node from the register file and resets the uptime.
+
+Usage example:
+python rl_sim_cyphal_node.py --iface socketcan:vcan0 --node-id 42
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import argparse
+import tempfile
+from typing import Optional
+
+import pycyphal.application
+# pylint: disable=import-error
+import uavcan.file
+import uavcan.node
+import uavcan.node.ExecuteCommand_1_1
+import uavcan.si.unit.voltage.Scalar_1_0
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY_SEC = 0.1
+PUBLISH_PERIOD_SEC = 0.1
+FILE_READ_SIZE = 256
+FILE_READ_ATTEMPTS = 3
+
+class SimulatedCyphalNode:
+    def __init__(self, iface : str, node_id : int, register_file : str,
+                 name : str = "co.raccoonlab.sim_node") -> None:
+        self.iface = iface
+        self.node_id = node_id
+        self.register_file = register_file
+        self.name = name
+        self.node = None
+        self._restart_requested = asyncio.Event()
+        self._update_task = None
+
+    async def run(self) -> None:
+        """Run the node forever. A restart request closes the node and creates it again."""
+        while True:
+            self._restart_requested.clear()
+            self.node = self._make_node()
+            publisher_task = asyncio.create_task(self._publish())
+
+            await self._restart_requested.wait()
+            await asyncio.sleep(RESTART_DELAY_SEC)  # let the response leave the node
+            publisher_task.cancel()
+            self.node.close()
+            logger.info("Restart")
+
+    def _make_node(self) -> pycyphal.application._node.Node:
+        environment_variables = dict(os.environ)
+        environment_variables["UAVCAN__CAN__IFACE"] = self.iface
+        environment_variables["UAVCAN__NODE__ID"] = str(self.node_id)
+        registry = pycyphal.application.make_registry(self.register_file, environment_variables)
+
+        node_info = uavcan.node.GetInfo_1_0.Response(
+            protocol_version=uavcan.node.Version_1_0(major=1, minor=0),
+            hardware_version=uavcan.node.Version_1_0(major=1, minor=0),
+            software_version=uavcan.node.Version_1_0(major=1, minor=0),
+            software_vcs_revision_id=0x5151A7ED,
+            unique_id=bytes([self.node_id] + [0x5A] * 15),
+            name=self.name,
+        )
+        node = pycyphal.application.make_node(node_info, registry)
+        node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
+
+        server = node.get_server(uavcan.node.ExecuteCommand_1_1)
+        server.serve_in_background(self._on_execute_command)
+
+        node.start()
+        return node
+
+    async def _publish(self) -> None:
+        """Publish a dummy voltage if uavcan.pub.voltage.id is configured."""
+        try:
+            publisher = self.node.make_publisher(uavcan.si.unit.voltage.Scalar_1_0, "voltage")
+        except pycyphal.application.PortNotConfiguredError:
+            logger.info("uavcan.pub.voltage.id is not configured")
+            return
+
+        while True:
+            await publisher.publish(uavcan.si.unit.voltage.Scalar_1_0(5.0))
+            await asyncio.sleep(PUBLISH_PERIOD_SEC)
+
+    async def _on_execute_command(self,
+                                  request : uavcan.node.ExecuteCommand_1_1.Request,
+                                  metadata : pycyphal.presentation.ServiceRequestMetadata,
+                                  ) -> Optional[uavcan.node.ExecuteCommand_1_1.Response]:
+        logger.info(f"ExecuteCommand {request.command} from {metadata.client_node_id}")
+        response = uavcan.node.ExecuteCommand_1_1.Response(uavcan.node.ExecuteCommand_1_1.Response.STATUS_SUCCESS)
+
+        if request.command == uavcan.node.ExecuteCommand_1_1.Request.COMMAND_RESTART:
+            self._restart_requested.set()
+        elif request.command == uavcan.node.ExecuteCommand_1_1.Request.COMMAND_STORE_PERSISTENT_STATES:
+            pass  # the register file is already up to date
+        elif request.command == uavcan.node.ExecuteCommand_1_1.Request.COMMAND_FACTORY_RESET:
+            self.node.registry.clear()
+            self._restart_requested.set()
+        elif request.command == uavcan.node.ExecuteCommand_1_1.Request.COMMAND_BEGIN_SOFTWARE_UPDATE:
+            if self._update_task is not None and not self._update_task.done():
+                response.status = uavcan.node.ExecuteCommand_1_1.Response.STATUS_BAD_STATE
+            else:
+                path = request.parameter.tobytes()
+                self._update_task = asyncio.create_task(self._update_software(metadata.client_node_id, path))
+        else:
+            response.status = uavcan.node.ExecuteCommand_1_1.Response.STATUS_BAD_COMMAND
+
+        return response
+
+    async def _update_software(self, server_node_id : int, path : bytes) -> None:
+        """Read the image like a bootloader does and restart if it has been read successfully."""
+        logger.info(f"Update from node {server_node_id}: {path.decode(errors='replace')}")
+        self.node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.SOFTWARE_UPDATE
+        client = self.node.make_client(uavcan.file.Read_1_1, server_node_id)
+        image = bytearray()
+        error = None
+        while error is None:
+            request = uavcan.file.Read_1_1.Request(offset=len(image), path=uavcan.file.Path_2_0(path))
+            for _ in range(FILE_READ_ATTEMPTS):
+                response = await client.call(request)
+                if response is not None:
+                    break
+            if response is None:
+                error = "no response"
+            elif response[0].error.value != uavcan.file.Error_1_0.OK:
+                error = f"error {response[0].error.value}"
+            else:
+                data = response[0].data.value.tobytes()
+                image += data
+                if len(data) < FILE_READ_SIZE:
+                    break
+        client.close()
+
+        if error is not None:
+            logger.error(f"Update failed: {error}")
+            self.node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
+            return
+        logger.info(f"Update finished: {len(image)} bytes, sha256 {hashlib.sha256(image).hexdigest()}")
+        self._restart_requested.set()
+
+async def main(iface : str, node_id : int, register_file : Optional[str]):
+    if register_file is None:
+        register_file = os.path.join(tempfile.gettempdir(), f"rl_sim_cyphal_node_{node_id}.db")
+    await SimulatedCyphalNode(iface, node_id, register_file).run()
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Spec-compliant simulated Cyphal node")
+    parser.add_argument("--iface", default="socketcan:vcan0", type=str,
+                        help="Cyphal transport. Examples: socketcan:vcan0, slcan:/dev/ttyACM0@1000000")
+    parser.add_argument("--node-id", default=42, type=int, help="Node ID from 1 to 126")
+    parser.add_argument("--register-file", default=None, type=str,
+                        help="Register file used as the persistent memory")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.iface, args.node_id, args.register_file))
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt")
@@ -3,11 +3,14 @@
 # Copyright (c) 2023-2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 import asyncio
+import functools
 import pycyphal.application
 import uavcan
 import zubax.telega.CompactFeedback_1_0 as CompactFeedback_1_0
 import reg.udral.physics.optics
 
+from raccoonlab_tools.cyphal.frame_cache import CachedPublisher
+
 async def heartbeat_callback(data, transfer_from):
     print(data)
 
@@ -37,18 +40,19 @@ async def main():
     node.start()
 
     feedback_publishers = [
-        node.make_publisher(CompactFeedback_1_0, 3000),
-        node.make_publisher(CompactFeedback_1_0, 3001),
-        node.make_publisher(CompactFeedback_1_0, 3002),
-        node.make_publisher(CompactFeedback_1_0, 3003),
+        CachedPublisher(node.make_publisher(CompactFeedback_1_0, 3000)),
+        CachedPublisher(node.make_publisher(CompactFeedback_1_0, 3001)),
+        CachedPublisher(node.make_publisher(CompactFeedback_1_0, 3002)),
+        CachedPublisher(node.make_publisher(CompactFeedback_1_0, 3003)),
     ]
 
     heartbeat_sub = node.make_subscriber(uavcan.node.Heartbeat_1_0)
     heartbeat_sub.receive_in_background(heartbeat_callback)
 
+    feedback = (50.0, 0.5, 100, 5)
     for _ in range(1000):
         for fb_pub in feedback_publishers:
-            await fb_pub.publish(serialize_compact_feedback(50.0, 0.5, 100, 5))
+            await fb_pub.publish(functools.partial(serialize_compact_feedback, *feedback), key=feedback)
         await asyncio.sleep(0.1)
 
 if __name__ == "__main__":
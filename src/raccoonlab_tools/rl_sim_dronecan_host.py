@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+DroneCAN simulator host.
+
+Many virtual nodes described in a YAML scenario are driven from a single scheduler and a single
+CAN transport, so a large vehicle bus can be emulated from one process. Every virtual node
+publishes NodeStatus and the listed messages from its own node ID. The commands are received
+with one anonymous node. The virtual nodes don't respond to services.
+
+Scenario example:
+
+port: mcast:0                       # optional, --port has a priority
+seed: 0                             # optional, makes the noise reproducible
+nodes:
+  - name: battery
+    node_id: 60
+    publishers:
+      - type: uavcan.equipment.power.BatteryInfo
+        rate: 2
+        fields:
+          model_name: simulated_battery
+          temperature: 310
+          voltage: {sine: {offset: 30.0, amplitude: 0.5, period: 20}}
+          current: {noise: {mean: 5.0, sigma: 0.3}}
+          state_of_charge_pct: {ramp: {start: 100, stop: 0, duration: 600}}
+  - name: esc1
+    node_id: 61
+    publishers:
+      - type: uavcan.equipment.esc.Status
+        rate: 10
+        fields:
+          esc_index: 0
+          rpm: {replay: {values: [0, 1000, 2000, 1000]}}
+          voltage: {replay: {file: esc_log.csv, column: voltage}}
+    reactions:
+      - type: uavcan.equipment.esc.RawCommand
+        source: cmd[0]
+        target: uavcan.equipment.esc.Status.power_rating_pct
+        scale: 0.0122
+        timeout: 0.5                # back to the generator if the commands stop
+
+Value generators: a constant, sine, ramp, noise and replay (a list of values or a CSV column, one
+value per publication). A reaction overrides a published field with a received field value
+multiplied by scale plus offset.
+
+Usage example:
+python rl_sim_dronecan_host.py scenario.yaml --port vcan0
+"""
+import re
+import csv
+import sys
+import math
+import time
+import heapq
+import logging
+import argparse
+import itertools
+from typing import Any, Dict, List, Optional
+
+import yaml
+import numpy as np
+import dronecan
+
+from raccoonlab_tools.dronecan.frame_cache import FrameCache
+
+logger = logging.getLogger(__name__)
+
+NODE_STATUS_PERIOD_SEC = 1.0
+
+class ScenarioError(Exception):
+    """Exception raised when the scenario file is invalid."""
+
+
+class ConstantGenerator:
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def get(self, _time_sec : float):
+        return self.value
+
+class SineGenerator:
+    def __init__(self, amplitude : float, period : float, offset : float = 0.0, phase : float = 0.0) -> None:
+        assert period > 0
+        self.amplitude = amplitude
+        self.period = period
+        self.offset = offset
+        self.phase = phase
+
+    def get(self, time_sec : float) -> float:
+        return self.offset + self.amplitude * math.sin(2 * math.pi * time_sec / self.period + self.phase)
+
+class RampGenerator:
+    def __init__(self, start : float, stop : float, duration : float, repeat : bool = False) -> None:
+        assert duration > 0
+        self.start = start
+        self.stop = stop
+        self.duration = duration
+        self.repeat = repeat
+
+    def get(self, time_sec : float) -> float:
+        progress = (time_sec % self.duration if self.repeat else min(time_sec, self.duration)) / self.duration
+        return self.start + (self.stop - self.start) * progress
+
+class NoiseGenerator:
+    def __init__(self, rng : np.random.Generator, mean : float = 0.0, sigma : float = 1.0) -> None:
+        self.rng = rng
+        self.mean = mean
+        self.sigma = sigma
+
+    def get(self, _time_sec : float) -> float:
+        return float(self.rng.normal(self.mean, self.sigma))
+
+class ReplayGenerator:
+    """Return the next recorded value on every call and start from the beginning at the end."""
+    def __init__(self, values : List[Any]) -> None:
+        if len(values) == 0:
+            raise ScenarioError("Replay requires at least one value")
+        self._values = itertools.cycle(values)
+
+    def get(self, _time_sec : float):
+        return next(self._values)
+
+    @staticmethod
+    def from_csv(path : str, column : str) -> "ReplayGenerator":
+        with open(path, "r", encoding="utf-8", newline="") as stream:
+            return ReplayGenerator([float(row[column]) for row in csv.DictReader(stream)])
+
+def make_generator(spec, rng : np.random.Generator):
+    """A dictionary with a single generator name is a generator, anything else is a constant."""
+    if not isinstance(spec, dict):
+        return ConstantGenerator(spec)
+    if len(spec) != 1:
+        raise ScenarioError(f"Expected a single generator, got {list(spec)}")
+
+    name, params = next(iter(spec.items()))
+    params = params or {}
+    try:
+        if name == "constant":
+            return ConstantGenerator(params["value"])
+        if name == "sine":
+            return SineGenerator(**params)
+        if name == "ramp":
+            return RampGenerator(**params)
+        if name == "noise":
+            return NoiseGenerator(rng, **params)
+        if name == "replay":
+            if "file" in params:
+                return ReplayGenerator.from_csv(params["file"], params["column"])
+            return ReplayGenerator(params["values"])
+    except (KeyError, TypeError) as err:
+        raise ScenarioError(f"Bad parameters of the {name} generator: {err}") from err
+    raise ScenarioError(f"Unknown generator {name}")
+
+
+class FieldPath:
+    """
+    Access to a field of a DroneCAN message by a path like `cmd[0]` or `commands[1].command_value`.
+    """
+    TOKEN_RE = re.compile(r"([A-Za-z_]\w*)|\[(\d+)\]")
+
+    def __init__(self, path : str) -> None:
+        self.path = path
+        self._tokens = [name if name else int(index) for name, index in FieldPath.TOKEN_RE.findall(path)]
+        if len(self._tokens) == 0 or not isinstance(self._tokens[0], str):
+            raise ScenarioError(f"Bad field path {path}")
+
+    def get(self, msg):
+        value = msg
+        for token in self._tokens:
+            value = getattr(value, token) if isinstance(token, str) else value[token]
+        return value
+
+    def set(self, msg, value) -> None:
+        parent = msg
+        for token in self._tokens[:-1]:
+            parent = getattr(parent, token) if isinstance(token, str) else parent[token]
+
+        name = self._tokens[-1]
+        if not isinstance(name, str):
+            raise ScenarioError(f"Only named fields can be published: {self.path}")
+        # pylint: disable=protected-access
+        field = parent._fields.get(name)
+        if field is None:
+            raise ScenarioError(f"{dronecan.get_dronecan_data_type(parent).full_name} doesn't have field {name}")
+        setattr(parent, name, FieldPath._cast(field._type, value))
+
+    @staticmethod
+    def _cast(field_type, value):
+        if isinstance(field_type, dronecan.dsdl.ArrayType):
+            if isinstance(value, str):
+                return value
+            return [FieldPath._cast(field_type.value_type, item) for item in value]
+        if isinstance(field_type, dronecan.dsdl.PrimitiveType):
+            if field_type.kind == dronecan.dsdl.PrimitiveType.KIND_BOOLEAN:
+                return bool(value)
+            if field_type.kind in (dronecan.dsdl.PrimitiveType.KIND_UNSIGNED_INT,
+                                   dronecan.dsdl.PrimitiveType.KIND_SIGNED_INT):
+                return int(round(value))
+            return float(value)
+        return value
+
+
+class VirtualPublisher:
+    def __init__(self, node_id : int, config : dict, rng : np.random.Generator) -> None:
+        try:
+            self.data_type = dronecan.TYPENAMES[config["type"]]
+            self.period_sec = 1.0 / float(config["rate"])
+        except KeyError as err:
+            raise ScenarioError(f"Node {node_id}: bad publisher {config}") from err
+
+        self.msg = self.data_type()
+        self.fields = {FieldPath(path) : make_generator(spec, rng)
+                       for path, spec in (config.get("fields") or {}).items()}
+        self.overrides : Dict[str, tuple] = {}  # field path -> (FieldPath, value, expiration time)
+
+        # Static messages are serialized only once
+        self.is_static = all(isinstance(generator, ConstantGenerator) for generator in self.fields.values())
+        for path, generator in self.fields.items():
+            path.set(self.msg, generator.get(0.0))
+
+    @property
+    def type_name(self) -> str:
+        return self.data_type.full_name
+
+    def update(self, time_sec : float) -> None:
+        for path, generator in self.fields.items():
+            if not isinstance(generator, ConstantGenerator):
+                path.set(self.msg, generator.get(time_sec))
+
+        for name, (path, value, expiration_time) in list(self.overrides.items()):
+            if expiration_time > time_sec:
+                path.set(self.msg, value)
+            else:
+                del self.overrides[name]
+                self._restore(path)
+
+    def override(self, path : str, value, expiration_time : float) -> None:
+        self.is_static = False
+        self.overrides[path] = (FieldPath(path), value, expiration_time)
+
+    def _restore(self, path : FieldPath) -> None:
+        for field_path, generator in self.fields.items():
+            if field_path.path == path.path:
+                if isinstance(generator, ConstantGenerator):
+                    field_path.set(self.msg, generator.value)
+                return
+        path.set(self.msg, 0)
+
+
+class VirtualNode:
+    def __init__(self, host_node : dronecan.node.Node, config : dict, rng : np.random.Generator) -> None:
+        try:
+            self.node_id = int(config["node_id"])
+        except (KeyError, ValueError) as err:
+            raise ScenarioError(f"Bad node {config}") from err
+        if not 1 <= self.node_id <= 127:
+            raise ScenarioError(f"Node ID {self.node_id} is out of range")
+
+        self.name = config.get("name", f"node{self.node_id}")
+        self.sender = FrameCache(host_node, source_node_id=self.node_id)
+        self.publishers = [VirtualPublisher(self.node_id, pub, rng) for pub in config.get("publishers") or []]
+        self.reactions = config.get("reactions") or []
+        self.node_status = dronecan.uavcan.protocol.NodeStatus(
+            health=dronecan.uavcan.protocol.NodeStatus().HEALTH_OK,
+            mode=dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL)
+
+    def find_publisher(self, type_name : str) -> Optional[VirtualPublisher]:
+        for publisher in self.publishers:
+            if publisher.type_name == type_name:
+                return publisher
+        return None
+
+
+class SimulatorHost:
+    """
+    One scheduler and one transport for all virtual nodes.
+    The scheduler is a heap of the next publication times, the node spins until the nearest one.
+    """
+    def __init__(self, port : str, scenario : dict) -> None:
+        rng = np.random.default_rng(scenario.get("seed"))
+        self.node = dronecan.make_node(port, node_id=None, bitrate=1000000, baudrate=1000000)
+        self.virtual_nodes = [VirtualNode(self.node, config, rng) for config in scenario.get("nodes") or []]
+        if len({node.node_id for node in self.virtual_nodes}) != len(self.virtual_nodes):
+            raise ScenarioError("Node IDs of the virtual nodes must be unique")
+
+        self._start_time = 0.0
+        self._schedule = []
+        self._add_reactions()
+
+    def run(self, duration_sec : float = 0.0) -> None:
+        self._start_time = self._monotonic()
+        for idx, virtual_node in enumerate(self.virtual_nodes):
+            heapq.heappush(self._schedule, (self._start_time, idx, -1))
+            for pub_idx, publisher in enumerate(virtual_node.publishers):
+                heapq.heappush(self._schedule, (self._start_time + publisher.period_sec, idx, pub_idx))
+
+        while duration_sec <= 0 or self._monotonic() - self._start_time < duration_sec:
+            crnt_time = self._monotonic()
+            while self._schedule and self._schedule[0][0] <= crnt_time:
+                deadline, idx, pub_idx = heapq.heappop(self._schedule)
+                period = self._publish(self.virtual_nodes[idx], pub_idx, crnt_time - self._start_time)
+                next_deadline = deadline + period
+                if next_deadline < crnt_time:
+                    next_deadline = crnt_time + period  # skip the missed publications instead of a burst
+                heapq.heappush(self._schedule, (next_deadline, idx, pub_idx))
+
+            timeout = self._schedule[0][0] - self._monotonic() if self._schedule else 0.1
+            self.node.spin(max(timeout, 0.0))
+
+    def _publish(self, virtual_node : VirtualNode, pub_idx : int, time_sec : float) -> float:
+        if pub_idx == -1:
+            virtual_node.node_status.uptime_sec = int(time_sec)
+            virtual_node.sender.send(virtual_node.node_status)
+            return NODE_STATUS_PERIOD_SEC
+
+        publisher = virtual_node.publishers[pub_idx]
+        if publisher.is_static:
+            virtual_node.sender.broadcast(publisher.msg, key=pub_idx)
+        else:
+            publisher.update(time_sec)
+            virtual_node.sender.send(publisher.msg)
+        return publisher.period_sec
+
+    def _add_reactions(self) -> None:
+        """A single handler per command type serves the reactions of all virtual nodes."""
+        reactions_by_type : Dict[str, list] = {}
+        for virtual_node in self.virtual_nodes:
+            for reaction in virtual_node.reactions:
+                try:
+                    type_name = reaction["type"]
+                    source = FieldPath(reaction["source"])
+                    target_type, target_field = reaction["target"].rsplit(".", 1)
+                except (KeyError, ValueError) as err:
+                    raise ScenarioError(f"Node {virtual_node.node_id}: bad reaction {reaction}") from err
+
+                publisher = virtual_node.find_publisher(target_type)
+                if publisher is None:
+                    raise ScenarioError(f"Node {virtual_node.node_id} doesn't publish {target_type}")
+                if type_name not in dronecan.TYPENAMES:
+                    raise ScenarioError(f"Unknown data type {type_name}")
+
+                reactions_by_type.setdefault(type_name, []).append((
+                    source,
+                    publisher,
+                    target_field,
+                    float(reaction.get("scale", 1.0)),
+                    float(reaction.get("offset", 0.0)),
+                    float(reaction.get("timeout", math.inf)),
+                ))
+
+        for type_name, reactions in reactions_by_type.items():
+            self.node.add_handler(dronecan.TYPENAMES[type_name],
+                                  lambda event, reactions=reactions: self._react(event, reactions))
+
+    def _react(self, event : dronecan.node.TransferEvent, reactions : list) -> None:
+        time_sec = self._monotonic() - self._start_time
+        for source, publisher, target_field, scale, offset, timeout in reactions:
+            try:
+                value = source.get(event.message) * scale + offset
+            except (AttributeError, IndexError):
+                continue  # for example, a RawCommand with fewer channels
+            publisher.override(target_field, value, time_sec + timeout)
+
+    @staticmethod
+    def _monotonic() -> float:
+        return time.monotonic()
+
+def load_scenario(path : str) -> dict:
+    with open(path, "r", encoding="utf-8") as stream:
+        scenario = yaml.safe_load(stream)
+    if not isinstance(scenario, dict) or not scenario.get("nodes"):
+        raise ScenarioError(f"{path} doesn't have any node")
+    return scenario
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many virtual DroneCAN nodes described in a YAML scenario")
+    parser.add_argument("scenario", help="Path to the YAML scenario")
+    parser.add_argument("--port", default=None, type=str,
+                        help="CAN device name. Examples: vcan0, mcast:0, slcan:/dev/ttyACM0")
+    parser.add_argument("--duration", default=0.0, type=float, help="Duration in seconds, 0 means forever")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    try:
+        scenario = load_scenario(args.scenario)
+        port = args.port or scenario.get("port")
+        if port is None:
+            raise ScenarioError("The port is specified neither in the scenario nor with --port")
+        host = SimulatorHost(port, scenario)
+    except (ScenarioError, OSError) as err:
+        logger.error(err)
+        sys.exit(1)
+
+    for virtual_node in host.virtual_nodes:
+        types = ", ".join(publisher.type_name for publisher in virtual_node.publishers)
+        logger.info(f"{virtual_node.name} ({virtual_node.node_id}): {types}")
+
+    try:
+        host.run(args.duration)
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt")
+
+if __name__ =="__main__":
+    main()
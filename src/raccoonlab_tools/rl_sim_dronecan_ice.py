@@ -4,19 +4,46 @@
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 """
 Simulated DroneCAN Internal Combustion Engine (ICE)
+
+Several engines can be simulated on one bus from one process with --engines N.
+Engine i is controlled by RawCommand.cmd[7 + i] and ArrayCommand actuator_id 10 + i and publishes
+ice.reciprocating.Status and NodeStatus from node ID node_id + i.
+
+With --time-scale the models use a simulated clock with a fixed timestep instead of the wall clock,
+so they can run faster than real time. With --seed the RPM noise is reproducible.
+Without a CAN bus, the models can be run as fast as possible with simulate(), for example to check
+thermal and overheat scenarios in CI.
 """
 import sys
 import time
 import math
 import logging
 import argparse
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import dronecan
 
 logger = logging.getLogger(__name__)
 
+class WallClock:
+    def time(self) -> float:
+        return time.time()
+
+class SimulatedClock:
+    """
+    A clock that moves only when it is advanced, so the models don't depend on the wall time.
+    """
+    def __init__(self, start_time: float = 0.0):
+        self._time = float(start_time)
+
+    def time(self) -> float:
+        return self._time
+
+    def advance(self, dt: float) -> None:
+        assert dt >= 0
+        self._time += dt
+
 class Controller:
     """
     +-----------------------------+     +-----------------------------+
@@ -30,7 +57,9 @@ class Controller:
     """
     EXPECTED_MIN_RPM = 1500
 
-    def __init__(self):
+    def __init__(self, clock=None):
+        self.clock = WallClock() if clock is None else clock
+
         # Input
         self.in_gas_throttle_pct = 0
         self.in_gas_throttle_timestamp = 0.0
@@ -58,7 +87,7 @@ class Controller:
             self._reset()
             return
 
-        crnt_time = time.time()
+        crnt_time = self.clock.time()
 
         self.out_spark_ignition_enabled = True
         self.out_gas_throttle_pct = self.in_gas_throttle_pct
@@ -73,7 +102,7 @@ class Controller:
 
     def set_gas_throttle_pct(self, in_gas_throttle_pct):
         self.in_gas_throttle_pct = max(0, min(in_gas_throttle_pct, 100))
-        self.in_gas_throttle_timestamp = time.time()
+        self.in_gas_throttle_timestamp = self.clock.time()
 
     def get_voltage_5v(self) -> float:
         return 5.0
@@ -85,7 +114,7 @@ class Controller:
         return 273.15 + Engine.ENVIRONMENT_TEMPERATURE_CELSIUS
 
     def _reset(self):
-        self.__init__()
+        self.__init__(self.clock)
 
     def __str__(self):
         return ("Controller("
@@ -108,6 +137,9 @@ class Engine:
     T1 = 0.5
     T2 = 30.0
 
+    # The models are updated with a fixed timestep
+    TIME_STEP_SEC = 0.2
+
     # When the engine’s cylinder head temperature (CHT) is below this temperature, the output is
     # poor. At these lower temperatures the fuel vaporization and combustion are not yet optimal.
     COLD_TRESHOLD_CELCIUS = 50
@@ -131,7 +163,8 @@ class Engine:
     ICE_IDLE_RPM = 2500
     ICE_MAX_RPM = 9000
 
-    def __init__(self):
+    def __init__(self, clock=None, seed: Optional[int] = None):
+        self.clock = WallClock() if clock is None else clock
         self.rpm = int(0)
         self.temperature_celsius = float(self.ENVIRONMENT_TEMPERATURE_CELSIUS)
         self.failure_deadline = 0.0
@@ -141,7 +174,7 @@ class Engine:
         self.in_starter_enabled = False
         self.in_spark_ignition_enabled = False
 
-        self._rng = np.random.default_rng()
+        self._rng = np.random.default_rng(seed)
 
     def get_noisy_rpm(self, sigma=300.0) -> int:
         assert isinstance(sigma, float)
@@ -171,7 +204,7 @@ class Engine:
         else:
             starter_target_rpm = 0.0
 
-        if self.rpm >= 100 and gas_throttle_pct >= 10 and spark_ignition_enabled and self.failure_deadline < time.time():
+        if self.rpm >= 100 and gas_throttle_pct >= 10 and spark_ignition_enabled and self.failure_deadline < self.clock.time():
             engine_target_rpm = self.ICE_IDLE_RPM + (self.ICE_MAX_RPM - self.ICE_IDLE_RPM) * gas_throttle_pct / 100
             engine_target_rpm *= self._temperature_factor()
         else:
@@ -179,14 +212,14 @@ class Engine:
 
         target_rpm = max(starter_target_rpm, engine_target_rpm)
 
-        self.rpm = int(target_rpm + (self.rpm - target_rpm) * math.exp(-0.2 / self.T1))
+        self.rpm = int(target_rpm + (self.rpm - target_rpm) * math.exp(-self.TIME_STEP_SEC / self.T1))
 
         if target_rpm == 0:
             target_celcius = 0.0
         else:
             target_celcius = self.MAX_SIMULATED_TEMPERATURE_CELSIUS * (0.5 + 0.5 * gas_throttle_pct / 100)
 
-        self.temperature_celsius = target_celcius + (self.temperature_celsius - target_celcius) * math.exp(-0.2 / self.T2)
+        self.temperature_celsius = target_celcius + (self.temperature_celsius - target_celcius) * math.exp(-self.TIME_STEP_SEC / self.T2)
 
     def get_temperature_kelvin(self) -> float:
         return self.temperature_celsius + 273.15
@@ -201,7 +234,7 @@ class Engine:
             return max(0.8, 1.0 - 0.2 * overheat_amount / max_overheat_amount)
 
         if self.temperature_celsius >= self.CRITICAL_TRESHOLD_CELSIUS:
-            self.failure_deadline = time.time() + 10.0
+            self.failure_deadline = self.clock.time() + 10.0
             return 0.0
 
         return 1.0
@@ -211,11 +244,92 @@ class Engine:
                 f"temperature={int(self.temperature_celsius)}°C)")
 
 
+class EngineBank:
+    """
+    The same model as Engine, but for N engines at once.
+    RPM, temperature and failure deadlines are kept in NumPy arrays and updated in one vectorized step.
+    """
+    def __init__(self, number_of_engines: int, clock=None, seed: Optional[int] = None):
+        assert isinstance(number_of_engines, int) and number_of_engines > 0
+        self.clock = WallClock() if clock is None else clock
+
+        self.rpm = np.zeros(number_of_engines, dtype=np.int64)
+        self.temperature_celsius = np.full(number_of_engines, float(Engine.ENVIRONMENT_TEMPERATURE_CELSIUS))
+        self.failure_deadline = np.zeros(number_of_engines)
+
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.rpm)
+
+    def get_noisy_rpm(self, sigma=300.0) -> np.ndarray:
+        assert isinstance(sigma, float)
+
+        noisy_rpm = self._rng.normal(loc=self.rpm, scale=sigma)
+        return np.where(self.rpm < 100, 0, np.maximum(0, noisy_rpm)).astype(np.int64)
+
+    def update_engines(self, gas_throttle_pct: np.ndarray,
+                             starter_enabled: np.ndarray,
+                             spark_ignition_enabled: np.ndarray) -> None:
+        assert len(gas_throttle_pct) == len(starter_enabled) == len(spark_ignition_enabled) == len(self)
+
+        starter_target_rpm = np.where(starter_enabled, float(Engine.STARTER_RPM), 0.0)
+
+        running = (self.rpm >= 100) & (gas_throttle_pct >= 10) & spark_ignition_enabled & \
+                  (self.failure_deadline < self.clock.time())
+        engine_target_rpm = Engine.ICE_IDLE_RPM + (Engine.ICE_MAX_RPM - Engine.ICE_IDLE_RPM) * gas_throttle_pct / 100
+        engine_target_rpm = np.where(running, engine_target_rpm * self._temperature_factor(running), 0.0)
+
+        target_rpm = np.maximum(starter_target_rpm, engine_target_rpm)
+
+        self.rpm = (target_rpm + (self.rpm - target_rpm) * math.exp(-Engine.TIME_STEP_SEC / Engine.T1)).astype(np.int64)
+
+        target_celcius = np.where(target_rpm == 0,
+                                  0.0,
+                                  Engine.MAX_SIMULATED_TEMPERATURE_CELSIUS * (0.5 + 0.5 * gas_throttle_pct / 100))
+
+        self.temperature_celsius = target_celcius + (self.temperature_celsius - target_celcius) * math.exp(-Engine.TIME_STEP_SEC / Engine.T2)
+
+    def get_temperature_kelvin(self) -> np.ndarray:
+        return self.temperature_celsius + 273.15
+
+    def _temperature_factor(self, running: np.ndarray) -> np.ndarray:
+        temperature = self.temperature_celsius
+        max_overheat_amount = Engine.CRITICAL_TRESHOLD_CELSIUS - Engine.HOT_TRESHOLD_CELCIUS
+
+        cold = temperature < Engine.COLD_TRESHOLD_CELCIUS
+        hot = (temperature >= Engine.HOT_TRESHOLD_CELCIUS) & (temperature < Engine.CRITICAL_TRESHOLD_CELSIUS)
+        critical = temperature >= Engine.CRITICAL_TRESHOLD_CELSIUS
+
+        factor = np.ones(len(self))
+        factor = np.where(cold, np.maximum(0.5, temperature / Engine.COLD_TRESHOLD_CELCIUS), factor)
+        factor = np.where(hot, np.maximum(0.8, 1.0 - 0.2 * (temperature - Engine.HOT_TRESHOLD_CELCIUS) / max_overheat_amount), factor)
+        factor = np.where(critical, 0.0, factor)
+
+        # Only a running engine can fail, the same as Engine._temperature_factor is called only for it
+        self.failure_deadline = np.where(running & critical, self.clock.time() + 10.0, self.failure_deadline)
+
+        return factor
+
+    def __str__(self):
+        return (f"EngineBank(rpm={self.rpm.tolist()}, "
+                f"temperature={self.temperature_celsius.astype(int).tolist()}°C)")
+
+
 class Sim:
-    ICE_STATUS_PUB_RATE_HZ = 5.0
-    def __init__(self, port: Optional[str], node_id: int):
-        self.controller = Controller()
-        self.engine = Engine()
+    ICE_STATUS_PUB_RATE_HZ = 1.0 / Engine.TIME_STEP_SEC
+    GAS_THROTTLE_TIMEOUT_SEC = 0.5
+
+    def __init__(self, port: Optional[str], node_id: int,
+                 time_scale: Optional[float] = None, seed: Optional[int] = None):
+        """
+        time_scale=None means the wall clock. Otherwise, the models use a simulated clock that is
+        advanced by Engine.TIME_STEP_SEC every Engine.TIME_STEP_SEC / time_scale seconds.
+        """
+        self.time_scale = time_scale
+        self.clock = Sim._create_clock(time_scale)
+        self.controller = Controller(self.clock)
+        self.engine = Engine(self.clock, seed)
 
         self.node = Sim._create_dronecan_node(port, node_id)
 
@@ -226,7 +340,7 @@ class Sim:
         self.msg = dronecan.uavcan.equipment.ice.reciprocating.Status()
 
     def spin_once(self):
-        if time.time() > self.controller.in_gas_throttle_timestamp + 0.5:
+        if self.clock.time() > self.controller.in_gas_throttle_timestamp + Sim._get_gas_throttle_timeout(self.time_scale):
             self.controller.in_gas_throttle_pct = 0
 
         # Simulate the controller behaviour (ice node)
@@ -251,7 +365,7 @@ class Sim:
         self.msg.oil_pressure = self.controller.get_voltage_vin()
 
         self.node.broadcast(self.msg)
-        self.node.spin(1.0 / self.ICE_STATUS_PUB_RATE_HZ)
+        Sim._spin_time_step(self.node, self.clock, self.time_scale)
 
     def _gas_throttle_callback(self, event: dronecan.node.TransferEvent):
         if len(event.message.cmd) >= 8:
@@ -265,6 +379,26 @@ class Sim:
                 in_air_throttle_pct = int((actuator_command.command_value - 1000) * 0.1)
                 self.controller.in_air_throttle_pct = max(0, min(in_air_throttle_pct, 100))
 
+    @staticmethod
+    def _create_clock(time_scale: Optional[float]):
+        if time_scale is None:
+            return WallClock()
+        assert time_scale > 0
+        return SimulatedClock()
+
+    @staticmethod
+    def _get_gas_throttle_timeout(time_scale: Optional[float]) -> float:
+        # The commands arrive in real time, so the timeout is kept in real time as well
+        return Sim.GAS_THROTTLE_TIMEOUT_SEC * (1.0 if time_scale is None else time_scale)
+
+    @staticmethod
+    def _spin_time_step(node: dronecan.node.Node, clock, time_scale: Optional[float]) -> None:
+        if time_scale is None:
+            node.spin(Engine.TIME_STEP_SEC)
+        else:
+            node.spin(Engine.TIME_STEP_SEC / time_scale)
+            clock.advance(Engine.TIME_STEP_SEC)
+
     @staticmethod
     def _create_dronecan_node(port: Optional[str], node_id: int):
         node_info = dronecan.uavcan.protocol.GetNodeInfo.Response()
@@ -283,8 +417,136 @@ class Sim:
 
         return node
 
-def main(port: Optional[str], node_id: int):
-    sim = Sim(port, node_id)
+class MultiSim:
+    """
+    Several engines on one bus from one process.
+    A single anonymous node receives the commands. Each engine publishes its own Status and NodeStatus
+    from a distinct node ID: the transfers are encoded here and sent with the node's CAN driver.
+    The engine nodes don't respond to services, including GetNodeInfo.
+    """
+    ICE_STATUS_PUB_RATE_HZ = Sim.ICE_STATUS_PUB_RATE_HZ
+    NODE_STATUS_PUB_PERIOD_SEC = 1.0
+    GAS_THROTTLE_FIRST_CHANNEL = 7
+    AIR_THROTTLE_FIRST_ACTUATOR_ID = 10
+
+    def __init__(self, port: Optional[str], first_node_id: int, number_of_engines: int,
+                 time_scale: Optional[float] = None, seed: Optional[int] = None):
+        assert 1 <= first_node_id and first_node_id + number_of_engines - 1 <= 127, "Node ID is out of range"
+
+        self.time_scale = time_scale
+        self.clock = Sim._create_clock(time_scale)
+        self.node_ids = list(range(first_node_id, first_node_id + number_of_engines))
+        self.controllers = [Controller(self.clock) for _ in self.node_ids]
+        self.engines = EngineBank(number_of_engines, self.clock, seed)
+
+        self.node = Sim._create_dronecan_node(port, None)
+        self.node.add_handler(dronecan.uavcan.equipment.esc.RawCommand, self._gas_throttle_callback)
+        self.node.add_handler(dronecan.uavcan.equipment.actuator.ArrayCommand, self._air_throttle_callback)
+
+        self.msg = dronecan.uavcan.equipment.ice.reciprocating.Status()
+        self.node_status = dronecan.uavcan.protocol.NodeStatus(
+            health=dronecan.uavcan.protocol.NodeStatus().HEALTH_OK,
+            mode=dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL)
+
+        self._next_transfer_ids : Dict[Tuple[int, int], int] = {}
+        self._start_time = self.clock.time()
+        self._next_node_status_time = self._start_time
+
+    def spin_once(self):
+        crnt_time = self.clock.time()
+        gas_throttle_timeout = Sim._get_gas_throttle_timeout(self.time_scale)
+        for controller, rpm in zip(self.controllers, self.engines.rpm):
+            if crnt_time > controller.in_gas_throttle_timestamp + gas_throttle_timeout:
+                controller.in_gas_throttle_pct = 0
+            controller.update_controller(int(rpm))
+
+        self.engines.update_engines(np.array([ctrl.out_gas_throttle_pct for ctrl in self.controllers]),
+                                    np.array([ctrl.out_starter_enabled for ctrl in self.controllers]),
+                                    np.array([ctrl.out_spark_ignition_enabled for ctrl in self.controllers]))
+        logger.info(self.engines)
+
+        noisy_rpm = self.engines.get_noisy_rpm()
+        temperature_kelvin = self.engines.get_temperature_kelvin()
+        for idx, (node_id, controller) in enumerate(zip(self.node_ids, self.controllers)):
+            self.msg.state = controller.state
+            self.msg.engine_load_percent = controller.out_gas_throttle_pct
+            self.msg.engine_speed_rpm = int(noisy_rpm[idx])
+            self.msg.throttle_position_percent = controller.out_air_throttle_pct
+            self.msg.spark_plug_usage = controller.out_spark_ignition_enabled
+            self.msg.oil_temperature = float(temperature_kelvin[idx])
+            self.msg.coolant_temperature = controller.get_internal_stm32_temperature_kelvin()
+            self.msg.intake_manifold_pressure_kpa = controller.get_voltage_5v()
+            self.msg.oil_pressure = controller.get_voltage_vin()
+            self._broadcast(node_id, self.msg)
+
+        if crnt_time >= self._next_node_status_time:
+            self._next_node_status_time += self.NODE_STATUS_PUB_PERIOD_SEC
+            self.node_status.uptime_sec = int(crnt_time - self._start_time)
+            for node_id in self.node_ids:
+                self._broadcast(node_id, self.node_status)
+
+        Sim._spin_time_step(self.node, self.clock, self.time_scale)
+
+    def _broadcast(self, source_node_id: int, payload) -> None:
+        key = (source_node_id, dronecan.get_dronecan_data_type(payload).default_dtid)
+        transfer_id = self._next_transfer_ids.get(key, 0)
+        self._next_transfer_ids[key] = (transfer_id + 1) & 0x1F
+
+        transfer = dronecan.transport.Transfer(payload=payload,
+                                               source_node_id=source_node_id,
+                                               transfer_id=transfer_id,
+                                               transfer_priority=dronecan.node.DEFAULT_TRANSFER_PRIORITY,
+                                               service_not_message=False)
+        for frame in transfer.to_frames():
+            self.node.can_driver.send(frame.message_id, frame.bytes, extended=True)
+
+    def _gas_throttle_callback(self, event: dronecan.node.TransferEvent):
+        for idx, controller in enumerate(self.controllers):
+            channel = self.GAS_THROTTLE_FIRST_CHANNEL + idx
+            if len(event.message.cmd) > channel:
+                in_gas_throttle_pct = round(event.message.cmd[channel] * 100 / 8191.0)
+                controller.set_gas_throttle_pct(max(0, min(in_gas_throttle_pct, 100)))
+
+    def _air_throttle_callback(self, event: dronecan.node.TransferEvent):
+        for actuator_command in event.message.commands:
+            idx = actuator_command.actuator_id - self.AIR_THROTTLE_FIRST_ACTUATOR_ID
+            if 0 <= idx < len(self.controllers):
+                in_air_throttle_pct = int((actuator_command.command_value - 1000) * 0.1)
+                self.controllers[idx].in_air_throttle_pct = max(0, min(in_air_throttle_pct, 100))
+
+def simulate(duration_sec: float,
+             gas_throttle_pct: int,
+             air_throttle_pct: int = 0,
+             seed: Optional[int] = 0) -> List[Tuple[float, int, float]]:
+    """
+    Run the controller and the engine without a CAN bus as fast as possible.
+    The gas throttle is commanded every step. The result is deterministic for a given seed.
+    Return (time, noisy rpm, temperature celsius) of every step.
+    """
+    clock = SimulatedClock()
+    controller = Controller(clock)
+    engine = Engine(clock, seed)
+    controller.in_air_throttle_pct = air_throttle_pct
+
+    history = []
+    for _ in range(int(duration_sec / Engine.TIME_STEP_SEC)):
+        controller.set_gas_throttle_pct(gas_throttle_pct)
+        controller.update_controller(engine.rpm)
+        engine.update_engine(controller.out_gas_throttle_pct,
+                             controller.out_air_throttle_pct,
+                             controller.out_starter_enabled,
+                             controller.out_spark_ignition_enabled)
+        history.append((clock.time(), engine.get_noisy_rpm(), engine.temperature_celsius))
+        clock.advance(Engine.TIME_STEP_SEC)
+
+    return history
+
+def main(port: Optional[str], node_id: int, number_of_engines: int = 1,
+         time_scale: Optional[float] = None, seed: Optional[int] = None):
+    if number_of_engines == 1:
+        sim = Sim(port, node_id, time_scale, seed)
+    else:
+        sim = MultiSim(port, node_id, number_of_engines, time_scale, seed)
 
     while True:
         sim.spin_once()
@@ -303,11 +565,23 @@ if __name__ =="__main__":
                         help="CAN device name. Examples: slcan:/dev/ttyACM0, slcan0")
     parser.add_argument("--node-id",
                         default=40,
-                        type=str,
-                        help="Node ID from 1 to 127")
+                        type=int,
+                        help="Node ID from 1 to 127. With several engines, it is the node ID of the first one")
+    parser.add_argument("--engines",
+                        default=1,
+                        type=int,
+                        help="Number of simulated engines, each one with its own node ID")
+    parser.add_argument("--time-scale",
+                        default=None,
+                        type=float,
+                        help="Run the models with a fixed timestep this many times faster than real time")
+    parser.add_argument("--seed",
+                        default=None,
+                        type=int,
+                        help="Seed of the RPM noise to make the simulation reproducible")
     args = parser.parse_args()
 
     try:
-        main(args.port, args.node_id)
+        main(args.port, args.node_id, args.engines, args.time_scale, args.seed)
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupt")
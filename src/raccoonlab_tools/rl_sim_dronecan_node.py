@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Spec-compliant simulated DroneCAN node.
+
+It passes rl-test-dronecan-specification and serves the parameter tools (rl-config,
+rl-get-dronecan-params, rl-set-dronecan-params) without any hardware:
+- NodeStatus every 0.5 seconds: health OK, mode OPERATIONAL, vssc 2 (Release),
+- GetNodeInfo,
+- param.GetSet, param.ExecuteOpcode (save/erase) with a JSON file as the persistent memory,
+- RestartNode: unsaved parameters are lost and the uptime starts from zero,
+- file.BeginFirmwareUpdate: the image is read with file.Read like a bootloader does,
+  then the node restarts.
+
+Usage examples:
+python rl_sim_dronecan_node.py --port vcan0 --node-id 42
+python rl_sim_dronecan_node.py --port mcast:0 --node-id 42 --params-file node42.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import hashlib
+import logging
+import argparse
+from typing import Dict, List, Optional, Union
+from dataclasses import dataclass
+
+import dronecan
+
+logger = logging.getLogger(__name__)
+
+NODE_STATUS_INTERVAL_SEC = 0.5
+VSSC_RACCOONLAB_RELEASE = 2
+RESTART_DELAY_SEC = 0.1
+FILE_READ_SIZE = 256
+FILE_READ_ATTEMPTS = 3
+
+@dataclass
+class SimParameter:
+    name : str
+    value : Union[bool, int, float, str]
+    default : Union[bool, int, float, str]
+    min_value : Union[None, int, float] = None
+    max_value : Union[None, int, float] = None
+
+DEFAULT_PARAMETERS = [
+    SimParameter("uavcan.node.id",          0,          0,          0,      127),
+    SimParameter("system.name",             "sim_node", "sim_node"),
+    SimParameter("stats.engaged_time",      0,          0,          0,      2147483647),
+    SimParameter("feedback.type",           0,          0,          0,      2),
+    SimParameter("pwm.frequency",           50,         50,         50,     400),
+    SimParameter("crct.bitmask",            15,         15,         0,      15),
+]
+
+class SimulatedDronecanNode:
+    """
+    Parameter server and restart logic on top of a dronecan.node.Node.
+    NodeStatus and GetNodeInfo are served by the dronecan library itself.
+    """
+    def __init__(self,
+                 node : dronecan.node.Node,
+                 params_file : Optional[str] = None,
+                 parameters : Optional[List[SimParameter]] = None) -> None:
+        self.node = node
+        self.node.mode = dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL
+        self.node.vendor_specific_status_code = VSSC_RACCOONLAB_RELEASE
+
+        self._params_file = params_file
+        self._defaults = copy.deepcopy(DEFAULT_PARAMETERS if parameters is None else parameters)
+        for param in self._defaults:
+            if param.name == "uavcan.node.id":
+                param.value = param.default = node.node_id
+        self._persistent = self._load_persistent_values()
+        self.parameters = self._create_parameters()
+
+        self.node.add_handler(dronecan.uavcan.protocol.param.GetSet, self._on_getset)
+        self.node.add_handler(dronecan.uavcan.protocol.param.ExecuteOpcode, self._on_execute_opcode)
+        self.node.add_handler(dronecan.uavcan.protocol.RestartNode, self._on_restart_node)
+        self.node.add_handler(dronecan.uavcan.protocol.file.BeginFirmwareUpdate, self._on_begin_firmware_update)
+
+        self._image = None
+        self._image_path = None
+        self._image_server_node_id = None
+        self._image_read_attempt = 0
+
+    @staticmethod
+    def make_node(port : str, node_id : int, name : str = "co.raccoonlab.sim_node", **kwargs) -> dronecan.node.Node:
+        """
+        kwargs are forwarded to dronecan.make_node. For example, bustype='virtual' creates
+        the node on python-can's in-process virtual bus.
+        """
+        node_info = dronecan.uavcan.protocol.GetNodeInfo.Response()
+        node_info.name = name
+        node_info.software_version.major = 1
+        node_info.software_version.minor = 0
+        node_info.software_version.vcs_commit = 0x5151A7ED
+        node_info.software_version.optional_field_flags = 1
+        node_info.hardware_version.major = 1
+        node_info.hardware_version.minor = 0
+        node_info.hardware_version.unique_id = [node_id] + [0x5A] * 15
+
+        return dronecan.make_node(port,
+                                  node_id=node_id,
+                                  node_info=node_info,
+                                  node_status_interval=NODE_STATUS_INTERVAL_SEC,
+                                  mode=dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL,
+                                  bitrate=1000000,
+                                  baudrate=1000000,
+                                  **kwargs)
+
+    def spin(self, timeout : Optional[float] = None) -> None:
+        self.node.spin(timeout)
+
+    def find_parameter(self, name : str) -> Optional[SimParameter]:
+        for param in self.parameters:
+            if param.name == name:
+                return param
+        return None
+
+    def restart(self) -> None:
+        """Simulate a reboot: reload the parameters from the persistent memory, reset the uptime."""
+        logger.info("Restart")
+        self.parameters = self._create_parameters()
+        self.node.start_time_monotonic = time.monotonic()
+
+    def _on_getset(self, event) -> dronecan.uavcan.protocol.param.GetSet.Response:
+        request = event.request
+        if len(request.name) != 0:
+            param = self.find_parameter(request.name.decode())
+        elif request.index < len(self.parameters):
+            param = self.parameters[request.index]
+        else:
+            param = None
+
+        response = dronecan.uavcan.protocol.param.GetSet.Response()
+        if param is None:
+            return response  # empty response means the parameter doesn't exist
+
+        new_value = SimulatedDronecanNode._get_value(request.value)
+        if new_value is not None and type(new_value) is type(param.value):
+            if param.min_value is not None and param.max_value is not None:
+                new_value = min(max(new_value, param.min_value), param.max_value)
+            param.value = new_value
+            logger.info(f"Set {param.name} = {param.value}")
+
+        response.name = param.name
+        SimulatedDronecanNode._set_value(response.value, param.value)
+        SimulatedDronecanNode._set_value(response.default_value, param.default)
+        if param.min_value is not None and param.max_value is not None:
+            SimulatedDronecanNode._set_numeric_value(response.min_value, param.min_value)
+            SimulatedDronecanNode._set_numeric_value(response.max_value, param.max_value)
+        return response
+
+    def _on_execute_opcode(self, event) -> dronecan.uavcan.protocol.param.ExecuteOpcode.Response:
+        response = dronecan.uavcan.protocol.param.ExecuteOpcode.Response(ok=True)
+        if event.request.opcode == event.request.OPCODE_SAVE:
+            self._persistent = {param.name : param.value for param in self.parameters}
+        elif event.request.opcode == event.request.OPCODE_ERASE:
+            self._persistent = {}
+        else:
+            response.ok = False
+            return response
+
+        self._save_persistent_values()
+        return response
+
+    def _on_restart_node(self, event) -> dronecan.uavcan.protocol.RestartNode.Response:
+        if event.request.magic_number != event.request.MAGIC_NUMBER:
+            return dronecan.uavcan.protocol.RestartNode.Response(ok=False)
+
+        # Respond first, then reboot
+        self.node.defer(RESTART_DELAY_SEC, self.restart)
+        return dronecan.uavcan.protocol.RestartNode.Response(ok=True)
+
+    def _on_begin_firmware_update(self, event) -> dronecan.uavcan.protocol.file.BeginFirmwareUpdate.Response:
+        response = dronecan.uavcan.protocol.file.BeginFirmwareUpdate.Response()
+        if self._image is not None:
+            response.error = response.ERROR_IN_PROGRESS
+            return response
+
+        request = event.request
+        self._image = bytearray()
+        self._image_path = bytes(request.image_file_remote_path.path)
+        self._image_server_node_id = request.source_node_id or event.transfer.source_node_id
+        self._image_read_attempt = 0
+        self.node.mode = dronecan.uavcan.protocol.NodeStatus().MODE_SOFTWARE_UPDATE
+        logger.info(f"Update from node {self._image_server_node_id}: {self._image_path.decode()}")
+
+        # Respond first, then start reading like a bootloader
+        self.node.defer(RESTART_DELAY_SEC, self._request_image_chunk)
+        return response
+
+    def _request_image_chunk(self) -> None:
+        request = dronecan.uavcan.protocol.file.Read.Request(offset=len(self._image))
+        request.path.path = self._image_path
+        self.node.request(request, self._image_server_node_id, self._on_read_response)
+
+    def _on_read_response(self, event) -> None:
+        if event is None:
+            self._image_read_attempt += 1
+            if self._image_read_attempt < FILE_READ_ATTEMPTS:
+                self._request_image_chunk()
+            else:
+                self._finish_update("no response")
+            return
+
+        if event.response.error.value != event.response.error.OK:
+            self._finish_update(f"error {event.response.error.value}")
+            return
+
+        self._image_read_attempt = 0
+        self._image += bytes(event.response.data)
+        if len(event.response.data) == FILE_READ_SIZE:
+            self._request_image_chunk()
+        else:
+            self._finish_update()
+
+    def _finish_update(self, error : Optional[str] = None) -> None:
+        if error is None:
+            digest = hashlib.sha256(self._image).hexdigest()
+            logger.info(f"Update finished: {len(self._image)} bytes, sha256 {digest}")
+            self.restart()
+        else:
+            logger.error(f"Update failed: {error}")
+        self._image = None
+        self.node.mode = dronecan.uavcan.protocol.NodeStatus().MODE_OPERATIONAL
+
+    def _create_parameters(self) -> List[SimParameter]:
+        parameters = copy.deepcopy(self._defaults)
+        for param in parameters:
+            value = self._persistent.get(param.name)
+            if value is not None and type(value) is type(param.default):
+                param.value = value
+        return parameters
+
+    def _load_persistent_values(self) -> Dict[str, Union[bool, int, float, str]]:
+        if self._params_file is None or not os.path.exists(self._params_file):
+            return {}
+        with open(self._params_file, "r", encoding="utf-8") as stream:
+            return json.load(stream)
+
+    def _save_persistent_values(self) -> None:
+        if self._params_file is None:
+            return
+        tmp_file = f"{self._params_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as stream:
+            json.dump(self._persistent, stream, indent=4)
+        os.replace(tmp_file, self._params_file)
+
+    @staticmethod
+    def _get_value(value_union) -> Union[None, bool, int, float, str]:
+        field = dronecan.get_active_union_field(value_union)
+        if field == "boolean_value":
+            return bool(value_union.boolean_value)
+        if field == "integer_value":
+            return int(value_union.integer_value)
+        if field == "real_value":
+            return float(value_union.real_value)
+        if field == "string_value":
+            return value_union.string_value.decode()
+        return None
+
+    @staticmethod
+    def _set_value(value_union, value : Union[bool, int, float, str]) -> None:
+        if isinstance(value, bool):
+            value_union.boolean_value = value
+        elif isinstance(value, int):
+            value_union.integer_value = value
+        elif isinstance(value, float):
+            value_union.real_value = value
+        else:
+            value_union.string_value = value
+
+    @staticmethod
+    def _set_numeric_value(value_union, value : Union[int, float]) -> None:
+        if isinstance(value, int):
+            value_union.integer_value = value
+        else:
+            value_union.real_value = value
+
+def main():
+    parser = argparse.ArgumentParser(description="Spec-compliant simulated DroneCAN node")
+    parser.add_argument("--port",
+                        default='vcan0',
+                        type=str,
+                        help="CAN device name. Examples: vcan0, mcast:0, slcan:/dev/ttyACM0")
+    parser.add_argument("--node-id", default=42, type=int, help="Node ID from 1 to 126")
+    parser.add_argument("--name", default="co.raccoonlab.sim_node", type=str, help="Node name")
+    parser.add_argument("--params-file", default=None, type=str,
+                        help="JSON file used as the persistent memory. By default it is kept in RAM only")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    try:
+        node = SimulatedDronecanNode.make_node(args.port, args.node_id, args.name)
+    except OSError as err:
+        logger.error(f"Can't create DroneCAN node on {args.port}: {err}")
+        sys.exit(1)
+
+    sim = SimulatedDronecanNode(node, args.params_file)
+    try:
+        sim.spin()
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt")
+
+if __name__ =="__main__":
+    main()
@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 
-import os
 import sys
-import subprocess
 # pylint: disable=no-member
 import dronecan
 import pytest
 
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests
 from raccoonlab_tools.dronecan.utils import NodeFinder
 
 TEMPERATURE_MIN = 273
@@ -111,10 +110,7 @@ class TestCircuitStatus:
         assert msg.message.error_flags == ERROR_FLAGS
 
 def main():
-
-    cmd = ["pytest", os.path.abspath(__file__), "-v", '-W', 'ignore::DeprecationWarning']
-    cmd += sys.argv[1:]
-    sys.exit(subprocess.call(cmd))
+    sys.exit(run_tests([__file__], sys.argv[1:]))
 
 if __name__ == "__main__":
     main()
@@ -4,10 +4,13 @@
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
 import argparse
+import functools
 import dronecan
 from dronecan import uavcan
 import time
 
+from raccoonlab_tools.dronecan.frame_cache import FrameCache
+
 
 class RGB565_color:
     red: int  #: uint5
@@ -77,6 +80,7 @@ class LightsCommander:
             model_name="simulated_light_commander",
         )
         self.node_status_msg = uavcan.equipment.indication.LightsCommand()
+        self.frame_cache = FrameCache(self.node)
 
         self.node.add_handler(uavcan.protocol.NodeStatus, self._node_status_callback)
 
@@ -91,27 +95,28 @@ class LightsCommander:
         while True:
             i = int(time.time() % len(self.color_names))
             
-            color_name = list(self.colors_dict.keys())[i]
+            color_name = self.color_names[i]
             color = self.colors_dict[color_name]
 
-            self.color = uavcan.equipment.indication.RGB565(red=color.red, green=color.green, blue=color.blue)
-
-            self.commands = uavcan.equipment.indication.SingleLightCommand(
-                light_id=0, color=self.color
-            )
-
             self.node.spin(0.1)
             if len(self.online_nodes) >= 1:
-                self.light_command_msg = uavcan.equipment.indication.LightsCommand(
-                    commands=[self.commands],
-                    number_of_commands=1,
-                    model_name="simulated_light_commander",
-                )
-                self.node.broadcast(self.light_command_msg)
+                # The message is created and serialized only once per color
+                self.frame_cache.broadcast(functools.partial(self._create_light_command, color),
+                                           key=(color.red, color.green, color.blue))
                 print("Pub LightsCommand", color_name)
             else:
                 print("There is no any online node yet...")
 
+    def _create_light_command(self, color: RGB565_color):
+        self.color = uavcan.equipment.indication.RGB565(red=color.red, green=color.green, blue=color.blue)
+        self.commands = uavcan.equipment.indication.SingleLightCommand(light_id=0, color=self.color)
+        self.light_command_msg = uavcan.equipment.indication.LightsCommand(
+            commands=[self.commands],
+            number_of_commands=1,
+            model_name="simulated_light_commander",
+        )
+        return self.light_command_msg
+
     def _node_status_callback(self, msg):
         self.online_nodes.add(msg.transfer.source_node_id)
         print(f"Receive NodeStatus from node {msg.transfer.source_node_id}.")
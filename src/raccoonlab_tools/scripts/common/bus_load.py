@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Generate DroneCAN or Cyphal traffic at a target frame rate or bus utilisation.
+
+The transfers carry dummy payloads on a single port that the nodes are expected to ignore:
+- DroneCAN: uavcan.protocol.debug.KeyValue, because pydronecan based nodes (including the test
+  suites) raise an exception on an unknown data type ID, and any payload is a valid KeyValue,
+- Cyphal: an unregulated subject ID that nobody subscribes to. Run it next to a test suite
+to check that the nodes keep the heartbeat timing and answer the requests under a high bus load.
+
+Usage examples:
+rl-bus-load --load 80
+rl-bus-load --port mcast:0 --protocol dronecan --rate 5000 --multi-frame-ratio 0.2 --duration 10
+"""
+import sys
+import time
+import queue
+import argparse
+import itertools
+from typing import List, Optional
+from dataclasses import dataclass
+
+import dronecan
+from dronecan.dsdl.common import crc16_from_bytes
+from dronecan.driver.common import TxQueueFullError
+
+from raccoonlab_tools.common.device_manager import DeviceManager, TransportNotFoundException
+from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+
+DRONECAN_DEFAULT_PORT_ID = dronecan.uavcan.protocol.debug.KeyValue.default_dtid
+CYPHAL_DEFAULT_PORT_ID = 6143       # the last unregulated subject ID
+DRONECAN_LOWEST_PRIORITY = 31
+CYPHAL_LOWEST_PRIORITY = 7
+MAX_SINGLE_FRAME_PAYLOAD = 7
+MAX_KEY_VALUE_PAYLOAD = 62          # float32 value and up to 58 bytes of the key
+TRANSFER_ID_MASK = 0x1F
+
+def estimate_frame_bits(data_length : int) -> int:
+    """
+    Approximate length of an extended CAN 2.0 frame on the wire: SOF, 29-bit ID, control field,
+    data, CRC, ACK, EOF and the interframe space, plus ~5% of stuff bits for random data.
+    """
+    bits = 67 + 8 * data_length
+    return bits + bits // 20
+
+class TransferEncoder:
+    """
+    Frames of a message transfer with an arbitrary payload. The transfer ID of the returned
+    frames is zero, it is patched in the tail byte before sending.
+    """
+    @staticmethod
+    def make_can_id(protocol : Protocol, priority : int, port_id : int, source_node_id : int) -> int:
+        if protocol == Protocol.DRONECAN:
+            assert 0 <= priority <= DRONECAN_LOWEST_PRIORITY and 0 <= port_id <= 0xFFFF
+            return (priority << 24) | (port_id << 8) | source_node_id
+
+        assert 0 <= priority <= CYPHAL_LOWEST_PRIORITY and 0 <= port_id <= 0x1FFF
+        return (priority << 26) | (3 << 21) | (port_id << 8) | source_node_id
+
+    @staticmethod
+    def make_frames(protocol : Protocol, payload : bytes, dronecan_data_type_id : int = 0) -> List[bytearray]:
+        if len(payload) > MAX_SINGLE_FRAME_PAYLOAD:
+            crc = crc16_from_bytes(payload, initial=TransferEncoder._get_initial_crc(protocol, dronecan_data_type_id))
+            if protocol == Protocol.DRONECAN:
+                payload = bytes([crc & 0xFF, crc >> 8]) + payload
+            else:
+                payload = payload + bytes([crc >> 8, crc & 0xFF])
+
+        chunks = [payload[idx : idx + MAX_SINGLE_FRAME_PAYLOAD]
+                  for idx in range(0, max(len(payload), 1), MAX_SINGLE_FRAME_PAYLOAD)]
+        toggle = protocol == Protocol.CYPHAL
+        frames = []
+        for idx, chunk in enumerate(chunks):
+            tail_byte = (0x80 if idx == 0 else 0) | (0x40 if idx == len(chunks) - 1 else 0) | (0x20 if toggle else 0)
+            frames.append(bytearray(chunk) + bytearray([tail_byte]))
+            toggle = not toggle
+        return frames
+
+    @staticmethod
+    def _get_initial_crc(protocol : Protocol, dronecan_data_type_id : int) -> int:
+        """DroneCAN transfer CRC starts from the data type signature, Cyphal CRC starts from 0xFFFF."""
+        if protocol == Protocol.DRONECAN:
+            data_type = dronecan.DATATYPES.get((dronecan_data_type_id, dronecan.dsdl.CompoundType.KIND_MESSAGE))
+            if data_type is not None:
+                return data_type.base_crc
+        return 0xFFFF
+
+@dataclass
+class BusLoadStats:
+    elapsed_sec : float = 0.0
+    frames : int = 0
+    transfers : int = 0
+    tx_queue_full_events : int = 0
+    rx_frames : int = 0
+    bits : int = 0
+
+    def get_frame_rate(self) -> float:
+        return self.frames / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    def get_load_pct(self, bitrate : int) -> float:
+        return 100.0 * self.bits / (self.elapsed_sec * bitrate) if self.elapsed_sec > 0 else 0.0
+
+    def to_str(self, bitrate : int) -> str:
+        rx_rate = self.rx_frames / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+        return (f"{self.get_frame_rate():.0f} frames/s ({self.get_load_pct(bitrate):.1f}% of {bitrate // 1000} kbit/s), "
+                f"tx queue full: {self.tx_queue_full_events}, "
+                f"other traffic: {rx_rate:.0f} frames/s")
+
+class BusLoadGenerator:
+    def __init__(self,
+                 driver,
+                 protocol : Protocol,
+                 priorities : List[int],
+                 source_node_ids : List[int],
+                 payload_size : int = MAX_SINGLE_FRAME_PAYLOAD,
+                 multi_frame_payload_size : int = 21,
+                 multi_frame_ratio : float = 0.0,
+                 port_id : Optional[int] = None,
+                 bitrate : int = 1000000) -> None:
+        """
+        The target rate is set with set_frame_rate() or set_load_pct().
+        """
+        assert protocol in [Protocol.DRONECAN, Protocol.CYPHAL]
+        assert 0 <= payload_size <= MAX_SINGLE_FRAME_PAYLOAD
+        assert multi_frame_payload_size > MAX_SINGLE_FRAME_PAYLOAD
+        assert 0.0 <= multi_frame_ratio <= 1.0
+
+        if port_id is None:
+            port_id = DRONECAN_DEFAULT_PORT_ID if protocol == Protocol.DRONECAN else CYPHAL_DEFAULT_PORT_ID
+        if protocol == Protocol.DRONECAN and (port_id, dronecan.dsdl.CompoundType.KIND_MESSAGE) not in dronecan.DATATYPES:
+            print(f"[WARN] Data type ID {port_id} is unknown, pydronecan based nodes will fail to receive it.")
+
+        self.driver = driver
+        self.bitrate = bitrate
+        self.frame_rate = 0.0
+        self.multi_frame_ratio = multi_frame_ratio
+
+        single_frame = TransferEncoder.make_frames(protocol, _make_payload(payload_size), port_id)
+        multi_frame = TransferEncoder.make_frames(protocol, _make_payload(multi_frame_payload_size), port_id)
+        self._payload_frames = [single_frame, multi_frame]
+        self._payload_bits = [sum(estimate_frame_bits(len(frame)) for frame in frames)
+                              for frames in self._payload_frames]
+
+        self._sessions = itertools.cycle([
+            (TransferEncoder.make_can_id(protocol, priority, port_id, node_id), node_id)
+            for node_id in source_node_ids for priority in priorities
+        ])
+        self._next_transfer_ids = {node_id : 0 for node_id in source_node_ids}
+        self._multi_frame_credit = 0.0
+
+    def set_frame_rate(self, frame_rate : float) -> None:
+        assert frame_rate > 0
+        self.frame_rate = frame_rate
+
+    def set_load_pct(self, load_pct : float) -> None:
+        """Convert the bus utilisation to a frame rate using the average transfer of the configured mix."""
+        assert 0 < load_pct <= 100
+        average_bits = (1 - self.multi_frame_ratio) * self._payload_bits[0] + \
+                       self.multi_frame_ratio * self._payload_bits[1]
+        average_frames = (1 - self.multi_frame_ratio) * len(self._payload_frames[0]) + \
+                         self.multi_frame_ratio * len(self._payload_frames[1])
+        self.frame_rate = load_pct / 100 * self.bitrate / average_bits * average_frames
+
+    def run(self, duration_sec : float = 0.0, report_period_sec : float = 1.0) -> BusLoadStats:
+        """
+        Send the transfers until the duration is over, 0 means forever.
+        A TX queue full event drops the rest of the transfer and pauses the generator shortly.
+        """
+        assert self.frame_rate > 0
+        total = BusLoadStats()
+        report = BusLoadStats()
+        start_time = time.monotonic()
+        report_time = start_time
+
+        try:
+            while duration_sec <= 0 or total.elapsed_sec < duration_sec:
+                crnt_time = time.monotonic()
+                total.elapsed_sec = crnt_time - start_time
+
+                while total.frames < total.elapsed_sec * self.frame_rate:
+                    if not self._send_transfer(total, report):
+                        break
+
+                rx_frames = self._drain_rx()
+                total.rx_frames += rx_frames
+                report.rx_frames += rx_frames
+
+                if crnt_time - report_time >= report_period_sec:
+                    report.elapsed_sec = crnt_time - report_time
+                    print(f"[INFO] {report.to_str(self.bitrate)}")
+                    report = BusLoadStats()
+                    report_time = crnt_time
+
+                time.sleep(0.0005)
+        except KeyboardInterrupt:
+            pass
+
+        total.elapsed_sec = time.monotonic() - start_time
+        return total
+
+    def _send_transfer(self, total : BusLoadStats, report : BusLoadStats) -> bool:
+        self._multi_frame_credit += self.multi_frame_ratio
+        is_multi_frame = self._multi_frame_credit >= 1.0
+        if is_multi_frame:
+            self._multi_frame_credit -= 1.0
+
+        can_id, node_id = next(self._sessions)
+        transfer_id = self._next_transfer_ids[node_id]
+        self._next_transfer_ids[node_id] = (transfer_id + 1) & TRANSFER_ID_MASK
+
+        for frame in self._payload_frames[is_multi_frame]:
+            frame[-1] = (frame[-1] & ~TRANSFER_ID_MASK) | transfer_id
+            try:
+                self.driver.send(can_id, bytes(frame), extended=True)
+            except (TxQueueFullError, queue.Full):
+                total.tx_queue_full_events += 1
+                report.tx_queue_full_events += 1
+                return False
+            for stats in (total, report):
+                stats.frames += 1
+                stats.bits += estimate_frame_bits(len(frame))
+
+        total.transfers += 1
+        report.transfers += 1
+        return True
+
+    def _drain_rx(self) -> int:
+        number_of_frames = 0
+        while self.driver.receive(0) is not None:
+            number_of_frames += 1
+        return number_of_frames
+
+
+def _get_driver_name(port : str) -> str:
+    if port.startswith(("slcan", "can", "vcan", "mcast:")):
+        return port
+    return f"slcan:{port}"
+
+def _make_payload(size : int) -> bytes:
+    return bytes(idx & 0xFF for idx in range(size))
+
+def _check_args(parser : argparse.ArgumentParser, args : argparse.Namespace) -> None:
+    """Reject the values that BusLoadGenerator can't send, before the bus is opened."""
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate should be positive")
+    if args.load is not None and not 0 < args.load <= 100:
+        parser.error("--load should be in (0, 100]")
+    if args.bitrate <= 0:
+        parser.error("--bitrate should be positive")
+    if args.duration < 0:
+        parser.error("--duration should not be negative")
+    if not 0 <= args.payload_size <= MAX_SINGLE_FRAME_PAYLOAD:
+        parser.error(f"--payload-size should be from 0 to {MAX_SINGLE_FRAME_PAYLOAD}")
+    if args.multi_frame_size <= MAX_SINGLE_FRAME_PAYLOAD:
+        parser.error(f"--multi-frame-size should be more than {MAX_SINGLE_FRAME_PAYLOAD}")
+    if not 0.0 <= args.multi_frame_ratio <= 1.0:
+        parser.error("--multi-frame-ratio should be from 0.0 to 1.0")
+    if not all(1 <= node_id <= 127 for node_id in args.source_node_ids):
+        parser.error("--source-node-ids should be from 1 to 127")
+
+def _check_protocol_args(parser : argparse.ArgumentParser, args : argparse.Namespace, protocol : Protocol) -> None:
+    """The limits that depend on the protocol, the nodes would reject the transfers otherwise."""
+    if protocol == Protocol.DRONECAN:
+        lowest_priority, max_port_id = DRONECAN_LOWEST_PRIORITY, 0xFFFF
+    else:
+        lowest_priority, max_port_id = CYPHAL_LOWEST_PRIORITY, 0x1FFF
+    if args.priority is not None and not all(0 <= priority <= lowest_priority for priority in args.priority):
+        parser.error(f"--priority should be from 0 to {lowest_priority} for {protocol.name}")
+    if args.port_id is not None and not 0 <= args.port_id <= max_port_id:
+        parser.error(f"--port-id should be from 0 to {max_port_id} for {protocol.name}")
+
+    port_id = DRONECAN_DEFAULT_PORT_ID if args.port_id is None else args.port_id
+    if protocol == Protocol.DRONECAN and port_id == DRONECAN_DEFAULT_PORT_ID and \
+            args.multi_frame_size > MAX_KEY_VALUE_PAYLOAD:
+        parser.error(f"--multi-frame-size should not exceed {MAX_KEY_VALUE_PAYLOAD} for DroneCAN KeyValue")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate DroneCAN or Cyphal traffic at a target rate")
+    parser.add_argument("--port", default=None, type=str,
+                        help="CAN device name. Examples: slcan0, vcan0, mcast:0, /dev/ttyACM0. "
+                             "By default it is detected automatically")
+    parser.add_argument("--protocol", default=None, choices=["dronecan", "cyphal"],
+                        help="By default it is detected from the traffic on the bus")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--rate", type=float, help="Target number of frames per second")
+    target.add_argument("--load", type=float, help="Target bus utilisation in percent")
+    parser.add_argument("--bitrate", default=1000000, type=int, help="CAN bitrate, bit/s")
+    parser.add_argument("--priority", nargs='+', type=int, default=None,
+                        help="Transfer priorities used in turn. By default the lowest priority")
+    parser.add_argument("--source-node-ids", nargs='+', type=int, default=[125],
+                        help="Source node IDs used in turn")
+    parser.add_argument("--payload-size", default=MAX_SINGLE_FRAME_PAYLOAD, type=int,
+                        help="Payload size of a single-frame transfer, bytes")
+    parser.add_argument("--multi-frame-size", default=21, type=int,
+                        help=f"Payload size of a multi-frame transfer, bytes. Max {MAX_KEY_VALUE_PAYLOAD} for DroneCAN KeyValue")
+    parser.add_argument("--multi-frame-ratio", default=0.0, type=float,
+                        help="Fraction of multi-frame transfers from 0.0 to 1.0")
+    parser.add_argument("--port-id", default=None, type=int,
+                        help=f"Data type ID (DroneCAN, default {DRONECAN_DEFAULT_PORT_ID} KeyValue) or "
+                             f"subject ID (Cyphal, default {CYPHAL_DEFAULT_PORT_ID})")
+    parser.add_argument("--duration", default=0.0, type=float, help="Duration in seconds, 0 means forever")
+    args = parser.parse_args()
+    _check_args(parser, args)
+
+    try:
+        port = DeviceManager.get_device_port() if args.port is None else args.port
+    except TransportNotFoundException as err:
+        print(err)
+        sys.exit(1)
+
+    if args.protocol is not None:
+        protocol = Protocol.DRONECAN if args.protocol == "dronecan" else Protocol.CYPHAL
+    elif port.startswith("mcast:"):
+        print("[ERROR] The protocol can't be detected on a multicast bus. Please, specify --protocol.")
+        sys.exit(1)
+    else:
+        protocol = CanProtocolParser.find_protocol(port, verbose=True)
+        if protocol not in [Protocol.DRONECAN, Protocol.CYPHAL]:
+            print("[ERROR] Please, specify --protocol.")
+            sys.exit(1)
+
+    _check_protocol_args(parser, args, protocol)
+    priorities = args.priority
+    if priorities is None:
+        priorities = [DRONECAN_LOWEST_PRIORITY if protocol == Protocol.DRONECAN else CYPHAL_LOWEST_PRIORITY]
+
+    driver = dronecan.driver.make_driver(_get_driver_name(port), bitrate=args.bitrate, baudrate=1000000)
+    generator = BusLoadGenerator(driver,
+                                 protocol,
+                                 priorities=priorities,
+                                 source_node_ids=args.source_node_ids,
+                                 payload_size=args.payload_size,
+                                 multi_frame_payload_size=args.multi_frame_size,
+                                 multi_frame_ratio=args.multi_frame_ratio,
+                                 port_id=args.port_id,
+                                 bitrate=args.bitrate)
+    if args.rate is not None:
+        generator.set_frame_rate(args.rate)
+    else:
+        generator.set_load_pct(args.load)
+
+    print(f"[INFO] {protocol.name} traffic on {port}: target {generator.frame_rate:.0f} frames/s")
+    stats = generator.run(args.duration)
+    driver.close()
+
+    print(f"[INFO] Total {stats.elapsed_sec:.1f} s, {stats.transfers} transfers: {stats.to_str(args.bitrate)}")
+
+if __name__ == "__main__":
+    main()
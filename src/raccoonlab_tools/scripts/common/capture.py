@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Record CAN traffic, convert captures between the binary (*.rlcap), candump and ASC formats
+and decode them into tables, one CSV or NPZ file per data type.
+The loss command counts the lost transfers per stream by the transfer-ID gaps.
+
+Examples:
+rl-capture record --port slcan0 --duration 3600 -o flight.rlcap
+rl-capture convert flight.rlcap gps.log --start 600 --end 660 --can-id 0C044D7A 1C044D7A
+rl-capture convert candump.log archive.rlcap
+rl-capture info flight.rlcap
+rl-capture decode flight.rlcap -o flight/ --jobs 8
+rl-capture decode cyphal.rlcap -o cyphal/ --type 2345=uavcan.si.sample.temperature.Scalar.1.0
+rl-capture loss flight.rlcap --node-id 42
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import dronecan
+
+from raccoonlab_tools.common.capture import CapturedFrame, read_capture, write_capture
+from raccoonlab_tools.common.binary_capture import CaptureFile, CaptureWriter, is_binary_capture
+from raccoonlab_tools.common.capture_decoder import decode_capture, detect_protocol
+from raccoonlab_tools.common.colorizer import Colorizer
+from raccoonlab_tools.common.device_manager import DeviceManager, TransportNotFoundException
+from raccoonlab_tools.common.protocol_parser import Protocol
+from raccoonlab_tools.common.transfer_id_analyzer import TransferIdAnalyzer
+
+FLUSH_PERIOD_SEC = 1.0
+
+def record(port : str, output : str, duration : float, canfd : bool, bitrate : int) -> int:
+    if not port.startswith(("slcan", "can", "vcan", "mcast:")):
+        port = f"slcan:{port}"
+    driver = dronecan.driver.make_driver(port, bitrate=bitrate, baudrate=1000000)
+    end_time = time.time() + duration if duration > 0 else None
+    next_flush_time = time.time() + FLUSH_PERIOD_SEC
+
+    print(f"[INFO] Recording {port} into {output}. Press Ctrl+C to stop.")
+    with CaptureWriter(output, canfd=canfd) as writer:
+        try:
+            while end_time is None or time.time() < end_time:
+                frame = driver.receive(0.1)
+                if frame is not None:
+                    writer.write(CapturedFrame(timestamp=frame.ts_real,
+                                               can_id=frame.id,
+                                               data=bytes(frame.data),
+                                               extended=frame.extended,
+                                               canfd=frame.canfd))
+                if time.time() >= next_flush_time:
+                    next_flush_time += FLUSH_PERIOD_SEC
+                    writer.flush()
+        except KeyboardInterrupt:
+            pass
+        driver.close()
+        return writer.number_of_frames
+
+def convert(source : str,
+            output : str,
+            canfd : Optional[bool],
+            start_sec : Optional[float],
+            end_sec : Optional[float],
+            can_ids : Optional[List[int]]) -> int:
+    """start_sec and end_sec are relative to the first frame of the capture."""
+    if is_binary_capture(source):
+        capture = CaptureFile(source)
+        if canfd is None:
+            canfd = capture.canfd
+        time_range = capture.get_time_range_ns()
+        if time_range is None:
+            frames : Iterator[CapturedFrame] = iter([])
+        else:
+            start_ns = None if start_sec is None else time_range[0] + round(start_sec * 1e9)
+            end_ns = None if end_sec is None else time_range[0] + round(end_sec * 1e9)
+            records = capture.select(start_ns, end_ns, can_ids)
+            if output.lower().endswith(".rlcap") and capture.canfd == canfd:
+                with CaptureWriter(output, canfd=canfd) as writer:
+                    writer.write_records(records)
+                    return writer.number_of_frames
+            frames = CaptureFile.to_frames(records)
+    else:
+        frames = _filter_frames(read_capture(source), start_sec, end_sec, can_ids)
+    return write_capture(output, frames, canfd=bool(canfd))
+
+def print_info(source : str) -> None:
+    if not is_binary_capture(source):
+        frames = list(read_capture(source))
+        print(f"{source}: {len(frames)} frames")
+        if frames:
+            print(f"- {frames[-1].timestamp - frames[0].timestamp:.3f} sec from {_format_time(frames[0].timestamp)}")
+        return
+
+    capture = CaptureFile(source)
+    print(f"{source}: {len(capture)} frames, {'CAN FD' if capture.canfd else 'classic CAN'}, "
+          f"{len(capture.index)} indexed chunks of {capture.chunk_records} frames")
+    time_range = capture.get_time_range_ns()
+    if time_range is not None:
+        print(f"- {(time_range[1] - time_range[0]) / 1e9:.3f} sec from {_format_time(time_range[0] / 1e9)}")
+
+def decode(source : str,
+           output_dir : str,
+           protocol : Optional[Protocol],
+           jobs : Optional[int],
+           cyphal_types : Dict[int, str],
+           output_format : str) -> None:
+    start_time = time.time()
+    decoded = decode_capture(source, protocol, jobs, cyphal_types)
+    print(f"[INFO] {decoded.number_of_frames} frames, {decoded.number_of_transfers} transfers "
+          f"have been decoded in {time.time() - start_time:.1f} sec, "
+          f"{decoded.number_of_errors} broken or unknown transfers")
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in sorted(decoded.tables):
+        table = decoded.tables[name]
+        path = os.path.join(output_dir, f"{name}.{output_format}")
+        if output_format == "csv":
+            table.save_csv(path)
+        else:
+            table.save_npz(path)
+        print(f"- {name :<50} {len(table) :>8} rows")
+
+def print_losses(source : str, protocol : Optional[Protocol], node_id : Optional[int]) -> None:
+    if protocol is None:
+        if not is_binary_capture(source):
+            raise ValueError("The protocol can be detected only in a binary capture, please, specify --protocol")
+        protocol = detect_protocol(CaptureFile(source))
+        if protocol not in [Protocol.DRONECAN, Protocol.CYPHAL]:
+            raise ValueError(f"{source}: the protocol can't be detected")
+
+    analyzer = TransferIdAnalyzer(protocol).process(read_capture(source))
+    for stats in analyzer.get_stats(node_id):
+        line = f"- {stats}"
+        print(Colorizer.warning(line) if stats.lost or stats.broken or stats.out_of_order else line)
+    print(f"Total: {analyzer.get_total(node_id).format_counters()}")
+
+def _parse_cyphal_type(string : str) -> Tuple[int, str]:
+    subject_id, name = string.split("=", 1)
+    return int(subject_id), name
+
+def _filter_frames(frames : Iterator[CapturedFrame],
+                   start_sec : Optional[float],
+                   end_sec : Optional[float],
+                   can_ids : Optional[List[int]]) -> Iterator[CapturedFrame]:
+    first_timestamp = None
+    for frame in frames:
+        if first_timestamp is None:
+            first_timestamp = frame.timestamp
+        if start_sec is not None and frame.timestamp - first_timestamp < start_sec:
+            continue
+        if end_sec is not None and frame.timestamp - first_timestamp >= end_sec:
+            continue
+        if can_ids is not None and frame.can_id not in can_ids:
+            continue
+        yield frame
+
+def _format_time(timestamp : float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='Record the traffic into a capture file')
+    record_parser.add_argument("--port", default=None, type=str,
+                               help="CAN device name. Examples: slcan0, vcan0, mcast:0, /dev/ttyACM0. "
+                                    "By default it is detected automatically")
+    record_parser.add_argument("-o", "--output", default=None,
+                               help="Output file. Default: capture_<date>_<time>.rlcap")
+    record_parser.add_argument("--duration", default=0.0, type=float, help="Duration in seconds, 0 means forever")
+    record_parser.add_argument("--canfd", action='store_true', help="Reserve 64 bytes for the data of each frame")
+    record_parser.add_argument("--bitrate", default=1000000, type=int, help="CAN bitrate, bit/s")
+
+    convert_parser = subparsers.add_parser('convert', help='Convert or slice a capture file')
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("output", help="The format is chosen by the extension: .rlcap, .asc or candump")
+    convert_parser.add_argument("--canfd", action='store_true', default=None,
+                                help="Write a CAN FD binary capture. Default: the same as the source")
+    convert_parser.add_argument("--start", type=float, default=None, help="Seconds since the first frame")
+    convert_parser.add_argument("--end", type=float, default=None, help="Seconds since the first frame")
+    convert_parser.add_argument("--can-id", nargs='+', default=None, type=lambda string: int(string, 16),
+                                help="Keep only these CAN IDs (hex)")
+
+    info_parser = subparsers.add_parser('info', help='Print the summary of a capture file')
+    info_parser.add_argument("source")
+
+    loss_parser = subparsers.add_parser('loss', help='Count the lost transfers per stream')
+    loss_parser.add_argument("source")
+    loss_parser.add_argument("--protocol", default=None, choices=["dronecan", "cyphal"],
+                             help="By default it is detected from the traffic")
+    loss_parser.add_argument("--node-id", type=int, default=None, help="Only the streams of this node")
+
+    decode_parser = subparsers.add_parser('decode', help='Decode all transfers into a table per data type')
+    decode_parser.add_argument("source")
+    decode_parser.add_argument("-o", "--output", required=True, help="Output directory")
+    decode_parser.add_argument("--protocol", default=None, choices=["dronecan", "cyphal"],
+                               help="By default it is detected from the traffic")
+    decode_parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    decode_parser.add_argument("--format", default="csv", choices=["csv", "npz"])
+    decode_parser.add_argument("--type", nargs='+', default=[], type=_parse_cyphal_type, metavar="SUBJECT_ID=TYPE",
+                               help="Cyphal data types of the subjects without a fixed ID")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        try:
+            port = DeviceManager.get_device_port() if args.port is None else args.port
+        except TransportNotFoundException as err:
+            print(err)
+            sys.exit(1)
+        output = args.output or time.strftime("capture_%Y%m%d_%H%M%S.rlcap")
+        number_of_frames = record(port, output, args.duration, args.canfd, args.bitrate)
+        print(f"[INFO] {number_of_frames} frames have been recorded into {output}")
+    elif args.command == 'convert':
+        try:
+            number_of_frames = convert(args.source, args.output, args.canfd, args.start, args.end, args.can_id)
+        except ValueError as err:
+            print(f"[ERROR] {err}")
+            sys.exit(1)
+        print(f"[INFO] {number_of_frames} frames have been written into {args.output}")
+    elif args.command == 'info':
+        print_info(args.source)
+    elif args.command in ['decode', 'loss']:
+        protocol = None
+        if args.protocol is not None:
+            protocol = Protocol.DRONECAN if args.protocol == "dronecan" else Protocol.CYPHAL
+        try:
+            if args.command == 'decode':
+                decode(args.source, args.output, protocol, args.jobs, dict(args.type), args.format)
+            else:
+                print_losses(args.source, protocol, args.node_id)
+        except ValueError as err:
+            print(f"[ERROR] {err}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,18 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-
+"""
+Print the information about the online node or, with --all, about all online nodes.
+"""
 import asyncio
+import argparse
+from typing import Dict
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
 from raccoonlab_tools.common.device_manager import DeviceManager
 from raccoonlab_tools.common.node import NodeInfo
+from raccoonlab_tools.common.inventory import Inventory
 
-async def get_info_cyphal() -> NodeInfo:
+async def get_info_cyphal(all_nodes : bool = False) -> Dict[int, NodeInfo]:
     import pycyphal
     import pycyphal.application
     import uavcan
@@ -20,28 +25,49 @@ async def get_info_cyphal() -> NodeInfo:
     )
     cyphal_node = pycyphal.application.make_node(get_info_response)
     cyphal_node.start()
-    node_info = await NodeFinder(cyphal_node).get_info()
-    return node_info
+    node_finder = NodeFinder(cyphal_node)
+    if all_nodes:
+        node_infos = await node_finder.get_infos()
+    else:
+        node_info = await node_finder.get_info()
+        node_infos = {} if node_info is None else {node_info.node_id : node_info}
+    cyphal_node.close()
+    return node_infos
 
-def get_info_dronecan(transport : str) -> NodeInfo:
+def get_info_dronecan(transport : str, all_nodes : bool = False) -> Dict[int, NodeInfo]:
     assert isinstance(transport, str)
     import dronecan
     from raccoonlab_tools.dronecan.utils import NodeFinder
 
     node = dronecan.make_node(transport, node_id=100, bitrate=1000000, baudrate=1000000)
-    return NodeFinder(node).get_info()
+    node_finder = NodeFinder(node)
+    if all_nodes:
+        return node_finder.get_infos()
+    node_info = node_finder.get_info()
+    return {} if node_info is None else {node_info.node_id : node_info}
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--all', action='store_true', dest='all_nodes',
+                        help='Ask all online nodes concurrently')
+    args = parser.parse_args()
+
     transport = DeviceManager.get_device_port(verbose=True)
     can_protocol = CanProtocolParser.verify_protocol(transport, verbose=True)
+    node_infos = {}
     if can_protocol == Protocol.DRONECAN:
-        node_info = get_info_dronecan(transport)
+        node_infos = get_info_dronecan(transport, args.all_nodes)
     elif can_protocol == Protocol.CYPHAL:
-        node_info = asyncio.run(get_info_cyphal())
+        node_infos = asyncio.run(get_info_cyphal(args.all_nodes))
 
-    if node_info is not None:
+    for node_info in node_infos.values():
         node_info.print_info("")
 
+    inventory = Inventory.open_default()
+    if inventory is not None:
+        with inventory:
+            inventory.record_node_infos(node_infos.values())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Query the local inventory of the boards. The tools write into it when RL_INVENTORY is set:
+export RL_INVENTORY=~/inventory.sqlite
+
+Examples:
+rl-inventory boards
+rl-inventory outdated --older-than 1.2
+rl-inventory outdated --older-than 2
+rl-inventory outdated --vcs-commit 5151a7ed
+rl-inventory drift
+rl-inventory history 3a0045000f51333034383336
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Tuple
+from raccoonlab_tools.common.inventory import Inventory, INVENTORY_ENV_VAR
+
+def print_boards(boards) -> None:
+    for board in boards:
+        print(board)
+    print(f"Total: {len(boards)}")
+
+def parse_version(string : str) -> Tuple[int, int]:
+    """X or X.Y, the minor version is 0 by default."""
+    numbers = [int(number) for number in string.split(".")]
+    if not 1 <= len(numbers) <= 2 or any(number < 0 for number in numbers):
+        raise ValueError(string)
+    return numbers[0], numbers[1] if len(numbers) == 2 else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.environ.get(INVENTORY_ENV_VAR),
+                        help=f'Path to the inventory database. Default: {INVENTORY_ENV_VAR}')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('boards', help='The latest known info of all boards')
+    outdated = subparsers.add_parser('outdated', help='The boards with other firmware')
+    outdated_group = outdated.add_mutually_exclusive_group(required=True)
+    outdated_group.add_argument('--older-than', metavar='X[.Y]', help='Software version, for example 1.2 or 2')
+    outdated_group.add_argument('--vcs-commit', help='The boards without this VCS commit')
+    drift = subparsers.add_parser('drift', help='Parameters that differ from the last config')
+    drift.add_argument('uids', nargs='*', help='Board unique IDs. Default: all boards')
+    history = subparsers.add_parser('history', help='All records of a board')
+    history.add_argument('uid')
+    args = parser.parse_args()
+    if args.command == 'outdated' and args.older_than is not None:
+        try:
+            major, minor = parse_version(args.older_than)
+        except ValueError:
+            outdated.error(f"argument --older-than: invalid version '{args.older_than}', expected X or X.Y")
+
+    if not args.db or not os.path.exists(args.db):
+        print(f"[ERROR] The inventory is not found. Set {INVENTORY_ENV_VAR} or --db.")
+        sys.exit(1)
+
+    with Inventory(args.db) as inventory:
+        if args.command == 'boards':
+            print_boards(inventory.get_boards())
+        elif args.command == 'outdated' and args.older_than is not None:
+            print_boards(inventory.get_outdated_boards(major, minor))
+        elif args.command == 'outdated':
+            print_boards(inventory.get_boards_with_other_firmware(args.vcs_commit))
+        elif args.command == 'drift':
+            number_of_drifted_boards = 0
+            for uid in args.uids or inventory.get_uids():
+                drifts = inventory.get_param_drift(uid)
+                if not drifts:
+                    continue
+                number_of_drifted_boards += 1
+                print(f"{uid}:")
+                for drift in drifts:
+                    print(f"- {drift}")
+            print(f"Boards with drifted parameters: {number_of_drifted_boards}")
+        elif args.command == 'history':
+            for timestamp, description in inventory.get_history(args.uid):
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))} {description}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Download the firmware of the given configs or links into the firmware cache before a flashing
+session, so rl-upload-firmware and rl-config don't access the network for every board.
+"""
+import os
+import sys
+import argparse
+import yaml
+from raccoonlab_tools.common.firmware_manager import FirmwareManager
+from raccoonlab_tools.common.firmware_cache import FirmwareCache, FirmwareCacheError, CACHE_DIR_ENV_VAR
+
+def get_link(config_or_link : str) -> tuple:
+    """Return the firmware link and the expected SHA-256 (if any) of a config or a link."""
+    if not config_or_link.endswith((".yaml", ".yml")):
+        return config_or_link, None
+
+    with open(config_or_link, "r", encoding='UTF-8') as stream:
+        metadata = (yaml.safe_load(stream) or {}).get('metadata') or {}
+    return metadata.get('link'), metadata.get('sha256')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('configs', nargs='+', help='Paths to .yaml config files or firmware links')
+    parser.add_argument('--cache-dir', default=None,
+                        help=f'Cache directory. Default: ${CACHE_DIR_ENV_VAR} or ~/.cache/raccoonlab_tools/firmware')
+    args = parser.parse_args()
+
+    if args.cache_dir is not None:
+        os.environ[CACHE_DIR_ENV_VAR] = args.cache_dir
+    print(f"[INFO] cache directory {FirmwareCache().cache_dir}")
+
+    number_of_errors = 0
+    for config_or_link in args.configs:
+        link, sha256 = get_link(config_or_link)
+        if link is None:
+            print(f"[WARN] {config_or_link} doesn't have `metadata.link` field.")
+            continue
+
+        try:
+            binary_path = FirmwareManager.get_firmware(link, sha256=sha256, revalidate=True)
+        except FirmwareCacheError as err:
+            print(f"[ERROR] {err}")
+            number_of_errors += 1
+            continue
+        print(f"[INFO] {config_or_link}: {binary_path}")
+
+    sys.exit(1 if number_of_errors else 0)
+
+if __name__ == '__main__':
+    main()
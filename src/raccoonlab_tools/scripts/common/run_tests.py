@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import sys
+import argparse
+
+from raccoonlab_tools.common.pytest_runner import SUITES, run_tests, get_suite_path
+from raccoonlab_tools.common.capture_checker import get_capture_path
+from raccoonlab_tools.common.device_manager import TransportNotFoundException
+from raccoonlab_tools.common.protocol_parser import CanProtocolParser
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run several test suites in one session with a shared CAN transport. "
+                    "Unknown arguments are forwarded to pytest.")
+    parser.add_argument('suites', nargs='+', choices=list(SUITES), metavar='SUITE',
+                        help=f"One or more of: {', '.join(SUITES)}")
+    args, pytest_args = parser.parse_known_args()
+
+    # All test files are collected before the first test is run and the collection may already
+    # open the CAN device, so the protocol is detected once here and cached for the suites
+    if get_capture_path() is None:
+        try:
+            CanProtocolParser.find_protocol(verbose=True)
+        except TransportNotFoundException as err:
+            print(err)
+
+    test_files = [get_suite_path(suite) for suite in args.suites]
+    sys.exit(run_tests(test_files, pytest_args))
+
+if __name__ == "__main__":
+    main()
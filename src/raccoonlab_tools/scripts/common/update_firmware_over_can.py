@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Update the firmware of installed nodes over the CAN bus without a programmer.
+All given nodes (or all online nodes) are updated concurrently from one image:
+- DroneCAN: uavcan.protocol.file.BeginFirmwareUpdate + uavcan.protocol.file.Read server,
+- Cyphal: uavcan.node.ExecuteCommand (begin software update) + uavcan.file.Read server.
+"""
+import sys
+import asyncio
+import argparse
+from typing import List, Optional
+import yaml
+from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.device_manager import DeviceManager
+from raccoonlab_tools.common.firmware_manager import FirmwareManager
+from raccoonlab_tools.common.firmware_update import FirmwareImage, NodeUpdateProgress, UpdateState
+
+def update_dronecan(image : FirmwareImage,
+                    transport : str,
+                    node_ids : Optional[List[int]],
+                    timeout : float) -> List[NodeUpdateProgress]:
+    import dronecan
+    from raccoonlab_tools.dronecan.utils import NodeFinder
+    from raccoonlab_tools.dronecan.firmware_update import FirmwareUpdater
+
+    node = dronecan.make_node(transport, node_id=100, bitrate=1000000, baudrate=1000000)
+    if node_ids is None:
+        node_ids = NodeFinder(node).find_online_nodes()
+    updater = FirmwareUpdater(node, image)
+    try:
+        return updater.update(node_ids, timeout_sec=timeout)
+    finally:
+        updater.close()
+
+async def update_cyphal(image : FirmwareImage,
+                        node_ids : Optional[List[int]],
+                        timeout : float) -> List[NodeUpdateProgress]:
+    from raccoonlab_tools.cyphal.global_node import GlobalCyphalNode
+    from raccoonlab_tools.cyphal.utils import NodeFinder
+    from raccoonlab_tools.cyphal.firmware_update import FirmwareUpdater
+
+    cyphal_node = GlobalCyphalNode.create_node()
+    if node_ids is None:
+        node_ids = await NodeFinder(cyphal_node).find_online_nodes()
+        print(f"Found nodes {node_ids}")
+    updater = FirmwareUpdater(cyphal_node, image)
+    try:
+        return await updater.update(node_ids, timeout_sec=timeout)
+    finally:
+        updater.close()
+        cyphal_node.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--config', help='Path to .yaml config file')
+    group.add_argument('--binary', help='Path to .bin binary file')
+    parser.add_argument('--node-ids', type=int, nargs='+', default=None,
+                        help='Nodes to update. Default: all online nodes')
+    parser.add_argument('--protocol', choices=['dronecan', 'cyphal'], default=None,
+                        help='Auto detect by default')
+    parser.add_argument('--transport', default=None,
+                        help='DroneCAN transport. Auto detect by default. Examples: slcan:/dev/ttyACM0, vcan0')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Max duration of the update, sec')
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config, "r", encoding='UTF-8') as stream:
+            metadata = yaml.safe_load(stream)['metadata']
+            binary_path = FirmwareManager.get_firmware(metadata['link'], sha256=metadata.get('sha256'))
+    else:
+        binary_path = args.binary
+
+    if args.protocol == 'dronecan':
+        protocol = Protocol.DRONECAN
+    elif args.protocol == 'cyphal':
+        protocol = Protocol.CYPHAL
+    else:
+        protocol = CanProtocolParser.verify_protocol(DeviceManager.get_device_port(verbose=True), verbose=True)
+
+    with FirmwareImage(binary_path) as image:
+        print(f"[INFO] image {binary_path}: {image.size} bytes")
+        if protocol == Protocol.DRONECAN:
+            transport = args.transport if args.transport is not None else DeviceManager.get_dronecan_can_iface()
+            progresses = update_dronecan(image, transport, args.node_ids, args.timeout)
+        elif protocol == Protocol.CYPHAL:
+            progresses = asyncio.run(update_cyphal(image, args.node_ids, args.timeout))
+        else:
+            print("[ERROR] Protocol has not been detected.")
+            sys.exit(1)
+
+    if len(progresses) == 0:
+        print("[ERROR] There are no nodes to update.")
+        sys.exit(1)
+    if not all(progress.state == UpdateState.FINISHED for progress in progresses):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -3,29 +3,74 @@
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 
+import sys
+import hashlib
 import argparse
 import yaml
 from raccoonlab_tools.common.firmware_manager import FirmwareManager
 from raccoonlab_tools.common.device_manager import DeviceManager
+from raccoonlab_tools.common.inventory import Inventory
 
 def main():
     parser = argparse.ArgumentParser()
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--config', help='Path to .yaml config file')
     group.add_argument('--binary', help='Path to .bin binary file')
+    batch_group = parser.add_mutually_exclusive_group()
+    batch_group.add_argument('--all-programmers', action='store_true',
+                             help='Upload with all detected programmers concurrently')
+    batch_group.add_argument('--serial', nargs='+', default=None,
+                             help='Upload with the programmers with these serial numbers concurrently')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Max number of concurrent uploads. Default: one per programmer')
+    parser.add_argument('--force', action='store_true',
+                        help='Write the whole binary even if the target already has it')
     args = parser.parse_args()
 
     if args.config:
         with open(args.config, "r", encoding='UTF-8') as stream:
             config = yaml.safe_load(stream)
-            binary_path = FirmwareManager.get_firmware(config['metadata']['link'])
+            binary_path = FirmwareManager.get_firmware(config['metadata']['link'],
+                                                       sha256=config['metadata'].get('sha256'))
     elif args.binary:
         binary_path = args.binary
 
+    if args.all_programmers or args.serial:
+        upload_firmware_batch(binary_path, args.serial, args.jobs, args.force)
+        return
+
     # Just to check that the programmer is avaliable
     DeviceManager.get_programmer()
 
-    FirmwareManager.upload_firmware(binary_path)
+    FirmwareManager.upload_firmware(binary_path, force=args.force)
+
+def upload_firmware_batch(binary_path, serial_numbers=None, max_workers=None, force=False):
+    if serial_numbers is None:
+        programmers = DeviceManager.find_programmers(verbose=True)
+        serial_numbers = [programmer.serial_number for programmer in programmers
+                          if programmer.serial_number is not None]
+        if len(serial_numbers) < len(programmers):
+            print("[WARN] Programmers without a serial number are skipped.")
+    if len(serial_numbers) == 0:
+        print("[ERROR] There are no programmers to upload with.")
+        sys.exit(1)
+
+    results = FirmwareManager.upload_firmware_batch(binary_path, serial_numbers, max_workers, force)
+
+    inventory = Inventory.open_default()
+    if inventory is not None:
+        with open(binary_path, "rb") as binary:
+            sha256 = hashlib.sha256(binary.read()).hexdigest()
+        with inventory:
+            for result in results:
+                inventory.record_flash(result.serial_number, sha256, binary_path, result.success)
+
+    print("\nSummary:")
+    for result in results:
+        status = "OK" if result.success else f"FAIL ({result.error})"
+        print(f"- {result.serial_number}: {status}, {result.duration_sec:.1f} sec")
+    if not all(result.success for result in results):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
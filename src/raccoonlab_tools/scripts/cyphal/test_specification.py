@@ -4,20 +4,28 @@
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 import os
 import sys
-import time
-import subprocess
+import argparse
 import asyncio
 import secrets
 import string
 import re
+import functools
+from typing import Dict, List, Optional, Tuple
 import pytest
 
-import pycyphal.application
 # pylint: disable=import-error
 import uavcan
 import uavcan.node.port.List_1_0
-from raccoonlab_tools.cyphal.utils import NodeFinder, RegisterInterface, PortRegisterInterface, NodeCommander
+import uavcan.register.Value_1_0
+from raccoonlab_tools.cyphal.utils import NodeFinder, RegisterInterface, PortRegisterInterface, NodeCommander, \
+                                         _np_array_to_string
+from raccoonlab_tools.cyphal.global_node import GlobalCyphalNode
+from raccoonlab_tools.cyphal.spec_evidence import SpecEvidence, EvidenceCollector, CaptureEvidenceCollector
+from raccoonlab_tools.common.capture import read_capture
+from raccoonlab_tools.common.capture_checker import get_capture_path, add_capture_arguments, check_captures
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests, InventoryPlugin
+from raccoonlab_tools.common.inventory import Inventory
 from raccoonlab_tools.common.device_manager import DeviceManager
 
 # We are going to ignore a few checks for the given nodes:
@@ -44,26 +52,96 @@ def event_loop():
     loop.close()
 
 
-class GlobalCyphalNode:
+@functools.lru_cache(maxsize=None)
+def _load_capture(capture : str) -> Dict[int, SpecEvidence]:
+    evidences = CaptureEvidenceCollector().collect(read_capture(capture))
+    return {node_id : evidence for node_id, evidence in evidences.items()
+            if node_id not in NodeFinder.black_list}
+
+@functools.lru_cache(maxsize=None)
+def _discover_node_ids(capture : Optional[str]) -> Tuple[int, ...]:
     """
-    Let's create a Cyphal node once and reuse it for all tests.
+    The tests are parametrized by node ID, so the nodes are discovered during the collection.
+    A temporary Cyphal node is used here, because the session event loop does not exist yet.
     """
-    cyphal_node = None
+    if capture is not None:
+        return tuple(sorted(_load_capture(capture)))
 
-    @staticmethod
-    def get_node() -> pycyphal.application._node.Node:
-        if GlobalCyphalNode.cyphal_node is not None:
-            return GlobalCyphalNode.cyphal_node
+    async def find_online_nodes() -> List[int]:
+        cyphal_node = GlobalCyphalNode.create_node()
+        node_ids = await NodeFinder(cyphal_node).find_online_nodes()
+        cyphal_node.close()
+        return node_ids
+
+    return tuple(asyncio.run(find_online_nodes()))
+
+def pytest_generate_tests(metafunc):
+    """Run every per-node check for every node found on the bus or in the capture."""
+    if "node_id" in metafunc.fixturenames:
+        node_ids = list(_discover_node_ids(get_capture_path()))
+        if len(node_ids) == 0:
+            node_ids = [None]  # Let the evidence fixture report it
+        metafunc.parametrize("node_id", node_ids, ids=[f"node{node_id}" for node_id in node_ids])
+
+@pytest.fixture(scope="session")
+async def evidences() -> Dict[int, SpecEvidence]:
+    """
+    Collect everything the passive checks need for all nodes at once.
+    The tests below only assert against this store, so the whole suite waits for the longest
+    observation window (port.List) instead of the sum of all of them, regardless of the number
+    of nodes on the bus.
+    If a capture is provided, the evidence is reconstructed from it instead of live nodes.
+    """
+    capture = get_capture_path()
+    if capture is not None:
+        return _load_capture(capture)
+
+    cyphal_node = GlobalCyphalNode.get_node()
+    return await EvidenceCollector(cyphal_node).collect_many(_discover_node_ids(None))
+
+@pytest.fixture
+def evidence(node_id : Optional[int], evidences : Dict[int, SpecEvidence]) -> SpecEvidence:
+    capture = get_capture_path()
+    assert node_id is not None, "There is no online Cyphal node" if capture is None else \
+                                f"There is no Cyphal node in {capture}"
+    return evidences[node_id]
+
+@pytest.fixture(scope="session")
+async def persistent_memory(evidences : Dict[int, SpecEvidence]) -> Dict[int, tuple]:
+    """
+    The persistent memory check requires a reboot, so it is performed for all nodes concurrently.
+    Return a dictionary: node ID -> (expected value, value before restart, value after restart).
+    """
+    node_ids = [node_id for node_id, evidence in evidences.items()
+                if not evidence.from_capture and evidence.name not in DEBUGGING_TOOLS_NAME]
+    results = await asyncio.gather(*[_check_persistent_memory(node_id) for node_id in node_ids])
+    return dict(zip(node_ids, results))
+
+async def _check_persistent_memory(dest_node_id : int) -> tuple:
+    """
+    1. set random string parameter to uavcan.node.description (it must exist anyway),
+    2. save all parameters to the persistent memory,
+    3. reboot the target node,
+    4. get uavcan.node.description value
+    """
+    cyphal_node = GlobalCyphalNode.get_node()
+    commander = NodeCommander(cyphal_node, dest_node_id)
+    register_interface = RegisterInterface(cyphal_node)
+    register = "uavcan.node.description"
+    random_string = ''.join(secrets.choice(string.ascii_lowercase) for _ in range(10))
+    random_value = uavcan.register.Value_1_0(string=uavcan.primitive.String_1_0(random_string))
+
+    value = await register_interface.register_acess(dest_node_id, register, random_value)
+    value_before_restart = None if value is None else _np_array_to_string(value.string.value)
+
+    await commander.store_persistent_states()
 
-        GlobalCyphalNode.cyphal_node = pycyphal.application.make_node(
-            uavcan.node.GetInfo_1_0.Response(
-                uavcan.node.Version_1_0(major=1, minor=0),
-                name="co.raccoonlab.spec_checker"
-        ))
+    await commander.restart()
 
-        GlobalCyphalNode.cyphal_node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
-        GlobalCyphalNode.cyphal_node.start()
-        return GlobalCyphalNode.cyphal_node
+    value = await register_interface.register_acess(dest_node_id, register)
+    value_after_restart = None if value is None else _np_array_to_string(value.string.value)
+
+    return random_string, value_before_restart, value_after_restart
 
 @pytest.mark.dependency()
 async def test_transport():
@@ -71,6 +149,8 @@ async def test_transport():
     This test is required just for optimization purposes.
     Let's skip all tests if we don't have an online Cyphal node.
     """
+    if get_capture_path() is not None:
+        return  # Skip if the tests are performed against a recorded capture
 
     can_iface = os.environ.get('UAVCAN__CAN__IFACE')
     if can_iface is None:
@@ -78,7 +158,7 @@ async def test_transport():
     if not can_iface.startswith('slcan:'):
         return  # Skip of SocketCAN or other interface
 
-    sniffer = can_iface[6:]
+    sniffer = can_iface[6:].split('@')[0]  # slcan:/dev/ttyACM0@1000000 -> /dev/ttyACM0
     assert CanProtocolParser.find_protocol(sniffer) == Protocol.CYPHAL
 
 
@@ -86,128 +166,98 @@ async def test_transport():
 @pytest.mark.dependency(depends=["test_transport"])
 class TestNodeHeartbeat:
     """5.3.2 Node heartbeat (uavcan.node.Heartbeat)"""
-    timestamps = []
-    uptimes = []
-    data_collected = False
 
     @staticmethod
-    async def test_frequency():
+    async def test_frequency(evidence : SpecEvidence):
         """A node must publish Heartbeat with constant frequency 1 Hz"""
-        await TestNodeHeartbeat._collect_heartbeats()
+        timestamps = TestNodeHeartbeat._last_five(evidence.heartbeat_timestamps)
 
-        for idx in range(len(TestNodeHeartbeat.timestamps) - 1):
-            period = TestNodeHeartbeat.timestamps[idx+1] - TestNodeHeartbeat.timestamps[idx]
+        for idx in range(len(timestamps) - 1):
+            period = timestamps[idx+1] - timestamps[idx]
             assert pytest.approx(1.0, abs=0.05) == period
 
     @staticmethod
-    async def test_uptime():
+    async def test_uptime(evidence : SpecEvidence):
         """The node is not expected to be restarted during the test, check uptime"""
-        await TestNodeHeartbeat._collect_heartbeats()
+        uptimes = TestNodeHeartbeat._last_five(evidence.heartbeat_uptimes)
 
-        assert (TestNodeHeartbeat.uptimes[-1] - TestNodeHeartbeat.uptimes[0]) == 4
+        assert (uptimes[-1] - uptimes[0]) == 4
 
     @staticmethod
-    async def _collect_heartbeats():
-        """ Let's collect Heartbeat of the target node for 5.5 seconds and check last 5 of them"""
-        if TestNodeHeartbeat.data_collected:
-            return
-
-        cyphal_node = GlobalCyphalNode.get_node()
-        dest_node_id = await NodeFinder(cyphal_node).find_online_node()
-        sub = cyphal_node.make_subscriber(uavcan.node.Heartbeat_1_0)
-        TestNodeHeartbeat.timestamps = []
-        TestNodeHeartbeat.uptimes = []
-
-        time_left = 5.5
-        end_time = time.time() + time_left
-        while time_left > 0:
-            transfer_from = await sub.receive_for(time_left)
-            if transfer_from is not None and transfer_from[1].source_node_id == dest_node_id:
-                TestNodeHeartbeat.timestamps.append(time.time())
-                TestNodeHeartbeat.uptimes.append(transfer_from[0].uptime)
-            time_left = end_time - time.time()
-        sub.close()
-
-        assert len(TestNodeHeartbeat.timestamps) >= 5
-        assert len(TestNodeHeartbeat.uptimes) >= 5
-        TestNodeHeartbeat.timestamps = TestNodeHeartbeat.timestamps[-5:]
-        TestNodeHeartbeat.uptimes = TestNodeHeartbeat.uptimes[-5:]
-        TestNodeHeartbeat.data_collected = True
+    def _last_five(samples : list) -> list:
+        """Heartbeat is collected for 5.5 seconds, check last 5 of them"""
+        assert len(samples) >= 5
+        return samples[-5:]
 
 
 @pytest.mark.asyncio
 @pytest.mark.dependency(depends=["test_transport"])
 class TestGenericNodeInformation:
     """5.3.3. Generic node information (uavcan.node.GetInfo)"""
-    data_collected = False
-    get_info_response = uavcan.node.GetInfo_1_0.Response()
 
     @staticmethod
-    async def test_protocol_version():
+    async def test_protocol_version(evidence : SpecEvidence):
         """The Protocol version field should be filled in."""
-        get_info = await TestGenericNodeInformation._get_info()
+        get_info = TestGenericNodeInformation._get_info(evidence)
         protocol_version = get_info.protocol_version
         assert not (protocol_version.major == 0 and protocol_version.minor == 0)
 
     @staticmethod
-    async def test_hardware_version():
+    async def test_hardware_version(evidence : SpecEvidence):
         """Hardware version field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
-        name = "".join([chr(item) for item in get_info.name])
-        if name not in DEBUGGING_TOOLS_NAME:
+        get_info = TestGenericNodeInformation._get_info(evidence)
+        if evidence.name not in DEBUGGING_TOOLS_NAME:
             hardware_version = get_info.hardware_version
             assert not (hardware_version.major == 0 and hardware_version.minor == 0)
 
     @staticmethod
-    async def test_software_version():
+    async def test_software_version(evidence : SpecEvidence):
         """Software version field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
+        get_info = TestGenericNodeInformation._get_info(evidence)
         software_version = get_info.software_version
         assert not (software_version.major == 0 and software_version.minor == 0)
 
     @staticmethod
-    async def test_software_vcs_revision_id():
+    async def test_software_vcs_revision_id(evidence : SpecEvidence):
         """Software VSC field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
-        name = "".join([chr(item) for item in get_info.name])
-        if name not in DEBUGGING_TOOLS_NAME:
+        get_info = TestGenericNodeInformation._get_info(evidence)
+        if evidence.name not in DEBUGGING_TOOLS_NAME:
             assert get_info.software_vcs_revision_id != 0
 
     @staticmethod
-    async def test_unique_id():
+    async def test_unique_id(evidence : SpecEvidence):
         """Software UID field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
+        get_info = TestGenericNodeInformation._get_info(evidence)
         unique_id_is_valid = any(byte != 0 for byte in get_info.unique_id)
         assert unique_id_is_valid
 
     @staticmethod
     @pytest.mark.skip(reason="not yet")
-    async def test_software_image_crc():
+    async def test_software_image_crc(evidence : SpecEvidence):
         """Software Image CRC field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
+        get_info = TestGenericNodeInformation._get_info(evidence)
         software_image_crc_is_valid = any(byte != 0 for byte in get_info.software_image_crc)
         assert software_image_crc_is_valid
 
     @staticmethod
     @pytest.mark.skip(reason="not yet")
-    async def test_certificate_of_authenticity():
+    async def test_certificate_of_authenticity(evidence : SpecEvidence):
         """he certificate of authenticity (COA) field should be filled."""
-        get_info = await TestGenericNodeInformation._get_info()
+        get_info = TestGenericNodeInformation._get_info(evidence)
         coa = get_info.certificate_of_authenticity
         coa_is_valid = any(byte != 0 for byte in coa)
         assert coa_is_valid
 
     @staticmethod
-    async def test_node_name():
+    async def test_node_name(evidence : SpecEvidence):
         """
         Node name pattern: com.manufacturer.project.product
         Examples of correct names:
         - org.opencyphal.yakut.monitor
         - co.raccoonlab.gps_mag_baro
         """
-        get_info_response = await TestGenericNodeInformation._get_info()
-        name = "".join([chr(item) for item in get_info_response.name])
-        assert TestGenericNodeInformation._check_node_name(name), name
+        TestGenericNodeInformation._get_info(evidence)
+        assert TestGenericNodeInformation._check_node_name(evidence.name), evidence.name
 
     @staticmethod
     def _check_node_name(node_name : str) -> bool:
@@ -215,66 +265,41 @@ class TestGenericNodeInformation:
         return re.match(pattern, node_name) is not None
 
     @staticmethod
-    async def _get_info() -> uavcan.node.GetInfo_1_0.Response:
-        if TestGenericNodeInformation.data_collected:
-            return TestGenericNodeInformation.get_info_response
-
-        cyphal_node = GlobalCyphalNode.get_node()
-        dest_node_id = await NodeFinder(cyphal_node).find_online_node()
-
-        client = cyphal_node.make_client(uavcan.node.GetInfo_1_0, dest_node_id)
-        get_info_response = await client.call(uavcan.node.GetInfo_1_0.Request())
-        client.close()
-        assert get_info_response is not None
-        get_info_response = get_info_response[0]
-        TestGenericNodeInformation.get_info_response = get_info_response
-        TestGenericNodeInformation.data_collected = True
-        return TestGenericNodeInformation.get_info_response
+    def _get_info(evidence : SpecEvidence) -> uavcan.node.GetInfo_1_0.Response:
+        if evidence.get_info is None and evidence.from_capture:
+            pytest.skip("GetInfo has not been recorded")
+        assert evidence.get_info is not None, "GetInfo has not been responded"
+        return evidence.get_info
 
 
 @pytest.mark.asyncio
 @pytest.mark.dependency(depends=["test_transport"])
 class TestBusDataFlowMonitoring:
     """5.3.4. Bus data flow monitoring (uavcan.node.port)"""
-    data_collected = False
-    dest_node_name = ""
-    port_list = uavcan.node.port.List_1_0()
 
     @staticmethod
-    async def test_reigister_interface_is_supported():
-        port_list = await TestBusDataFlowMonitoring._collect_port_list()
+    async def test_reigister_interface_is_supported(evidence : SpecEvidence):
+        port_list = TestBusDataFlowMonitoring._get_port_list(evidence)
         assert port_list.servers.mask[384], "register.Access is not supported"
         assert port_list.servers.mask[385], "register.List is not supported"
 
     @staticmethod
-    async def test_get_info_is_supported():
-        port_list = await TestBusDataFlowMonitoring._collect_port_list()
+    async def test_get_info_is_supported(evidence : SpecEvidence):
+        port_list = TestBusDataFlowMonitoring._get_port_list(evidence)
         assert port_list.servers.mask[430], "GetInfo is not supported"
 
     @staticmethod
-    async def test_execute_command_is_supported():
-        port_list = await TestBusDataFlowMonitoring._collect_port_list()
-        dest_node_name = TestBusDataFlowMonitoring.dest_node_name
-        if dest_node_name not in DEBUGGING_TOOLS_NAME:
+    async def test_execute_command_is_supported(evidence : SpecEvidence):
+        port_list = TestBusDataFlowMonitoring._get_port_list(evidence)
+        if evidence.name not in DEBUGGING_TOOLS_NAME:
             assert port_list.servers.mask[435], "ExecuteCommand is not supported"
 
     @staticmethod
-    async def _collect_port_list() -> uavcan.node.port.List_1_0:
-        if TestBusDataFlowMonitoring.data_collected:
-            return TestBusDataFlowMonitoring.port_list
-
-        cyphal_node = GlobalCyphalNode.get_node()
-        node_finder = NodeFinder(cyphal_node)
-
-        tested_node_info = await node_finder.get_info()
-        TestBusDataFlowMonitoring.dest_node_name = tested_node_info.name
-
-        port_list = await node_finder.get_port_list()
-        assert port_list is not None, "uavcan.port.List was not published!"
-        TestBusDataFlowMonitoring.port_list = port_list
-
-        TestBusDataFlowMonitoring.data_collected = True
-        return TestBusDataFlowMonitoring.port_list
+    def _get_port_list(evidence : SpecEvidence) -> uavcan.node.port.List_1_0:
+        if evidence.port_list is None and evidence.from_capture:
+            pytest.skip("uavcan.port.List has not been recorded")
+        assert evidence.port_list is not None, "uavcan.port.List was not published!"
+        return evidence.port_list
 
 @pytest.mark.asyncio
 @pytest.mark.dependency(depends=["test_transport"])
@@ -288,11 +313,9 @@ class TestGenericNodeCommands():
 @pytest.mark.dependency(depends=["test_transport"])
 class TestRegisterInterface:
     """5.3.10. Register interface"""
-    register_list = []
-    access_client = None
 
     @staticmethod
-    async def test_registers_name():
+    async def test_registers_name(evidence : SpecEvidence):
         """
         Register name should contain only:
         - Lowercase ASCII alphanumeric characters (a-z, 0-9)
@@ -312,24 +335,24 @@ class TestRegisterInterface:
         assert all(re.match(pattern, name) is None for name in bad_names)
         """
 
-        register_names = await TestRegisterInterface._collect_register_list()
+        register_names = TestRegisterInterface._get_register_list(evidence)
         pattern = r'^[a-z][a-z0-9._]*(?:\.[a-z0-9._]+)+$'
         for register_name in register_names:
             assert re.match(pattern, register_name) is not None
 
     @staticmethod
-    async def test_default_registers_existance():
+    async def test_default_registers_existance(evidence : SpecEvidence):
         """A few registers must be implemented in any node"""
         required_registers = [
             "uavcan.node.id",
             "uavcan.node.description",
         ]
 
-        register_list = await TestRegisterInterface._collect_register_list()
+        register_list = TestRegisterInterface._get_register_list(evidence)
         assert all(required_register in register_list for required_register in required_registers)
 
     @staticmethod
-    async def test_port_id_register():
+    async def test_port_id_register(evidence : SpecEvidence):
         """
         Publication/subscription/client/server port-ID .id registers has the name pattern:
         uavcan.PORT_TYPE.PORT_NAME.id
@@ -339,17 +362,20 @@ class TestRegisterInterface:
         - persistent,
         - the default value is 65535.
         """
-        register_list = await TestRegisterInterface._collect_register_list()
+        register_list = TestRegisterInterface._get_register_list(evidence)
 
         for register_name in register_list:
             if PortRegisterInterface.is_port_id(register_name):
-                access_response = await TestRegisterInterface._register_access(register_name)
+                access_response = evidence.register_values.get(register_name)
+                if access_response is None and evidence.from_capture:
+                    continue
+                assert access_response is not None, f"{register_name} has not been responded"
                 assert access_response.value.natural16 is not None
                 assert access_response._mutable  # pylint: disable=protected-access
                 assert access_response.persistent
 
     @staticmethod
-    async def test_port_type_register():
+    async def test_port_type_register(evidence : SpecEvidence):
         """
         Publication/subscription/client/server port-ID .type registers has the name pattern:
         uavcan.PORT_TYPE.PORT_NAME.type
@@ -358,86 +384,77 @@ class TestRegisterInterface:
         - immutable,
         - persistent.
         """
-        register_list = await TestRegisterInterface._collect_register_list()
+        register_list = TestRegisterInterface._get_register_list(evidence)
 
         for register_name in register_list:
             if PortRegisterInterface.is_port_type(register_name):
-                access_response = await TestRegisterInterface._register_access(register_name)
+                access_response = evidence.register_values.get(register_name)
+                if access_response is None and evidence.from_capture:
+                    continue
+                assert access_response is not None, f"{register_name} has not been responded"
                 assert access_response.value.string is not None
                 assert not access_response._mutable  # pylint: disable=protected-access
                 assert access_response.persistent
 
     @staticmethod
-    async def test_persistent_memory() -> None:
+    async def test_persistent_memory(evidence : SpecEvidence, persistent_memory : Dict[int, tuple]) -> None:
         """
-        Persistent memory check:
-        1. set random string parameter to uavcan.node.description (it must exist anyway),
-        2. save all parameters to the persistent memory,
-        3. reboot the target node,
-        4. get uavcan.node.description value
+        Persistent memory check: a random string written to uavcan.node.description must
+        survive ExecuteCommand store + restart. See _check_persistent_memory.
         """
-        cyphal_node = GlobalCyphalNode.get_node()
-        node_finder = NodeFinder(cyphal_node)
-        dest_node_id = await node_finder.find_online_node()
-        commander = NodeCommander(cyphal_node, dest_node_id)
-        register = "uavcan.node.description"
-        random_string = ''.join(secrets.choice(string.ascii_lowercase) for _ in range(10))
-        random_value = uavcan.primitive.String_1_0(random_string)
-
-        tested_node_info = await node_finder.get_info()
-        if tested_node_info.name in DEBUGGING_TOOLS_NAME:
+        if evidence.from_capture:
+            pytest.skip("Active check, a live node is required")
+        if evidence.name in DEBUGGING_TOOLS_NAME:
             return
 
-        access_response = await TestRegisterInterface._register_access(register, random_value)
-        value = "".join([chr(item) for item in access_response.value.string.value])
-        assert value == random_string
-
-        await commander.store_persistent_states()
-
-        await commander.restart()
-
-        access_response = await TestRegisterInterface._register_access(register)
-        value = "".join([chr(item) for item in access_response.value.string.value])
-        assert value == random_string
+        expected, value_before_restart, value_after_restart = persistent_memory[evidence.node_id]
+        assert value_before_restart == expected
+        assert value_after_restart == expected
 
     @staticmethod
-    async def _register_access(register_name, value=None):
-        if TestRegisterInterface.access_client is None:
-            cyphal_node = GlobalCyphalNode.get_node()
-            dest_node_id = await NodeFinder(cyphal_node).find_online_node()
-            access_client = cyphal_node.make_client(uavcan.register.Access_1_0, dest_node_id)
-            TestRegisterInterface.access_client = access_client
-
-        access_request = uavcan.register.Access_1_0.Request()
-        access_request.name.name = register_name
-
-        if isinstance(value, uavcan.primitive.String_1_0):
-            access_request.value.string = value
-
-        access_response = await TestRegisterInterface.access_client.call(access_request)
-        assert access_response is not None
-        access_response = access_response[0]
-        return access_response
-
-    @staticmethod
-    async def _collect_register_list() -> list:
-        if len(TestRegisterInterface.register_list) != 0:
-            return TestRegisterInterface.register_list
-
-        cyphal_node = GlobalCyphalNode.get_node()
-        dest_node_id = await NodeFinder(cyphal_node).find_online_node()
-        register_names = await RegisterInterface(cyphal_node).register_list(dest_node_id)
-        assert len(register_names) >= 2, "Node should have at least 2 registers!"
-        TestRegisterInterface.register_list = register_names
-        return TestRegisterInterface.register_list
+    def _get_register_list(evidence : SpecEvidence) -> list:
+        if len(evidence.register_names) == 0 and evidence.from_capture:
+            pytest.skip("register.List has not been recorded")
+        assert len(evidence.register_names) >= 2, "Node should have at least 2 registers!"
+        return evidence.register_names
 
 def main():
-    cmd = ["pytest", os.path.abspath(__file__),
-           "-v",
-           "--asyncio-mode=auto",
-           '-W', 'ignore::DeprecationWarning']
-    cmd += sys.argv[1:]
-    sys.exit(subprocess.call(cmd))
+    parser = argparse.ArgumentParser(add_help=False)
+    add_capture_arguments(parser)
+    parser.add_argument('--transport', default=None,
+                        help='Cyphal transport. Default: UAVCAN__CAN__IFACE or auto detect. '
+                             'Examples: slcan:/dev/ttyACM0@1000000, socketcan:vcan0')
+    args, pytest_args = parser.parse_known_args()
+    pytest_args = ["--asyncio-mode=auto"] + pytest_args
+
+    if args.capture is not None:
+        sys.exit(check_captures(os.path.abspath(__file__), args.capture, args.jobs, pytest_args))
+
+    # The Cyphal nodes of the tests are configured by the environment variables
+    if args.transport is not None:
+        os.environ['UAVCAN__CAN__IFACE'] = args.transport
+    elif 'UAVCAN__CAN__IFACE' not in os.environ and DeviceManager.get_cyphal_can_iface():
+        os.environ['UAVCAN__CAN__IFACE'] = DeviceManager.get_cyphal_can_iface()
+    os.environ.setdefault('UAVCAN__NODE__ID', str(NodeFinder.black_list[0]))
+    sys.exit(run_tests([__file__], pytest_args, plugins=get_inventory_plugins()))
+
+def get_inventory_plugins() -> list:
+    inventory = Inventory.open_default()
+    if inventory is None:
+        return []
+    def get_uids(node_ids : List[int]) -> Dict[int, str]:
+        async def get_infos():
+            cyphal_node = GlobalCyphalNode.create_node()
+            try:
+                return await NodeFinder(cyphal_node).get_infos(node_ids)
+            finally:
+                cyphal_node.close()
+
+        # The session event loop is closed by now, so the nodes are asked from a new one
+        GlobalCyphalNode.close()
+        node_infos = asyncio.run(get_infos())
+        return {node_id : info.hardware_version.unique_id for node_id, info in node_infos.items()}
+    return [InventoryPlugin(inventory, get_uids)]
 
 if __name__ == "__main__":
     main()
@@ -2,19 +2,26 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+import sys
+import hashlib
 import argparse
 import yaml
 import dronecan
 from raccoonlab_tools.dronecan.utils import Parameter, \
                                             ParametersInterface, \
                                             NodeFinder, \
-                                            NodeCommander
+                                            NodeCommander, \
+                                            ServiceClient
 from raccoonlab_tools.common.firmware_manager import FirmwareManager
 from raccoonlab_tools.common.device_manager import DeviceManager
+from raccoonlab_tools.common.inventory import Inventory
+from raccoonlab_tools.dronecan.fleet import FleetPipeline, Jig, Stage
 
-def upload_firmware(config : dict):
+def upload_firmware(config : dict, force=False):
     if 'metadata' in config and 'link' in config['metadata']:
-        FirmwareManager.upload_firmware(FirmwareManager.get_firmware(config['metadata']['link']))
+        binary_path = FirmwareManager.get_firmware(config['metadata']['link'],
+                                                   sha256=config['metadata'].get('sha256'))
+        FirmwareManager.upload_firmware(binary_path, force=force)
     else:
         print("[WARN] Config file doesn't have `metadata.link` field.")
 
@@ -30,14 +37,78 @@ def configure_parameters(config : dict, can_transport : str):
     target_node_id = NodeFinder(node).find_online_node()
     params_interface = ParametersInterface(node=node, target_node_id=target_node_id)
     commander = NodeCommander(node=node, target_node_id=target_node_id)
-    for name in config['params']:
-        desired_param = Parameter(name=name, value=config['params'][name])
-        param_after_change = params_interface.set(desired_param)
-        print(param_after_change)
+    params = [Parameter(name=name, value=value) for name, value in config['params'].items()]
+    update = params_interface.apply(params)
+    print(update)
+    record_params(node, target_node_id, config['params'], update.changed + update.unchanged)
+    print(f"[INFO] Latency: {ServiceClient.get_latency(node, target_node_id, 'uavcan.protocol.param.GetSet')}")
+    if update.failed:
+        print(f"[ERROR] {len(update.failed)} parameters have not been configured.")
+    if not update.changed:
+        print("[INFO] Nothing has been changed. Skip store and reboot.")
+        return
 
     print(f"[INFO] Save persistent parameters: {commander.store_persistent_states()}")
     print(f"[INFO] Reboot: {commander.restart()}")
 
+def record_params(node, target_node_id : int, desired : dict, actual : list):
+    inventory = Inventory.open_default()
+    if inventory is None:
+        return
+    node_info = NodeFinder(node).get_info(target_node_id)
+    if node_info is None:
+        print("[WARN] The node info is unknown. Skip the inventory.")
+        return
+    uid = node_info.hardware_version.unique_id
+    with inventory:
+        inventory.record_node_infos([node_info])
+        inventory.record_params(uid, desired, source="config")
+        inventory.record_params(uid, {param.name : param.value for param in actual}, source="rl-config")
+
+def record_fleet(config : dict, statuses : list, binary_path=None):
+    inventory = Inventory.open_default()
+    if inventory is None:
+        return
+    sha256 = None
+    if binary_path is not None:
+        with open(binary_path, "rb") as binary:
+            sha256 = hashlib.sha256(binary.read()).hexdigest()
+
+    with inventory:
+        for status in statuses:
+            uid = None if status.node_info is None else status.node_info.hardware_version.unique_id
+            if status.flash_result is not None:
+                inventory.record_flash(status.jig.programmer, sha256, binary_path, status.flash_result.success, uid)
+            if uid is None:
+                continue
+            inventory.record_node_infos([status.node_info])
+            if config.get('params'):
+                inventory.record_params(uid, config['params'], source="config")
+            if status.params:
+                inventory.record_params(uid, status.params, source="rl-config")
+
+def get_all_jigs() -> list:
+    """RaccoonLab ST-Link is a programmer and a CAN-sniffer at the same time."""
+    jigs = []
+    for programmer in DeviceManager.find_programmers(verbose=False):
+        if programmer.serial_number is not None:
+            jigs.append(Jig(can_transport=f"slcan:{programmer.port}", programmer=programmer.serial_number))
+    return jigs
+
+def provision_fleet(config : dict, jigs : list, flash_jobs=None, can_jobs=None, force=False):
+    binary_path = None
+    if 'metadata' in config and 'link' in config['metadata']:
+        binary_path = FirmwareManager.get_firmware(config['metadata']['link'],
+                                                   sha256=config['metadata'].get('sha256'))
+    else:
+        print("[WARN] Config file doesn't have `metadata.link` field. Skip the flashing.")
+
+    pipeline = FleetPipeline(config, jigs, binary_path, flash_jobs=flash_jobs, can_jobs=can_jobs, force=force)
+    statuses = pipeline.run()
+    record_fleet(config, statuses, binary_path)
+    if not all(status.stage == Stage.DONE for status in statuses):
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('config', help="path to yaml file")
@@ -45,13 +116,34 @@ def main():
                                                                "slcan:/dev/ttyACM0, "
                                                                "socketcan:slcan0.")
     )
+    fleet_group = parser.add_mutually_exclusive_group()
+    fleet_group.add_argument('--jig', action='append', default=None, dest='jigs',
+                             help=("Fleet mode. A jig is a programmer serial number and a CAN interface of "
+                                   "one board: 066DFF555654725187174122,slcan:/dev/ttyACM0. "
+                                   "Repeat the option for each board"))
+    fleet_group.add_argument('--all-jigs', action='store_true',
+                             help="Fleet mode with all connected RaccoonLab programmers-sniffers")
+    parser.add_argument('--flash-jobs', type=int, default=None,
+                        help="Fleet mode: max number of concurrent uploads. Default: one per jig")
+    parser.add_argument('--can-jobs', type=int, default=None,
+                        help="Fleet mode: max number of concurrently configured boards. Default: one per jig")
+    parser.add_argument('--force', action='store_true',
+                        help="Write the whole binary even if the target already has it")
     args = parser.parse_args()
 
     with open(args.config, "r", encoding='UTF-8') as stream:
         config = yaml.safe_load(stream)
 
-        upload_firmware(config=config)
-        configure_parameters(config=config, can_transport=args.can_transport)
+    if args.jigs or args.all_jigs:
+        jigs = [Jig.from_string(jig) for jig in args.jigs] if args.jigs else get_all_jigs()
+        if len(jigs) == 0:
+            print("[ERROR] There are no jigs.")
+            sys.exit(1)
+        provision_fleet(config, jigs, args.flash_jobs, args.can_jobs, args.force)
+        return
+
+    upload_firmware(config=config, force=args.force)
+    configure_parameters(config=config, can_transport=args.can_transport)
 
 
 
@@ -3,8 +3,9 @@
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
 import dronecan
-from raccoonlab_tools.dronecan.utils import ParametersInterface, NodeFinder
+from raccoonlab_tools.dronecan.utils import ParametersInterface, NodeFinder, ServiceClient
 from raccoonlab_tools.common.device_manager import DeviceManager
+from raccoonlab_tools.common.inventory import Inventory
 
 def main():
     can_transport = DeviceManager.get_dronecan_can_iface()
@@ -15,6 +16,15 @@ def main():
     all_params = params_interface.get_all()
     for param in all_params:
         print(param)
+    print(f"Latency: {ServiceClient.get_latency(node, target_node_id, 'uavcan.protocol.param.GetSet')}")
+
+    inventory = Inventory.open_default()
+    node_info = None if inventory is None else NodeFinder(node).get_info(target_node_id)
+    if node_info is not None:
+        with inventory:
+            inventory.record_node_infos([node_info])
+            params = {param.name : param.value for param in all_params}
+            inventory.record_params(node_info.hardware_version.unique_id, params, source="rl-get-dronecan-params")
 
 if __name__ =="__main__":
     main()
@@ -4,6 +4,7 @@
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
 import argparse
+import functools
 import dronecan
 from dronecan import uavcan
 from enum import IntEnum
@@ -11,6 +12,8 @@ import time
 import numpy as np
 from itertools import cycle
 
+from raccoonlab_tools.dronecan.frame_cache import FrameCache
+
 
 class ParamPWMChannelId(IntEnum):
     UI_PWM = 0
@@ -41,14 +44,15 @@ class PWMActuatorCommander:
         self.node_status_msg = uavcan.equipment.actuator.Status()
         self.node.add_handler(uavcan.protocol.NodeStatus,
                                self._node_status_callback)
+        self.frame_cache = FrameCache(self.node)
 
         self.online_nodes = set()
 
     def spin(self):
         values = np.linspace(start=0, stop=2 * np.pi, num=100)
         print(values.shape)
-        values_iterator = cycle(values)
-        for value in values_iterator:
+        values_iterator = cycle(enumerate(values))
+        for value_idx, value in values_iterator:
             command_value = np.sin(value)
             command = np.ones(PWMActuatorCommander.NUMBER_OF_PWM) * command_value
 
@@ -56,31 +60,35 @@ class PWMActuatorCommander:
             for i in range(PWMActuatorCommander.NUMBER_OF_PWM):
                 expected_status_vals.append((command[i] + 1) * 50)
 
-            array_command = []
-            for i in range(PWMActuatorCommander.NUMBER_OF_PWM):
-                array_command.append(
-                    uavcan.equipment.actuator.Command(
-                        actuator_id=i, command_value=command[i]
-                    )
-                )
-            self.command = uavcan.equipment.actuator.ArrayCommand(
-                commands=array_command
-            )
-
             self.node.spin(0.1)
             if len(self.online_nodes) >= 1:
-                self.node.broadcast(self.command)
+                # The messages repeat every cycle, so they are created and serialized only once
+                self.frame_cache.broadcast(functools.partial(self._create_array_command, command),
+                                           key=("command", value_idx))
                 print("Pub ARRAYCommand")
                 for i in range(PWMActuatorCommander.NUMBER_OF_PWM):
-                    self.expected_status_msg = uavcan.equipment.actuator.Status(
-                        actuator_id=i,
-                        power_rating_pct=int(expected_status_vals[i])
-                    )
-                    self.node.broadcast(self.expected_status_msg)
+                    power_rating_pct = int(expected_status_vals[i])
+                    self.frame_cache.broadcast(functools.partial(uavcan.equipment.actuator.Status,
+                                                                 actuator_id=i,
+                                                                 power_rating_pct=power_rating_pct),
+                                               key=("status", i, power_rating_pct))
                     print(f"Pub Expected Status {i}")
             else:
                 print("There is no any online node yet...")
 
+    def _create_array_command(self, command):
+        array_command = []
+        for i in range(PWMActuatorCommander.NUMBER_OF_PWM):
+            array_command.append(
+                uavcan.equipment.actuator.Command(
+                    actuator_id=i, command_value=command[i]
+                )
+            )
+        self.command = uavcan.equipment.actuator.ArrayCommand(
+            commands=array_command
+        )
+        return self.command
+
     def _node_status_callback(self, msg):
         self.online_nodes.add(msg.transfer.source_node_id)
         print(f"Receive NodeStatus from node {msg.transfer.source_node_id}.")
@@ -112,33 +120,33 @@ class PWMEscCommander:
 
         self.node.add_handler(uavcan.protocol.NodeStatus,
                                self._node_status_callback)
+        self.frame_cache = FrameCache(self.node)
 
         self.online_nodes = set()
 
     def spin(self):
         values = np.linspace(start=0, stop=2 * np.pi, num=100)
-        values_iterator = cycle(values)
-        for value in values_iterator:
+        values_iterator = cycle(enumerate(values))
+        for value_idx, value in values_iterator:
             command_value = np.sin(value)
             command = np.ones(PWMEscCommander.NUMBER_OF_PWM) * command_value
             expected_status_vals = np.zeros(PWMEscCommander.NUMBER_OF_PWM)
-            self.command = uavcan.equipment.esc.RawCommand(
-                cmd=[int((val + 1) * PWMEscCommander.MAX_VALUE / 2)
-                     for val in command]
-            )
+            cmd = [int((val + 1) * PWMEscCommander.MAX_VALUE / 2) for val in command]
             for i in range(PWMEscCommander.NUMBER_OF_PWM):
                 expected_status_vals[i] = 50 * (command[i] + 1)
 
             self.node.spin(0.5)
             if len(self.online_nodes) >= 1:
-                self.node.broadcast(self.command)
+                # The messages repeat every cycle, so they are created and serialized only once
+                self.frame_cache.broadcast(functools.partial(uavcan.equipment.esc.RawCommand, cmd=cmd),
+                                           key=("command", value_idx))
                 print("Pub RAWCommand")
                 for i in range(PWMEscCommander.NUMBER_OF_PWM):
-                    self.expected_status_msg = uavcan.equipment.esc.Status(
-                        esc_index=i,
-                        power_rating_pct=int(expected_status_vals[i])
-                    )
-                    self.node.broadcast(self.expected_status_msg)
+                    power_rating_pct = int(expected_status_vals[i])
+                    self.frame_cache.broadcast(functools.partial(uavcan.equipment.esc.Status,
+                                                                 esc_index=i,
+                                                                 power_rating_pct=power_rating_pct),
+                                               key=("status", i, power_rating_pct))
                     print(f"Pub Expected Status {i}")
             else:
                 print("There is no any online node yet...")
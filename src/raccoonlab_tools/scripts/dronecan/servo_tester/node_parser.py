@@ -4,15 +4,26 @@
 # Author: Oleg Ostapovich
 """
 Script used to listen nodes connected to CAN interface using NodeStatus protocol,
-summarising it and storing data to csv
+summarising it and storing data to csv.
+With --capture the NodeStatus messages are taken from a recorded capture instead of the bus.
 """
 from argparse import ArgumentParser
 
+import os
+import sys
 import datetime
+import tempfile
 import time
 import pandas as pd
 import dronecan
 from dronecan import uavcan
+from raccoonlab_tools.common.binary_capture import CaptureFile, is_binary_capture
+from raccoonlab_tools.common.capture import read_capture, write_capture
+from raccoonlab_tools.common.capture_decoder import read_stream_records
+from raccoonlab_tools.common.protocol_parser import Protocol
+from raccoonlab_tools.dronecan.capture_decoder import DronecanStreamDecoder
+
+NODE_STATUS_DTID = 341
 
 # get command line arguments
 parser = ArgumentParser(description='dump Node Status messages')
@@ -23,8 +34,54 @@ parser.add_argument("--logtime", default=3600, type=int,
                     help="Logging duration in seconds"
                          " 3600 means the script will collect"
                          " and summarise messages for one hour")
+parser.add_argument("--capture", default=None, type=str,
+                    help="Summarise a recorded capture (*.rlcap, candump or ASC) instead of the bus")
 args = parser.parse_args()
 
+
+def read_node_statuses(path):
+    """
+    Decode only the NodeStatus frames of a capture: the other streams are skipped chunk by chunk
+    in the memory-mapped file, so a long recording is not loaded into RAM.
+    A text capture is converted to a temporary binary one first.
+    """
+    if not is_binary_capture(path):
+        with tempfile.TemporaryDirectory() as directory:
+            binary_path = os.path.join(directory, "capture.rlcap")
+            write_capture(binary_path, read_capture(path), canfd=True)
+            return read_node_statuses(binary_path)
+
+    # The stream key of a DroneCAN message is the data type ID and the source node ID
+    keys = [(NODE_STATUS_DTID << 8) | node_id for node_id in range(1, 128)]
+    records = read_stream_records(CaptureFile(path), Protocol.DRONECAN, keys)
+    return DronecanStreamDecoder().decode(records).tables.get("uavcan.protocol.NodeStatus")
+
+
+def summarise_capture(path, outfile):
+    """
+    Append the last NodeStatus of each node in the capture to the csv.
+    """
+    table = read_node_statuses(path)
+    if table is None:
+        print(f"There are no NodeStatus messages in {path}")
+        return
+    last_rows = {}
+    for row in zip(table.columns["timestamp"], table.columns["source_node_id"],
+                   table.columns["uptime_sec"], table.columns["health"]):
+        last_rows[row[1]] = row
+    for timestamp, node_id, uptime_sec, health in last_rows.values():
+        date = datetime.datetime.fromtimestamp(timestamp) + datetime.timedelta(hours=2)
+        pd.DataFrame(data=[[date.strftime("%d/%m/%Y %H:%M:%S"),
+                            node_id,
+                            datetime.timedelta(seconds=int(uptime_sec)),
+                            health]]).to_csv(outfile, header=False, index=False, mode='a')
+    print(f"{len(last_rows)} nodes have been summarised into {outfile}")
+
+
+if args.capture is not None:
+    summarise_capture(args.capture, args.outfile)
+    sys.exit(0)
+
 # Initializing a DroneCAN node instance.
 node = dronecan.make_node(args.port, bitrate=1000000)
 
@@ -22,10 +22,11 @@ def main():
 
     with open(args.config, "r", encoding='UTF-8') as stream:
         params = yaml.safe_load(stream)['params']
-        for name in params:
-            desired_param = Parameter(name=name, value=params[name])
-            param_after_change = params_interface.set(desired_param)
-            print(param_after_change)
+        update = params_interface.apply([Parameter(name=name, value=value) for name, value in params.items()])
+        print(update)
+        if not update.changed:
+            print("Nothing has been changed. Skip store and reboot.")
+            return
 
         print(commander.store_persistent_states())
         print(commander.restart())
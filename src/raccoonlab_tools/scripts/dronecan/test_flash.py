@@ -3,16 +3,15 @@
 # Copyright (c) 2024 Anastasiia Stepanova.
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
-import os
 import string
 import sys
 import secrets
-import subprocess
 from typing import List
 import pytest
 import dronecan
 
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raccoonlab_tools.dronecan.utils import (
     Parameter,
@@ -133,7 +132,7 @@ class TestGetSetVsRestart:
         node.commander.store_persistent_states()
         node.node.node.spin(1)
 
-        node.commander.restart()
+        assert node.commander.restart_and_wait() is not None, "The node has not restarted"
         res = node.recv_parameter_value(param.name)
         hint = (
             f"{TestGetSetVsRestart.__doc__}. "
@@ -166,7 +165,7 @@ class TestGetSetVsRestart:
             res_before_restart = node.recv_parameter_value(param.name)
             if res_before_restart == value:
                 value_set_before_restart += 1
-            node.commander.restart()
+            assert node.commander.restart_and_wait() is not None, "The node has not restarted"
             res = node.recv_parameter_value(param.name)
             if res == value:
                 new_value_stated += 1
@@ -194,8 +193,7 @@ class TestGetSetVsRestart:
         param = secrets.choice(node.str_params)
         value = node.set_random_str_param(param.name)
         node.commander.store_persistent_states()
-        node.commander.restart()
-        node.node.node.spin(1)
+        assert node.commander.restart_and_wait() is not None, "The node has not restarted"
 
         res = str(node.recv_parameter_value(param.name)).replace("\x01", "")
         assert res == value
@@ -216,14 +214,14 @@ class TestGetSetVsRestart:
                 init_value = str(node.recv_parameter_value(param.name)).replace("\x01", "")
                 value = init_value
                 while value == init_value:
-                    value = str(node.recv_parameter_value(param.name)).replace("\x01", "")
+                    value = node.set_random_str_param(param.name)
 
                 node.commander.store_persistent_states()
 
                 res_before_restart = str(node.recv_parameter_value(param.name)).replace("\x01", "")
                 if res_before_restart == value:
                     value_set_before_restart += 1
-                node.commander.restart()
+                assert node.commander.restart_and_wait() is not None, "The node has not restarted"
                 res = str(node.recv_parameter_value(param.name)).replace("\x01", "")
                 if res == value:
                     new_value_stated += 1
@@ -247,14 +245,9 @@ class TestGetSetVsRestart:
 
 
 def main():
-    cmd = ["pytest", os.path.abspath(__file__)]
-    cmd += ["--tb=no"]  # No traceback at all
-    cmd += ["-v"]  # Increase verbosity
-    cmd += ["-W", "ignore::DeprecationWarning"]  # Ignore specific warnings
-    cmd += sys.argv[1:]  # Forward optional user flags
-    print(len(cmd))
-    print(cmd)
-    sys.exit(subprocess.call(cmd))
+    pytest_args = ['--tb=no']  # No traceback at all
+    pytest_args += sys.argv[1:]  # Forward optional user flags
+    sys.exit(run_tests([__file__], pytest_args))
 
 
 if __name__ == "__main__":
@@ -2,15 +2,14 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2023-2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-import os
 import sys
-import subprocess
 import pytest
 import dronecan
 import numpy as np
 
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests
 
 @pytest.mark.dependency()
 def test_transport():
@@ -72,9 +71,7 @@ class TestBarometer:
 
 
 def main():
-    cmd = ["pytest", os.path.abspath(__file__), "-v", '-W', 'ignore::DeprecationWarning']
-    cmd += sys.argv[1:]
-    sys.exit(subprocess.call(cmd))
+    sys.exit(run_tests([__file__], sys.argv[1:]))
 
 if __name__ == "__main__":
     main()
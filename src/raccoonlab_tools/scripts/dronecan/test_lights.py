@@ -2,15 +2,14 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-import os
 import sys
 import secrets
-import subprocess
 import pytest
 import dronecan
 from enum import IntEnum
 
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raccoonlab_tools.dronecan.utils import Parameter, ParametersInterface, NodeCommander
 
@@ -220,14 +219,9 @@ class TestUiLedsMode:
 
 
 def main():
-    cmd = ["pytest", os.path.abspath(__file__)]
-    cmd += ['--tb=no']  # No traceback at all
-    cmd += ['-v']  # Increase verbosity
-    cmd += ['-W', 'ignore::DeprecationWarning']  # Ignore specific warnings
-    cmd += sys.argv[1:] # Forward optional user flags
-    print(len(cmd))
-    print(cmd)
-    sys.exit(subprocess.call(cmd))
+    pytest_args = ['--tb=no']  # No traceback at all
+    pytest_args += sys.argv[1:]  # Forward optional user flags
+    sys.exit(run_tests([__file__], pytest_args))
 
 if __name__ == "__main__":
     main()
@@ -2,10 +2,8 @@
 # This software is distributed under the terms of the MIT License.
 # Copyright (c) 2024 Dmitry Ponomarev.
 # Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
-import os
 import sys
 import secrets
-import subprocess
 import pytest
 import dronecan
 import time
@@ -13,6 +11,7 @@ import random
 from enum import IntEnum
 
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.pytest_runner import run_tests
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raccoonlab_tools.dronecan.utils import (
     Parameter,
@@ -72,7 +71,7 @@ class PMUNode:
 
         params.set(config)
         commander.store_persistent_states()
-        commander.restart()
+        assert commander.restart_and_wait() is not None, "The node has not restarted"
 
     def check_beep_cmd_response(self, msg: dronecan.uavcan.equipment.indication.BeepCommand) -> bool:
         """"
@@ -126,7 +125,6 @@ def test_beeper_command_feedback():
     pmu = PMUNode()
     config = [Parameter(name=PARAM_BUZZER_VERBOSE, value=1)]
     pmu.configure(config)
-    time.sleep(5)
     recv_sound = pmu.recv_sound()
     assert recv_sound is not None
 
@@ -151,7 +149,6 @@ class TestGateOk:
     @staticmethod
     def configure_node():
         TestGateOk.pmu.configure(TestGateOk.config)
-        time.sleep(5)
 
     @staticmethod
     def test_healthy_node_sound_after_restart():
@@ -270,14 +267,9 @@ class TestGateOk:
 
 
 def main():
-    cmd = ["pytest", os.path.abspath(__file__)]
-    cmd += ["--tb=no"]  # No traceback at all
-    cmd += ["-v"]  # Increase verbosity
-    cmd += ["-W", "ignore::DeprecationWarning"]  # Ignore specific warnings
-    cmd += sys.argv[1:]  # Forward optional user flags
-    print(len(cmd))
-    print(cmd)
-    sys.exit(subprocess.call(cmd))
+    pytest_args = ['--tb=no']  # No traceback at all
+    pytest_args += sys.argv[1:]  # Forward optional user flags
+    sys.exit(run_tests([__file__], pytest_args))
 
 
 if __name__ == "__main__":
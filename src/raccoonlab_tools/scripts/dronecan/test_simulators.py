@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2025 Dmitry Ponomarev.
+# Author: Dmitry Ponomarev <ponomarevda96@gmail.com>
+"""
+Check the simulated DroneCAN nodes without any hardware, for example in CI.
+
+The spec-compliant node (rl_sim_dronecan_node.py) is started on the bus before the session,
+so the specification suite finds it and runs against it together with the parameter checks below.
+The ICE simulator is checked offline with simulate() and on the bus at 100x real time.
+
+Usage example:
+python test_simulators.py --transport mcast:0
+"""
+import sys
+import time
+import argparse
+import subprocess
+from typing import List
+
+import pytest
+import dronecan
+
+from raccoonlab_tools.common.pytest_runner import run_tests, get_suite_path
+from raccoonlab_tools.dronecan.global_node import DronecanNode
+from raccoonlab_tools.dronecan.node_table import NodeTable
+from raccoonlab_tools.dronecan.utils import Parameter, ParametersInterface, NodeCommander
+from raccoonlab_tools.rl_sim_dronecan_ice import Engine, simulate
+
+SIM_NODE_ID = 42
+SIM_ICE_NODE_ID = 40
+SIM_ICE_TIME_SCALE = 100.0
+STARTUP_TIMEOUT_SEC = 10.0
+ICE_TIMEOUT_SEC = 10.0
+KELVIN_OFFSET = 273.15
+
+def start_simulator(module : str, args : List[str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", f"raccoonlab_tools.{module}"] + args,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+def stop_simulator(process : subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=5.0)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def wait_for_node(node_id : int, timeout_sec : float = STARTUP_TIMEOUT_SEC) -> bool:
+    table = NodeTable.get(DronecanNode.node)
+    return table.wait(table.when(node_id, lambda entry: entry.mode == NodeCommander.MODE_OPERATIONAL), timeout_sec) is not None
+
+@pytest.fixture(scope="module")
+def params() -> ParametersInterface:
+    return ParametersInterface(target_node_id=SIM_NODE_ID)
+
+class TestSimNodeParams:
+    """
+    The parameter server of the simulated node, the same requests as rl-config sends.
+    """
+    @staticmethod
+    def test_get_all(params : ParametersInterface):
+        names = [param.name for param in params.get_all()]
+        assert "uavcan.node.id" in names
+        assert "pwm.frequency" in names
+
+    @staticmethod
+    def test_node_id(params : ParametersInterface):
+        assert params.get("uavcan.node.id").value == SIM_NODE_ID
+
+    @staticmethod
+    def test_unknown_parameter(params : ParametersInterface):
+        assert params.get("unknown.parameter").value is None
+
+    @staticmethod
+    def test_set(params : ParametersInterface):
+        assert params.set(Parameter(name="pwm.frequency", value=100)).value == 100
+
+    @staticmethod
+    def test_set_out_of_range(params : ParametersInterface):
+        assert params.set(Parameter(name="pwm.frequency", value=1000)).value == 400
+
+    @staticmethod
+    def test_apply_skips_unchanged(params : ParametersInterface):
+        params.set(Parameter(name="feedback.type", value=1))
+        update = params.apply([Parameter(name="feedback.type", value=1), Parameter(name="crct.bitmask", value=3)])
+        assert [param.name for param in update.changed] == ["crct.bitmask"]
+        assert [param.name for param in update.unchanged] == ["feedback.type"]
+
+    @staticmethod
+    def test_store_and_restart(params : ParametersInterface):
+        """A saved value survives the restart, an unsaved one is lost."""
+        commander = NodeCommander(target_node_id=SIM_NODE_ID)
+        params.set(Parameter(name="pwm.frequency", value=200))
+        assert commander.store_persistent_states() is True
+        params.set(Parameter(name="pwm.frequency", value=300))
+
+        assert commander.restart_and_wait() is not None
+        assert params.get("pwm.frequency").value == 200
+
+class TestSimIceModel:
+    """
+    The ICE models with the fixed timestep, faster than real time and without a CAN bus.
+    """
+    @staticmethod
+    def test_deterministic():
+        assert simulate(60.0, 100, seed=7) == simulate(60.0, 100, seed=7)
+
+    @staticmethod
+    def test_warm_up():
+        """With T2 = 30 sec the engine is hot after two minutes of full throttle."""
+        history = simulate(120.0, 100)
+        assert history[0][2] < Engine.COLD_TRESHOLD_CELCIUS
+        assert max(temperature for _, _, temperature in history) > Engine.HOT_TRESHOLD_CELCIUS
+
+    @staticmethod
+    def test_idle_stays_below_critical():
+        history = simulate(600.0, 10)
+        assert max(temperature for _, _, temperature in history) < Engine.CRITICAL_TRESHOLD_CELSIUS
+
+    @staticmethod
+    def test_overheat_failure():
+        """Above the critical temperature the engine fails and can't run for a while."""
+        history = simulate(600.0, 100)
+        overheat_times = [timestamp for timestamp, _, temperature in history
+                          if temperature >= Engine.CRITICAL_TRESHOLD_CELSIUS]
+        assert len(overheat_times) > 0
+
+        failure_rpms = [rpm for timestamp, rpm, _ in history
+                        if overheat_times[0] + 5.0 <= timestamp < overheat_times[0] + 10.0]
+        assert max(failure_rpms) < Engine.ICE_IDLE_RPM
+
+@pytest.fixture(scope="module")
+def ice_statuses() -> List[dronecan.uavcan.equipment.ice.reciprocating.Status]:
+    """
+    Run the ICE simulator on the bus at full throttle for ICE_TIMEOUT_SEC of real time.
+    The gas throttle timeout is kept in real time, so the command is sent periodically.
+    """
+    process = start_simulator("rl_sim_dronecan_ice", ["--port", DronecanNode.transport,
+                                                      "--node-id", str(SIM_ICE_NODE_ID),
+                                                      "--time-scale", str(SIM_ICE_TIME_SCALE),
+                                                      "--seed", "0"])
+    node = DronecanNode.node
+    statuses = []
+    def callback(event) -> None:
+        if event.transfer.source_node_id == SIM_ICE_NODE_ID:
+            statuses.append(event.message)
+    handler = node.add_handler(dronecan.uavcan.equipment.ice.reciprocating.Status, callback)
+
+    try:
+        command = dronecan.uavcan.equipment.esc.RawCommand(cmd=[0] * 7 + [8191])
+        end_time = time.monotonic() + ICE_TIMEOUT_SEC
+        while time.monotonic() < end_time:
+            node.broadcast(command)
+            node.spin(0.1)
+    finally:
+        handler.remove()
+        stop_simulator(process)
+    return statuses
+
+class TestSimIceNode:
+    """
+    The ICE simulator with the simulated clock: thermal runs take seconds instead of minutes.
+    """
+    @staticmethod
+    def test_status_rate(ice_statuses):
+        """The status is published every simulated timestep, so much faster than in real time."""
+        assert len(ice_statuses) > ICE_TIMEOUT_SEC / Engine.TIME_STEP_SEC * 10
+
+    @staticmethod
+    def test_engine_running(ice_statuses):
+        assert max(msg.engine_speed_rpm for msg in ice_statuses) > Engine.ICE_IDLE_RPM
+
+    @staticmethod
+    def test_engine_hot(ice_statuses):
+        temperatures = [msg.oil_temperature - KELVIN_OFFSET for msg in ice_statuses]
+        assert max(temperatures) > Engine.HOT_TRESHOLD_CELCIUS
+
+def main():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--transport', default='mcast:0',
+                        help='DroneCAN transport of the simulated nodes. Examples: mcast:0, vcan0')
+    args, pytest_args = parser.parse_known_args()
+
+    # The tests run in this process, so they share the node created here
+    DronecanNode(transport=args.transport)
+    process = start_simulator("rl_sim_dronecan_node", ["--port", args.transport, "--node-id", str(SIM_NODE_ID)])
+    try:
+        if not wait_for_node(SIM_NODE_ID):
+            print(f"[ERROR] The simulated node {SIM_NODE_ID} has not appeared on {args.transport}")
+            sys.exit(1)
+        exit_code = run_tests([get_suite_path("dronecan-specification"), __file__], pytest_args)
+    finally:
+        stop_simulator(process)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -5,69 +5,132 @@
 
 import os
 import sys
-import subprocess
-import dronecan
+import argparse
+import functools
+from typing import Dict, List, Optional, Tuple
 import pytest
 
+from raccoonlab_tools.common.capture import read_capture
+from raccoonlab_tools.common.capture_checker import get_capture_path, add_capture_arguments, check_captures
+from raccoonlab_tools.common.pytest_runner import run_tests, InventoryPlugin
+from raccoonlab_tools.common.inventory import Inventory
+from raccoonlab_tools.dronecan.spec_evidence import SpecEvidence, EvidenceCollector, CaptureEvidenceCollector
 from raccoonlab_tools.dronecan.global_node import DronecanNode
+from raccoonlab_tools.dronecan.utils import NodeFinder
 
 HEALTH_OK = 0
 MODE_OPERATIONAL = 0
 VSSC_RACCOONLAB_RELEASE = 2
 
+@functools.lru_cache(maxsize=None)
+def _load_capture(capture : str) -> Dict[int, SpecEvidence]:
+    evidences = CaptureEvidenceCollector().collect(read_capture(capture))
+    return {node_id : evidence for node_id, evidence in evidences.items()
+            if node_id not in NodeFinder.black_list}
+
+@functools.lru_cache(maxsize=None)
+def _discover_node_ids(capture : Optional[str]) -> Tuple[int, ...]:
+    """The tests are parametrized by node ID, so the nodes are discovered during the collection."""
+    if capture is not None:
+        return tuple(sorted(_load_capture(capture)))
+    return tuple(NodeFinder().find_online_nodes())
+
+def pytest_generate_tests(metafunc):
+    """Run every per-node check for every node found on the bus or in the capture."""
+    if "node_id" in metafunc.fixturenames:
+        node_ids = list(_discover_node_ids(get_capture_path()))
+        if len(node_ids) == 0:
+            node_ids = [None]  # Let the evidence fixture report it
+        metafunc.parametrize("node_id", node_ids, ids=[f"node{node_id}" for node_id in node_ids])
+
+@pytest.fixture(scope="session")
+def evidences() -> Dict[int, SpecEvidence]:
+    """
+    Collect NodeStatus of all nodes once and reuse it for all tests.
+    A single handler is used for all nodes, so the collection time doesn't depend on their number.
+    If a capture is provided, the evidence is reconstructed from it instead of live nodes.
+    """
+    capture = get_capture_path()
+    if capture is not None:
+        return _load_capture(capture)
+
+    return EvidenceCollector().collect_many(_discover_node_ids(None))
+
+@pytest.fixture
+def evidence(node_id : Optional[int], evidences : Dict[int, SpecEvidence]) -> SpecEvidence:
+    capture = get_capture_path()
+    assert node_id is not None, "There is no online DroneCAN node" if capture is None else \
+                                f"There is no DroneCAN node in {capture}"
+    return evidences[node_id]
+
 class TestNodeStatus:
     """
     All nodes are required to publish NodeStatus periodically.
     """
     @staticmethod
-    def test_health():
-        node = DronecanNode()
-        msg = node.sub_once(dronecan.uavcan.protocol.NodeStatus)  # pylint: disable=no-member
-        assert msg.message.health == HEALTH_OK
+    def test_health(evidence : SpecEvidence):
+        msg = TestNodeStatus._last_node_status(evidence)
+        assert msg.health == HEALTH_OK
 
     @staticmethod
-    def test_mode():
-        node = DronecanNode()
-        msg = node.sub_once(dronecan.uavcan.protocol.NodeStatus)  # pylint: disable=no-member
-        assert msg.message.mode == MODE_OPERATIONAL
+    def test_mode(evidence : SpecEvidence):
+        msg = TestNodeStatus._last_node_status(evidence)
+        assert msg.mode == MODE_OPERATIONAL
 
     @staticmethod
-    def test_vssc():
+    def test_vssc(evidence : SpecEvidence):
         """
         RaccoonLab specific test: 1 means Debug, 2 means Release.
         """
-        node = DronecanNode()
-        msg = node.sub_once(dronecan.uavcan.protocol.NodeStatus)  # pylint: disable=no-member
-        assert msg.message.vendor_specific_status_code == VSSC_RACCOONLAB_RELEASE
+        msg = TestNodeStatus._last_node_status(evidence)
+        assert msg.vendor_specific_status_code == VSSC_RACCOONLAB_RELEASE
 
     @staticmethod
-    def test_publishing_period():
+    def test_publishing_period(evidence : SpecEvidence):
         """
         NodeStatus publishing period should be exactly 500 ms.
-        1. Wait for 5 NodeStatus.
+        1. Take the last 5 NodeStatus.
         2. Peiod check: All 4 periods must be 0.5 +- 0.05 seconds
         3. Watchdog check: The last uptime must be 2 or 3 seconds after the first one
         """
-        node = DronecanNode()
-
-        msgs = []
-        timestamps = []
-        for _ in range(5):
-            msg = node.sub_once(dronecan.uavcan.protocol.NodeStatus)  # pylint: disable=no-member
-            msgs.append(msg)
-            timestamps.append(msg.timestamp)
+        assert len(evidence.node_statuses) >= 5
+        msgs = evidence.node_statuses[-5:]
+        timestamps = evidence.node_status_timestamps[-5:]
 
         periods = [timestamps[i+1] - timestamps[i] for i in range(len(timestamps) - 1)]
         for number in periods:
             assert pytest.approx(0.5, abs=0.05) == number
 
-        uptame_elapsed = msgs[-1].message.uptime_sec - msgs[0].message.uptime_sec
+        uptame_elapsed = msgs[-1].uptime_sec - msgs[0].uptime_sec
         assert uptame_elapsed in [2, 3]
 
+    @staticmethod
+    def _last_node_status(evidence : SpecEvidence):
+        assert len(evidence.node_statuses) > 0, "NodeStatus has not been received"
+        return evidence.node_statuses[-1]
+
 def main():
-    cmd = ["pytest", os.path.abspath(__file__), "-v", '-W', 'ignore::DeprecationWarning']
-    cmd += sys.argv[1:]
-    sys.exit(subprocess.call(cmd))
+    parser = argparse.ArgumentParser(add_help=False)
+    add_capture_arguments(parser)
+    parser.add_argument('--transport', default=None,
+                        help='DroneCAN transport. Auto detect by default. Examples: slcan:/dev/ttyACM0, vcan0, mcast:0')
+    args, pytest_args = parser.parse_known_args()
+
+    if args.capture is not None:
+        sys.exit(check_captures(os.path.abspath(__file__), args.capture, args.jobs, pytest_args))
+
+    # The tests run in this process, so they share the node created here
+    DronecanNode(transport=args.transport)
+    sys.exit(run_tests([__file__], pytest_args, plugins=get_inventory_plugins()))
+
+def get_inventory_plugins() -> list:
+    inventory = Inventory.open_default()
+    if inventory is None:
+        return []
+    def get_uids(node_ids : List[int]) -> Dict[int, str]:
+        node_infos = NodeFinder().get_infos(node_ids)
+        return {node_id : info.hardware_version.unique_id for node_id, info in node_infos.items()}
+    return [InventoryPlugin(inventory, get_uids)]
 
 if __name__ == "__main__":
     main()
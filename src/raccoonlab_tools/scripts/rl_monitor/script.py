@@ -9,12 +9,16 @@ import asyncio
 import logging
 import numpy as np
 import pycyphal.application
+from pycyphal.transport import Capture
+from pycyphal.transport.can import CANCapture
+from pycyphal.transport.can.media import FrameFormat
 
 # pylint: disable=import-error
 import uavcan.node.Heartbeat_1_0
 
 from raccoonlab_tools.common.colorizer import Colorizer, Colors
 from raccoonlab_tools.common.protocol_parser import CanProtocolParser, Protocol
+from raccoonlab_tools.common.transfer_id_analyzer import TransferIdAnalyzer
 from raccoonlab_tools.cyphal.utils import NodeFinder
 from raccoonlab_tools.cyphal.service.actuator import Actuator
 from raccoonlab_tools.cyphal.service.crct import CircuitStatus
@@ -121,6 +125,7 @@ class RLConfigurator:
     def __init__(self) -> None:
         self.node_id = None
         self.heartbeat = uavcan.node.Heartbeat_1_0()
+        self.transfer_id_analyzer = TransferIdAnalyzer(Protocol.CYPHAL)
 
     async def main(self):
         self.node = pycyphal.application.make_node(uavcan.node.GetInfo_1_0.Response(
@@ -128,6 +133,7 @@ class RLConfigurator:
                 name="co.raccoonlab.spec_checker"
         ))
         self.node.heartbeat_publisher.mode = uavcan.node.Mode_1_0.OPERATIONAL
+        self.node.presentation.transport.begin_capture(self._capture_callback)
         self.node.start()
 
         heartbeat_sub = self.node.make_subscriber(uavcan.node.Heartbeat_1_0)
@@ -138,17 +144,26 @@ class RLConfigurator:
         await asyncio.sleep(0.1)
         while True:
             os.system('clear')
-            print("RaccoonLab monitor")
-            info.print_info(node_monitor.get_latest_sw_version())
+            await self.render(info, node_monitor)
+            await asyncio.sleep(0.1)
 
-            print("Node status:")
-            print(f"- Health: {Colorizer.health_to_string(self.heartbeat.health.value)}")
-            print(f"- Mode: {Colorizer.mode_to_string(self.heartbeat.mode.value)}")
-            print(f"- VSSC: {node_monitor.get_vssc_meaning(self.heartbeat.vendor_specific_status_code)}")
-            print(f"- Uptime: {self.heartbeat.uptime}")
+    async def render(self, info, node_monitor : BaseMonitor) -> None:
+        """Print a single frame of the monitor."""
+        print("RaccoonLab monitor")
+        info.print_info(node_monitor.get_latest_sw_version())
 
-            await node_monitor.process()
-            await asyncio.sleep(0.1)
+        print("Node status:")
+        print(f"- Health: {Colorizer.health_to_string(self.heartbeat.health.value)}")
+        print(f"- Mode: {Colorizer.mode_to_string(self.heartbeat.mode.value)}")
+        print(f"- VSSC: {node_monitor.get_vssc_meaning(self.heartbeat.vendor_specific_status_code)}")
+        print(f"- Uptime: {self.heartbeat.uptime}")
+
+        print("Transfer loss:")
+        for stats in self.transfer_id_analyzer.get_stats(self.node_id):
+            line = f"- {stats.key.kind} {stats.key.port_id}: {stats.format_counters()}"
+            print(Colorizer.warning(line) if stats.lost or stats.broken or stats.out_of_order else line)
+
+        await node_monitor.process()
 
     async def _find_node(self) -> tuple:
         # 1. Define node ID
@@ -175,6 +190,14 @@ class RLConfigurator:
         await node.init()
         return info, node
 
+    def _capture_callback(self, capture : Capture) -> None:
+        """It may be called from the transport thread, the analyzer is thread-safe."""
+        capture = getattr(capture, "inferior", capture)  # RedundantCapture
+        if isinstance(capture, CANCapture) and not capture.own and capture.frame.format == FrameFormat.EXTENDED:
+            self.transfer_id_analyzer.on_frame(float(capture.timestamp.monotonic),
+                                               capture.frame.identifier,
+                                               bytes(capture.frame.data))
+
     async def _heartbeat_callback(self, data, transfer_from):
         if self.node_id == transfer_from.source_node_id:
             self.heartbeat = data